@@ -1,16 +1,34 @@
-from functools import partial
+from contextvars import ContextVar
 
 from django.db.models import signals
 from django.utils.decorators import decorator_from_middleware
 from django.utils.deprecation import MiddlewareMixin
 from . import registration
 
+# marker for "no request which updates the current user fields"
+_NOT_RECORDING = object()
+_current_user = ContextVar('current_user', default=_NOT_RECORDING)
+
+
+def update_users(sender, instance, **kwargs):
+    user = _current_user.get()
+    if user is _NOT_RECORDING:
+        return
+    registry = registration.FieldRegistry()
+    if sender in registry:
+        for field in registry.get_fields(sender):
+            setattr(instance, field.name, user)
+
+
+# one receiver for all requests, the user is taken from the context of the current thread or task
+signals.pre_save.connect(update_users, dispatch_uid='current_user.update_users')
+
 
 class CurrentUserMiddleware(MiddlewareMixin):
     def process_request(self, request):
         if request.method in ('GET', 'HEAD', 'OPTIONS', 'TRACE'):
             # This request shouldn't update anything,
-            # so no signal handler should be attached.
+            # so no user is recorded.
             return
 
         if hasattr(request, 'user') and request.user.is_authenticated:
@@ -18,17 +36,17 @@ class CurrentUserMiddleware(MiddlewareMixin):
         else:
             user = None
 
-        update_users = partial(self.update_users, user)
-        signals.pre_save.connect(update_users, dispatch_uid=request, weak=False)
-
-    def update_users(self, user, sender, instance, **kwargs):
-        registry = registration.FieldRegistry()
-        if sender in registry:
-            for field in registry.get_fields(sender):
-                setattr(instance, field.name, user)
+        request._current_user_token = _current_user.set(user)
 
     def process_response(self, request, response):
-        signals.pre_save.disconnect(dispatch_uid=request)
+        token = getattr(request, '_current_user_token', None)
+        if token is not None:
+            del request._current_user_token
+            try:
+                _current_user.reset(token)
+            except ValueError:
+                # the response is processed in another context
+                _current_user.set(_NOT_RECORDING)
         return response
 
 
@@ -0,0 +1,110 @@
+import logging
+import threading
+from time import perf_counter
+from types import SimpleNamespace
+
+from django.contrib.auth.models import AnonymousUser
+from django.http import HttpResponse
+from django.test import SimpleTestCase, RequestFactory, tag
+from .middleware import CurrentUserMiddleware, update_users
+from .registration import FieldRegistry
+
+logger = logging.getLogger(__name__)
+
+
+class Model:
+    pass
+
+
+class CurrentUserTest(SimpleTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        FieldRegistry().add_field(Model, SimpleNamespace(name='last_modified_by_user'))
+
+    @classmethod
+    def tearDownClass(cls):
+        del FieldRegistry._registry[Model]
+        super().tearDownClass()
+
+    def save(self):
+        instance = Model()
+        instance.last_modified_by_user = 'unchanged'
+        update_users(Model, instance)
+        return instance.last_modified_by_user
+
+    def process_request(self, user, method='post'):
+        request = getattr(RequestFactory(), method)('/')
+        request.user = user
+        middleware = CurrentUserMiddleware(lambda r: HttpResponse())
+        middleware.process_request(request)
+        return middleware, request
+
+    def test_current_user(self):
+        user = SimpleNamespace(is_authenticated=True)
+        middleware, request = self.process_request(user)
+        self.assertIs(self.save(), user)
+        middleware.process_response(request, HttpResponse())
+        # no user is recorded outside of a request
+        self.assertEqual(self.save(), 'unchanged')
+
+        # read only requests record no user
+        middleware, request = self.process_request(user, method='get')
+        self.assertEqual(self.save(), 'unchanged')
+        middleware.process_response(request, HttpResponse())
+
+        middleware, request = self.process_request(AnonymousUser())
+        self.assertIsNone(self.save())
+        middleware.process_response(request, HttpResponse())
+
+    def test_concurrent_requests(self):
+        users = [SimpleNamespace(is_authenticated=True) for i in range(4)]
+        barrier = threading.Barrier(len(users))
+        errors = []
+
+        def request_thread(user):
+            middleware, request = self.process_request(user)
+            # all requests are active at the same time
+            barrier.wait()
+            for i in range(25):
+                saved_user = self.save()
+                if saved_user is not user:
+                    errors.append((user, saved_user))
+            barrier.wait()
+            middleware.process_response(request, HttpResponse())
+            if self.save() != 'unchanged':
+                errors.append((user, 'recorded after the response'))
+
+        threads = [threading.Thread(target=request_thread, args=(user,)) for user in users]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        # every thread records its own user
+        self.assertEqual(errors, [])
+
+    @tag('benchmark')
+    def test_benchmark(self):
+        # requests with a few saves from several threads, before the change every request connected and
+        # disconnected a pre_save receiver
+        num_threads = 4
+        num_requests = 500
+        user = SimpleNamespace(is_authenticated=True)
+        barrier = threading.Barrier(num_threads)
+
+        def request_thread():
+            barrier.wait()
+            for i in range(num_requests):
+                middleware, request = self.process_request(user)
+                for j in range(5):
+                    self.save()
+                middleware.process_response(request, HttpResponse())
+
+        threads = [threading.Thread(target=request_thread) for i in range(num_threads)]
+        start = perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        duration = perf_counter() - start
+        logger.info("%d requests with 5 saves in %.3f s", num_threads * num_requests, duration)
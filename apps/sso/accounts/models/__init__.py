@@ -1,4 +1,4 @@
 from .user_data import OneTimeMessage, OrganisationChange, UserAddress, UserPhoneNumber, UserAttribute
 from .application import Application, ApplicationAdmin, ApplicationRole, Role, RoleProfile, RoleProfileAdmin, UserAssociatedSystem, \
-    get_applicationrole_ids, UserNote
+    get_applicationrole_ids, get_effective_roles, invalidate_effective_roles, UserNote
 from .user import User, UserEmail, UserManager, generate_filename
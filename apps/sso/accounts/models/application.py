@@ -1,17 +1,23 @@
 import logging
 import uuid
+from collections import defaultdict
 from itertools import chain
 
 from django.conf import settings
-from django.contrib.auth.models import Group
+from django.contrib.auth.models import Group, Permission
+from django.core.cache import cache
 from django.core.validators import validate_slug
-from django.db import models
+from django.db import models, transaction
 from django.utils.safestring import mark_safe
 from django.utils.translation import gettext_lazy as _
+from sso.emails.models import GroupEmailManager
 from sso.models import AbstractBaseModel, AbstractBaseModelManager
 
 logger = logging.getLogger(__name__)
 
+_CACHE_KEY_EFFECTIVE_ROLES = "effective_roles.{0}"
+_CACHE_KEY_EFFECTIVE_ROLES_VERSION = "effective_roles_version"
+
 
 def get_applicationrole_ids(user_id, filter=None):
     approles1 = ApplicationRole.objects.filter(user__id=user_id).only("id").values_list('id', flat=True)
@@ -23,6 +29,78 @@ def get_applicationrole_ids(user_id, filter=None):
     return list(set(chain(approles1, approles2)))
 
 
+def _get_effective_roles(user_id):
+    fields = ('id', 'application__uuid', 'role__name', 'role__order')
+    approles1 = ApplicationRole.objects.filter(user__id=user_id).values_list(*fields).order_by()
+    approles2 = ApplicationRole.objects.filter(roleprofile__user__id=user_id).values_list(*fields).order_by()
+
+    applicationrole_ids = set()
+    sso_applicationrole_ids = set()
+    roles = defaultdict(list)
+    # union removes the duplicates, sort like the Role model
+    for applicationrole_id, app_uuid, role_name, role_order in sorted(approles1.union(approles2), key=lambda x: (x[3], x[2])):
+        applicationrole_ids.add(applicationrole_id)
+        roles[app_uuid.hex].append(role_name)
+        if app_uuid == settings.SSO_APP_UUID:
+            sso_applicationrole_ids.add(applicationrole_id)
+
+    # permissions from the groups of the sso application roles and from the user groups
+    q = models.Q(group__role__applicationrole__in=sso_applicationrole_ids) | models.Q(group__user__id=user_id)
+    permissions = Permission.objects.distinct().filter(q).values_list('content_type__app_label', 'codename').order_by()
+
+    user_permissions = Permission.objects.filter(user__id=user_id).values_list('content_type__app_label', 'codename').order_by()
+
+    return {
+        'applicationrole_ids': applicationrole_ids,
+        'roles': dict(roles),
+        'permissions': {"%s.%s" % (ct, name) for ct, name in permissions},
+        'user_permissions': {"%s.%s" % (ct, name) for ct, name in user_permissions},
+        'is_application_admin': ApplicationAdmin.objects.filter(admin__id=user_id).exists(),
+        'is_role_profile_admin': RoleProfileAdmin.objects.filter(admin__id=user_id).exists(),
+        'is_groupemail_manager': GroupEmailManager.objects.filter(manager__id=user_id).exists(),
+    }
+
+
+def get_effective_roles(user_id):
+    """
+    returns the application roles the user has directly or through his role profiles
+    and the permission snapshot of the user as a dictionary with
+    'applicationrole_ids': set of ApplicationRole ids,
+    'roles': role names by application uuid hex,
+    'permissions': set of "app_label.codename" of the user groups and the groups associated with the SSO roles
+    'user_permissions': set of "app_label.codename" of the user permissions
+    'is_application_admin', 'is_role_profile_admin', 'is_groupemail_manager': admin scope flags
+    The result is cached until invalidate_effective_roles is called (see sso.accounts.signals).
+    """
+    cache_key = _CACHE_KEY_EFFECTIVE_ROLES.format(user_id)
+    values = cache.get_many([cache_key, _CACHE_KEY_EFFECTIVE_ROLES_VERSION])
+    version = values.get(_CACHE_KEY_EFFECTIVE_ROLES_VERSION)
+    effective_roles = values.get(cache_key)
+    if effective_roles is None or effective_roles['version'] != version:
+        effective_roles = _get_effective_roles(user_id)
+        effective_roles['version'] = version
+        cache.set(cache_key, effective_roles, settings.SSO_EFFECTIVE_ROLES_CACHE_TIMEOUT)
+    return effective_roles
+
+
+def invalidate_effective_roles(user_ids=None):
+    """
+    invalidate the cached effective roles of the users or of all users if user_ids is None.
+    The invalidation is repeated after the commit, because a concurrent request can cache
+    the roles from before the commit in the meantime.
+    """
+    if user_ids is None:
+        def invalidate():
+            cache.set(_CACHE_KEY_EFFECTIVE_ROLES_VERSION, uuid.uuid4().hex, None)
+    else:
+        cache_keys = [_CACHE_KEY_EFFECTIVE_ROLES.format(user_id) for user_id in user_ids]
+
+        def invalidate():
+            cache.delete_many(cache_keys)
+    invalidate()
+    transaction.on_commit(invalidate)
+
+
 class ApplicationManager(models.Manager):
     def get_by_natural_key(self, uuid):
         return self.get(uuid=uuid)
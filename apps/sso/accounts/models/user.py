@@ -18,7 +18,8 @@ from django.utils.encoding import force_str
 from django.utils.translation import gettext_lazy as _
 from sso.access_requests.models import AccessRequest
 from sso.accounts.models import OrganisationChange
-from sso.accounts.models.application import ApplicationRole, RoleProfile, Application, Role, get_applicationrole_ids, ApplicationAdmin
+from sso.accounts.models.application import ApplicationRole, RoleProfile, Application, Role, get_applicationrole_ids, ApplicationAdmin, \
+    get_effective_roles
 from sso.accounts.models.user_data import UserEmail, Membership
 from sso.auth.utils import get_device_classes
 from sso.decorators import memoize
@@ -296,6 +297,11 @@ class User(AbstractBaseUser, PermissionsMixin):
         applicationrole_ids = self.get_applicationrole_ids()
         return Role.objects.distinct().filter(applicationrole__in=applicationrole_ids, applicationrole__application__uuid=app_uuid)
 
+    def get_role_names_by_app(self, app_uuid):
+        if not isinstance(app_uuid, uuid.UUID):
+            app_uuid = uuid.UUID(app_uuid)
+        return self.get_effective_roles()['roles'].get(app_uuid.hex, [])
+
     def get_group_and_role_permissions(self):
         """
         get all permissions the user has through his groups and roles
@@ -304,8 +310,14 @@ class User(AbstractBaseUser, PermissionsMixin):
         q = Q(group__role__applicationrole__in=applicationrole_ids, group__role__applicationrole__application__uuid=settings.SSO_APP_UUID) | Q(group__user=self)
         return Permission.objects.distinct().filter(q)
 
+    @memoize
+    def get_effective_roles(self):
+        return get_effective_roles(self.id)
+
     @memoize
     def get_applicationrole_ids(self, filter=None):
+        if filter is None:
+            return list(self.get_effective_roles()['applicationrole_ids'])
         return get_applicationrole_ids(self.id, filter)
 
     @memoize
@@ -707,7 +719,8 @@ class User(AbstractBaseUser, PermissionsMixin):
 
     @memoize
     def is_app_user_admin(self):
-        return self.applicationadmin_set.exists() or self.roleprofileadmin_set.exists()
+        effective_roles = self.get_effective_roles()
+        return effective_roles['is_application_admin'] or effective_roles['is_role_profile_admin']
 
     @property
     def is_global_app_admin(self):
@@ -715,7 +728,7 @@ class User(AbstractBaseUser, PermissionsMixin):
 
     @memoize
     def is_app_admin(self):
-        return self.applicationadmin_set.exists() and self.has_perms(["accounts.view_application"])
+        return self.get_effective_roles()['is_application_admin'] and self.has_perms(["accounts.view_application"])
 
     @property
     def is_global_organisation_admin(self):
@@ -813,7 +826,7 @@ class User(AbstractBaseUser, PermissionsMixin):
 
     @property
     def is_groupemail_admin(self):
-        if self.has_perm('emails.change_groupemail') or GroupEmailManager.objects.filter(manager=self).exists():
+        if self.has_perm('emails.change_groupemail') or self.get_effective_roles()['is_groupemail_manager']:
             return True
         else:
             return False
@@ -4,11 +4,14 @@ from ipware.ip import get_client_ip
 
 from django.conf import settings
 from django.contrib.auth import user_logged_in
-from django.db.models.signals import post_save
+from django.contrib.auth.models import Group, Permission
+from django.db.models.signals import post_save, post_delete, m2m_changed
 from django.dispatch.dispatcher import receiver
 from django.utils import timezone
 from django.utils.timezone import now
-from sso.accounts.models import User, UserEmail
+from sso.accounts.models import User, UserEmail, Application, ApplicationRole, Role, RoleProfile, \
+    ApplicationAdmin, RoleProfileAdmin, invalidate_effective_roles
+from sso.emails.models import GroupEmailManager
 from sso.organisations.models import is_validation_period_active_for_user
 from sso.signals import user_m2m_field_updated
 from sso.utils.loaddata import disable_for_loaddata
@@ -57,3 +60,55 @@ def sso_user_m2m_field_updated(sender, user, attribute_name, delete_pk_list, add
             user.valid_until = now() + datetime.timedelta(days=settings.SSO_VALIDATION_PERIOD_DAYS)
         elif not is_validation_period_active_for_user(user) and user.valid_until is not None:
             user.valid_until = None
+
+
+@receiver(m2m_changed, sender=User.application_roles.through)
+@receiver(m2m_changed, sender=User.role_profiles.through)
+@receiver(m2m_changed, sender=User.groups.through)
+@receiver(m2m_changed, sender=User.user_permissions.through)
+def invalidate_user_effective_roles(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        invalidate_effective_roles([instance.pk])
+    elif pk_set is None:
+        # reverse clear, the affected users are unknown
+        invalidate_effective_roles()
+    else:
+        invalidate_effective_roles(pk_set)
+
+
+@receiver(m2m_changed, sender=RoleProfile.application_roles.through)
+@receiver(m2m_changed, sender=Group.permissions.through)
+def invalidate_all_effective_roles_m2m(sender, action, **kwargs):
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        invalidate_effective_roles()
+
+
+@receiver(post_save, sender=Application)
+@receiver(post_save, sender=ApplicationRole)
+@receiver(post_save, sender=Role)
+@receiver(post_save, sender=RoleProfile)
+@receiver(post_delete, sender=Application)
+@receiver(post_delete, sender=ApplicationRole)
+@receiver(post_delete, sender=Role)
+@receiver(post_delete, sender=RoleProfile)
+@receiver(post_delete, sender=Group)
+@receiver(post_delete, sender=Permission)
+def invalidate_all_effective_roles(sender, **kwargs):
+    # for Group and Permission, the deletion of the m2m rows sends no m2m_changed
+    invalidate_effective_roles()
+
+
+@receiver(post_save, sender=ApplicationAdmin)
+@receiver(post_save, sender=RoleProfileAdmin)
+@receiver(post_delete, sender=ApplicationAdmin)
+@receiver(post_delete, sender=RoleProfileAdmin)
+def invalidate_admin_effective_roles(sender, instance, **kwargs):
+    invalidate_effective_roles([instance.admin_id])
+
+
+@receiver(post_save, sender=GroupEmailManager)
+@receiver(post_delete, sender=GroupEmailManager)
+def invalidate_manager_effective_roles(sender, instance, **kwargs):
+    invalidate_effective_roles([instance.manager_id])
@@ -1,13 +1,20 @@
+from django.contrib.auth.models import Group
+from django.core.cache import cache
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
-from django.test import TestCase
+from sso.accounts.models import User, ApplicationRole, get_applicationrole_ids, get_effective_roles
+from sso.accounts.models.application import _CACHE_KEY_EFFECTIVE_ROLES
 from sso.organisations.models import OrganisationCountry
 from sso.test.client import SSOClient
+from sso.test.testcases import SSOTestCase
 
 
-class AccountsTest(TestCase):
+class AccountsTest(SSOTestCase):
     fixtures = ['roles.json', 'test_l10n_data.json', 'app_roles.json', 'test_organisation_data.json', 'test_app_roles.json', 'test_user_data.json']
 
     def setUp(self):
+        super().setUp()
         self.client = SSOClient()
 
     def tearDown(self):
@@ -34,3 +41,80 @@ class AccountsTest(TestCase):
 
         response = self.client.get(reverse('accounts:app_admin_update_user', kwargs={'uuid': 'a8992f0348634f76b0dac2de4e4c83ee'}))
         self.assertEqual(response.status_code, 200)
+
+    def test_sidebar(self):
+        def get_active_items(menu):
+            return [item['title'] for item in menu if item.get('active')] + \
+                [sub_item['title'] for item in menu for sub_item in item.get('submenu', []) if sub_item.get('active')]
+
+        self.client.login(username='GlobalAdmin', password='gsf')
+        response = self.client.get(reverse('accounts:user_list'))
+        self.assertEqual(get_active_items(response.context['sidebar']), ['Accounts', 'Users'])
+
+        # the active items of the previous request are not kept in the shared menu
+        response = self.client.get(reverse('accounts:profile'))
+        self.assertEqual(get_active_items(response.context['sidebar']), ['Personal Data', 'My Account'])
+
+    def test_user_list_filters_cache(self):
+        self.client.login(username='GlobalAdmin', password='gsf')
+        cache.clear()
+        with CaptureQueriesContext(connection) as first_queries:
+            response = self.client.get(reverse('accounts:user_list'))
+        filters_cache_key = response.context['filters_cache_key']
+
+        with CaptureQueriesContext(connection) as second_queries:
+            response = self.client.get(reverse('accounts:user_list'))
+        self.assertEqual(response.context['filters_cache_key'], filters_cache_key)
+        # the filters are not built for a fragment cache hit
+        self.assertLess(len(second_queries), len(first_queries))
+        cache.clear()
+
+    def test_effective_roles(self):
+        user = User.objects.get(username='ApplicationAdmin')
+        effective_roles = get_effective_roles(user.id)
+        self.assertEqual(effective_roles['applicationrole_ids'], set(get_applicationrole_ids(user.id)))
+        for application_role in ApplicationRole.objects.filter(id__in=effective_roles['applicationrole_ids']):
+            app_uuid = application_role.application.uuid
+            self.assertEqual(user.get_role_names_by_app(app_uuid),
+                             list(user.get_roles_by_app(app_uuid).values_list('name', flat=True)))
+
+        # cached
+        with self.assertNumQueries(0):
+            get_effective_roles(user.id)
+
+        # invalidated by the m2m_changed signal
+        application_role = ApplicationRole.objects.exclude(id__in=effective_roles['applicationrole_ids']).first()
+        user.application_roles.add(application_role)
+        self.assertIn(application_role.id, get_effective_roles(user.id)['applicationrole_ids'])
+        user.application_roles.remove(application_role)
+        self.assertNotIn(application_role.id, get_effective_roles(user.id)['applicationrole_ids'])
+
+    def test_effective_roles_invalidation_after_commit(self):
+        user = User.objects.get(username='ApplicationAdmin')
+        effective_roles = get_effective_roles(user.id)
+        application_role = ApplicationRole.objects.exclude(id__in=effective_roles['applicationrole_ids']).first()
+        with self.captureOnCommitCallbacks(execute=True):
+            user.application_roles.add(application_role)
+            # a concurrent request caches the roles from before the commit
+            cache.set(_CACHE_KEY_EFFECTIVE_ROLES.format(user.id), effective_roles)
+        self.assertIn(application_role.id, get_effective_roles(user.id)['applicationrole_ids'])
+
+    def test_effective_roles_group_delete(self):
+        user = User.objects.get(username='ApplicationAdmin')
+        self.assertTrue(get_effective_roles(user.id)['permissions'])
+        # the roles reference the groups with SET_NULL, which sends no signals
+        with self.captureOnCommitCallbacks(execute=True):
+            Group.objects.all().delete()
+        self.assertEqual(get_effective_roles(user.id)['permissions'], set())
+
+    def test_permission_snapshot(self):
+        user = User.objects.get(username='ApplicationAdmin')
+        permissions = user.get_all_permissions()
+        self.assertTrue(user.is_app_user_admin())
+
+        # a new user instance, e.g. in the next request, takes the permissions from the cache
+        user = User.objects.get(username='ApplicationAdmin')
+        with self.assertNumQueries(0):
+            self.assertEqual(user.get_all_permissions(), permissions)
+            self.assertTrue(user.is_app_user_admin())
+            self.assertFalse(user.is_groupemail_admin)
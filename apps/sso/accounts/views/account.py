@@ -1,4 +1,3 @@
-import json
 import logging
 from datetime import timedelta
 from functools import lru_cache
@@ -194,18 +193,7 @@ class UserList(ListView):
         filters += [role_profile_filter, application_role_filter]
         if user.is_user_admin:
             filters += [IsActiveFilter().get(self)]
-        cache_dict = {
-            "user": user.id,
-            "q": self.request.GET.get(main.SEARCH_VAR, ''),
-            "country": "" if self.country is None else self.country.id,
-            "admin_region": "" if self.admin_region is None else self.admin_region.id,
-            "center": "" if self.center is None else self.center.id,
-            "role_profile": "" if self.role_profile is None else self.role_profile.id,
-            "app_role": "" if self.app_role is None else self.app_role.id,
-            "is_active": "" if self.is_active is None else self.is_active.pk,
-        }
-        filters_cache_key = hash(json.dumps(cache_dict, sort_keys=True))
-        return filters, filters_cache_key
+        return filters
 
     def get_context_data(self, **kwargs):
         headers = list(self.cl.result_headers())
@@ -214,8 +202,6 @@ class UserList(ListView):
             if h['sortable'] and h['sorted']:
                 num_sorted_fields += 1
 
-        filters, filters_cache_key = self.get_filters()
-
         context = {
             'result_headers': headers,
             'num_sorted_fields': num_sorted_fields,
@@ -223,8 +209,9 @@ class UserList(ListView):
             'page_var': main.PAGE_VAR,
             'query': self.request.GET.get(main.SEARCH_VAR, ''),
             'cl': self.cl,
-            'filters': filters,
-            'filters_cache_key': filters_cache_key,
+            # the template calls get_filters only if the filters are not in the fragment cache
+            'filters': self.get_filters,
+            'filters_cache_key': self.cl.get_cache_key(self.request.user.id),
             'is_active': self.is_active,
             'sso_validation_period_is_active': settings.SSO_VALIDATION_PERIOD_IS_ACTIVE
         }
@@ -275,14 +262,8 @@ class AppAdminUserList(ListView):
         qs = qs.order_by(*ordering).distinct()
         return qs
 
-    def get_context_data(self, **kwargs):
+    def get_filters(self):
         user = self.request.user
-        headers = list(self.cl.result_headers())
-        num_sorted_fields = 0
-        for h in headers:
-            if h['sortable'] and h['sorted']:
-                num_sorted_fields += 1
-
         user_countries = user.get_administrable_app_admin_user_countries()  # .filter(organisation__user__isnull=False)
         countries = Country.objects.filter(organisationcountry__in=user_countries)
         country_filter = CountryFilter().get(self, countries)
@@ -309,7 +290,14 @@ class AppAdminUserList(ListView):
         application_role_filter = ApplicationRoleFilter().get(self, application_roles)
         role_profile_filter = RoleProfileFilter().get(self, role_profiles)
 
-        filters = [country_filter, admin_region_filter, center_filter, role_profile_filter, application_role_filter]
+        return [country_filter, admin_region_filter, center_filter, role_profile_filter, application_role_filter]
+
+    def get_context_data(self, **kwargs):
+        headers = list(self.cl.result_headers())
+        num_sorted_fields = 0
+        for h in headers:
+            if h['sortable'] and h['sorted']:
+                num_sorted_fields += 1
 
         context = {
             'result_headers': headers,
@@ -318,7 +306,9 @@ class AppAdminUserList(ListView):
             'page_var': main.PAGE_VAR,
             'query': self.request.GET.get(main.SEARCH_VAR, ''),
             'cl': self.cl,
-            'filters': filters
+            # the template calls get_filters only if the filters are not in the fragment cache
+            'filters': self.get_filters,
+            'filters_cache_key': self.cl.get_cache_key(self.request.user.id),
         }
         context.update(kwargs)
         return super().get_context_data(**context)
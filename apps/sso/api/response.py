@@ -1,39 +1,73 @@
 import logging
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+from django.conf import settings
 from django.core.serializers.json import DjangoJSONEncoder
 from django.utils.translation import gettext as _
 from sso.utils.http import *  # @UnusedWildImport
+from sso.utils.url import get_origin
 
 logger = logging.getLogger(__name__)
 
+_django_json_encoder = DjangoJSONEncoder()
+# the separators of orjson
+COMPACT_SEPARATORS = (',', ':')
+
+
+def dumps_json(data, separators=None):
+    return json.dumps(data, cls=DjangoJSONEncoder, ensure_ascii=False, separators=separators).encode('utf-8')
+
+
+def dumps_orjson(data):
+    """
+    serializes with orjson, which writes compact json without spaces after the separators. The output is the
+    same as from dumps_json with the separators (',', ':'). The dates and times are passed to DjangoJSONEncoder,
+    so that they are truncated to milliseconds and UTC datetimes end with 'Z'.
+    """
+    try:
+        return orjson.dumps(data, default=_django_json_encoder.default,
+                            option=orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME)
+    except orjson.JSONEncodeError:
+        # e.g. integers with more than 64 bit
+        return dumps_json(data, separators=COMPACT_SEPARATORS)
+
+
+# name -> function which returns the utf-8 encoded json of the data
+json_encoders = {'json': dumps_json}
+if orjson is not None:
+    json_encoders['orjson'] = dumps_orjson
+
+
+def get_json_encoder():
+    """
+    returns the function of SSO_JSON_ENCODER, or dumps_json if the encoder is not available
+    """
+    encoder = json_encoders.get(settings.SSO_JSON_ENCODER)
+    if encoder is None:
+        logger.warning("json encoder %s is not available", settings.SSO_JSON_ENCODER)
+        json_encoders[settings.SSO_JSON_ENCODER] = encoder = dumps_json
+    return encoder
+
 
 def same_origin(url1, url2):
     """
     from: django 1.8 (missing in 1.9.rc1)
     Checks if two URLs are 'same-origin'
     """
-    PROTOCOL_TO_PORT = {
-        'http': 80,
-        'https': 443,
-    }
-    p1, p2 = urlparse(url1), urlparse(url2)
-    try:
-        o1 = (p1.scheme, p1.hostname, p1.port or PROTOCOL_TO_PORT[p1.scheme])
-        o2 = (p2.scheme, p2.hostname, p2.port or PROTOCOL_TO_PORT[p2.scheme])
-        return o1 == o2
-    except (ValueError, KeyError):
-        return False
+    o1 = get_origin(url1)
+    return o1 is not None and o1 == get_origin(url2)
 
 
 def add_cors_header(origin, client, response, public_cors=False):
     if origin:
         if public_cors:
             response['Access-Control-Allow-Origin'] = '*'
-        elif client:
-            for redirect_uri in client.redirect_uris.split():
-                if same_origin(redirect_uri, origin):
-                    response['Access-Control-Allow-Origin'] = origin
-                    break
+        elif client and client.is_origin_allowed(origin):
+            response['Access-Control-Allow-Origin'] = origin
 
 
 class JsonHttpResponse(HttpResponse):
@@ -45,11 +79,12 @@ class JsonHttpResponse(HttpResponse):
 
         if allow_jsonp and request:
             callback = request.GET.get('callback', None)
+        dumps = get_json_encoder()
         if callback:
             status = HTTP_200_OK
-            content = "%s(%s)" % (callback, json.dumps(data, cls=DjangoJSONEncoder, ensure_ascii=False))
+            content = b"%s(%s)" % (callback.encode('utf-8'), dumps(data))
         else:
-            content = json.dumps(data, cls=DjangoJSONEncoder, ensure_ascii=False)
+            content = dumps(data)
 
         super().__init__(content, status=status, content_type='application/json; charset=utf-8;',
                          *args, **kwargs)
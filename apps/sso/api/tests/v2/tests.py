@@ -1,10 +1,28 @@
+import base64
 import json
-from uuid import uuid4
+import logging
+from datetime import date, datetime, time, timedelta, timezone
+from decimal import Decimal
+from time import perf_counter
+from unittest import mock, skipUnless
+from uuid import uuid4, UUID
 
 from uritemplate import expand
 
-from django.urls import reverse
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection
+from django.test import RequestFactory, override_settings, tag
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse, set_script_prefix
+from django.utils.timezone import now
+from sso.api import response as api_response
+from sso.accounts.models import User
+from sso.api.views.organisations import OrganisationList
+from sso.api.views.users_v2 import USER_DETAILS_PREFETCH, UserList
 from sso.oauth2.tests import OAuth2BaseTestCase
+from sso.utils.url import reverse_template
+
+logger = logging.getLogger(__name__)
 
 
 def address(addressee, country='DE', street_address='', region='', address_type='home'):
@@ -87,6 +105,239 @@ class ApiTests(OAuth2BaseTestCase):
         organisation = response.json()
         self.assertNotIn('error', organisations)
 
+    def walk_list(self, url, authorization):
+        ids = []
+        num_pages = 0
+        while url:
+            response = self.client.get(url, HTTP_AUTHORIZATION=authorization)
+            data = response.json()
+            self.assertNotIn('error', data)
+            ids += [member['@id'] for member in data['member']]
+            url = data.get('next_page')
+            num_pages += 1
+        return ids, num_pages
+
+    def test_cursor_pagination(self):
+        authorization = self.get_authorization(client_id="1811f02ed81b43b5bee1afe031e6198e", username="GlobalAdmin", password="secret007", scope="users")
+        for name, orderings in [('v2_users', ['username', 'last_modified']), ('v2_organisations', ['name', 'last_modified'])]:
+            url = 'http://testserver%s' % reverse('api:%s' % name)
+            response = self.client.get(url + '?per_page=1000', HTTP_AUTHORIZATION=authorization)
+            all_ids = [member['@id'] for member in response.json()['member']]
+            total_items = response.json()['total_items']
+            self.assertEqual(len(all_ids), total_items)
+            self.assertGreater(total_items, 2)
+
+            for ordering in orderings:
+                # walk the full list with 2 items per page
+                ids, num_pages = self.walk_list(url + '?cursor=&per_page=2&ordering=%s' % ordering, authorization)
+                self.assertEqual(len(ids), len(set(ids)))
+                self.assertEqual(set(ids), set(all_ids))
+                self.assertEqual(num_pages, (total_items + 1) // 2)
+
+            ids, num_pages = self.walk_list(url + '?per_page=2', authorization)
+            self.assertEqual(set(ids), set(all_ids))
+
+            response = self.client.get(url + '?cursor=&per_page=2&total_items=true', HTTP_AUTHORIZATION=authorization)
+            self.assertEqual(response.json()['total_items'], total_items)
+            self.assertNotIn('total_items', self.client.get(url + '?cursor=', HTTP_AUTHORIZATION=authorization).json())
+
+            response = self.client.get(url + '?cursor=invalid', HTTP_AUTHORIZATION=authorization)
+            self.assertEqual(response.status_code, 400)
+
+            # forged cursors with values of wrong types
+            ordering = orderings[0]
+            for data in [[ordering, ['a', 'b']], ['last_modified', [1, 1]], ['last_modified', [['a'], 1]],
+                         [ordering, [{'a': 1}, 1]], [ordering, [True, 1]], [ordering, ['a', None]],
+                         [['a'], ['a', 1]], [{'a': 1}, ['a', 1]], [ordering, 1], [ordering], {'a': 1}, 1]:
+                ordering_name = data[0] if isinstance(data, list) and data and isinstance(data[0], str) else ordering
+                cursor = base64.urlsafe_b64encode(json.dumps(data).encode()).decode()
+                response = self.client.get(url + '?cursor=%s&ordering=%s' % (cursor, ordering_name), HTTP_AUTHORIZATION=authorization)
+                self.assertEqual(response.status_code, 400, data)
+
+    @tag('benchmark')
+    def test_cursor_pagination_benchmark(self):
+        authorization = self.get_authorization(client_id="1811f02ed81b43b5bee1afe031e6198e", username="GlobalAdmin", password="secret007", scope="users")
+        for name, orderings in [('v2_users', ['username', 'last_modified']), ('v2_organisations', ['name', 'last_modified'])]:
+            url = 'http://testserver%s' % reverse('api:%s' % name)
+            for ordering in orderings:
+                start = perf_counter()
+                ids, num_pages = self.walk_list(url + '?cursor=&per_page=2&ordering=%s' % ordering, authorization)
+                logger.info("%s: %d pages with cursor in %.3f s", name, num_pages, perf_counter() - start)
+
+            start = perf_counter()
+            ids, num_pages = self.walk_list(url + '?per_page=2', authorization)
+            logger.info("%s: %d pages with offset in %.3f s", name, num_pages, perf_counter() - start)
+
+    @override_settings(SSO_API_STREAMING_ENABLED=True)
+    def test_stream(self):
+        authorization = self.get_authorization(client_id="1811f02ed81b43b5bee1afe031e6198e", username="GlobalAdmin", password="secret007", scope="users")
+        for name in ['v2_users', 'v2_organisations']:
+            url = reverse('api:%s' % name)
+            response = self.client.get(url + '?per_page=1000', HTTP_AUTHORIZATION=authorization)
+            members = response.json()['member']
+
+            response = self.client.get(url + '?stream=1', HTTP_AUTHORIZATION=authorization)
+            self.assertTrue(response.streaming)
+            self.assertEqual(response['Content-Type'], 'application/x-ndjson; charset=utf-8')
+            streamed_members = [json.loads(line) for line in b''.join(response.streaming_content).decode().splitlines()]
+            self.assertEqual(streamed_members, members)
+
+            response = self.client.get(url, HTTP_AUTHORIZATION=authorization, HTTP_ACCEPT='application/x-ndjson')
+            self.assertTrue(response.streaming)
+            self.assertEqual(len(b''.join(response.streaming_content).splitlines()), len(members))
+
+        # not enabled
+        with override_settings(SSO_API_STREAMING_ENABLED=False):
+            response = self.client.get(url + '?stream=1', HTTP_AUTHORIZATION=authorization)
+            self.assertFalse(response.streaming)
+            self.assertIn('member', response.json())
+
+    @override_settings(SSO_API_STREAMING_ENABLED=True)
+    def test_stream_error(self):
+        authorization = self.get_authorization(client_id="1811f02ed81b43b5bee1afe031e6198e", username="GlobalAdmin", password="secret007", scope="users")
+        get_object_data = OrganisationList.get_object_data
+        calls = []
+
+        def failing_get_object_data(view, request, obj):
+            calls.append(obj)
+            if len(calls) > 1:
+                raise RuntimeError('database error')
+            return get_object_data(view, request, obj)
+
+        with mock.patch.object(OrganisationList, 'get_object_data', failing_get_object_data):
+            response = self.client.get(reverse('api:v2_organisations') + '?stream=1', HTTP_AUTHORIZATION=authorization)
+            lines = [json.loads(line) for line in b''.join(response.streaming_content).splitlines()]
+        self.assertEqual(len(lines), 2)
+        self.assertEqual(lines[-1]['error'], 'server_error')
+
+    def test_user_list_query_count(self):
+        authorization = self.get_authorization(client_id="1811f02ed81b43b5bee1afe031e6198e", username="GlobalAdmin", password="secret007", scope="users role")
+        url = reverse('api:v2_users')
+
+        def get_query_count(per_page):
+            with CaptureQueriesContext(connection) as context:
+                response = self.client.get(url + '?per_page=%d' % per_page, HTTP_AUTHORIZATION=authorization)
+            self.assertNotIn('error', response.json())
+            return len(context.captured_queries), len(response.json()['member'])
+
+        # warm up the caches of the authentication
+        get_query_count(1)
+        query_count, num_users = get_query_count(2)
+        all_query_count, all_num_users = get_query_count(100)
+        self.assertGreater(all_num_users, num_users)
+        # the number of queries does not depend on the number of users
+        self.assertEqual(query_count, all_query_count)
+
+    def test_user_details_query_count(self):
+        request = RequestFactory().get('/')
+        request.scopes = {'role', 'address', 'phone', 'profile', 'role_profile'}
+        users = list(User.objects.filter(picture='').prefetch_related(*USER_DETAILS_PREFETCH))
+        view = UserList()
+        # warm up the caches of the roles and the site
+        view.get_members_data(request, users, details=True)
+        # without the counts of the registrations and organisation changes
+        users = [user for user in users
+                 if not user.has_perm("registration.change_registrationprofile") and not user.has_perm("accounts.change_user")]
+
+        def get_query_count(num_users):
+            with CaptureQueriesContext(connection) as context:
+                members = view.get_members_data(request, users[:num_users], details=True)
+            self.assertEqual(len(members), len(users[:num_users]))
+            return len(context.captured_queries)
+
+        self.assertGreater(len(users), 2)
+        # the applications of the roles are fetched once for all users
+        self.assertEqual(get_query_count(1), get_query_count(len(users)))
+
+    def test_url_templates(self):
+        uuid = uuid4().hex
+        for view_name, kwargs in [('api:v2_users', {}), ('api:v2_user', {'uuid': uuid}), ('api:v2_country', {'iso2_code': 'de'}),
+                                  ('api:v2_user_app_role', {'uuid': uuid, 'app_uuid': uuid4().hex, 'role': 'Staff'})]:
+            self.assertEqual(reverse_template(view_name, **kwargs), reverse(view_name, kwargs=kwargs))
+        # the values are quoted like by reverse
+        for value in ["a:b@c!$&'()*+,;=~", 'ä ö%20?#[]{x}', 'a"<>\\^`|']:
+            kwargs = {'uidb64': value, 'token': value}
+            self.assertEqual(reverse_template('accounts:confirm_email', **kwargs), reverse('accounts:confirm_email', kwargs=kwargs))
+
+        # the templates are kept per script prefix
+        set_script_prefix('/sso/')
+        try:
+            self.assertEqual(reverse_template('api:v2_user', uuid=uuid), reverse('api:v2_user', kwargs={'uuid': uuid}))
+        finally:
+            set_script_prefix('/')
+        self.assertEqual(reverse_template('api:v2_user', uuid=uuid), reverse('api:v2_user', kwargs={'uuid': uuid}))
+
+    @tag('benchmark')
+    def test_url_templates_benchmark(self):
+        # the urls of a list page with 1000 items
+        uuids = [uuid4().hex for i in range(1000)]
+        start = perf_counter()
+        for uuid in uuids:
+            reverse('api:v2_user', kwargs={'uuid': uuid})
+            reverse('api:v2_picture', kwargs={'uuid': uuid})
+        reverse_duration = perf_counter() - start
+        start = perf_counter()
+        for uuid in uuids:
+            reverse_template('api:v2_user', uuid=uuid)
+            reverse_template('api:v2_picture', uuid=uuid)
+        template_duration = perf_counter() - start
+        logger.info("urls of 1000 users: reverse %.3f s, reverse_template %.3f s", reverse_duration, template_duration)
+
+    def get_user_list_payload(self, num_pages=1):
+        authorization = self.get_authorization(client_id="1811f02ed81b43b5bee1afe031e6198e", username="GlobalAdmin", password="secret007", scope="users")
+        members = self.client.get(reverse('api:v2_users'), HTTP_AUTHORIZATION=authorization).json()['member']
+        # with the python types of the serializer
+        members = [dict(member, id=UUID(member['id']), last_modified=now(), birth_date=date(1964, 9, 1), score=Decimal('1.50'))
+                   for member in members]
+        return {'member': members * num_pages, 'total_items': len(members) * num_pages, 'name': 'Jürgen'}
+
+    def test_json_encoder(self):
+        data = self.get_user_list_payload()
+        expected = json.dumps(data, cls=DjangoJSONEncoder, ensure_ascii=False).encode('utf-8')
+
+        request = RequestFactory().get('/', {'callback': 'cb'})
+        request.client = None
+        for encoder in api_response.json_encoders:
+            with override_settings(SSO_JSON_ENCODER=encoder):
+                response = api_response.JsonHttpResponse(data)
+                self.assertEqual(json.loads(response.content), json.loads(expected))
+                response = api_response.JsonHttpResponse(data, request, allow_jsonp=True)
+                self.assertTrue(response.content.startswith(b'cb(') and response.content.endswith(b')'))
+                self.assertEqual(json.loads(response.content[3:-1]), json.loads(expected))
+
+        # the default encoder writes the same bytes as before
+        self.assertEqual(api_response.JsonHttpResponse(data).content, expected)
+        response = api_response.JsonHttpResponse(data, request, allow_jsonp=True)
+        self.assertEqual(response.content, b'cb(' + expected + b')')
+
+    @skipUnless(api_response.orjson is not None, "orjson is not installed")
+    def test_orjson_output(self):
+        utc_datetime = datetime(2024, 5, 17, 8, 30, 15, 123456, tzinfo=timezone.utc)
+        values = {
+            'datetimes': [utc_datetime, utc_datetime.astimezone(timezone(timedelta(hours=2))),
+                          utc_datetime.replace(tzinfo=None), utc_datetime.replace(microsecond=0)],
+            'date': date(1964, 9, 1), 'time': time(8, 30, 15, 123456), 'uuid': uuid4(), 'decimal': Decimal('1.50'),
+            'timedelta': timedelta(days=1, seconds=3), 'float': 52.52, 'int': 2 ** 40, 'bool': True, 'none': None,
+            'text': 'Jürgen "\\ \n</script>', 'tuple': (1, 'a'), 1: 'int key',
+        }
+        payloads = [self.get_user_list_payload(), values, {'big_int': 2 ** 70, 'values': values}, [], 'text', 1.5]
+        for data in payloads:
+            expected = json.dumps(data, cls=DjangoJSONEncoder, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+            self.assertEqual(api_response.dumps_orjson(data), expected)
+
+    @tag('benchmark')
+    @skipUnless(api_response.orjson is not None, "orjson is not installed")
+    def test_json_encoder_benchmark(self):
+        data = self.get_user_list_payload(100)
+        durations = {}
+        for encoder, dumps in api_response.json_encoders.items():
+            start = perf_counter()
+            for i in range(5):
+                dumps(data)
+            durations[encoder] = perf_counter() - start
+        logger.info("json encoding of %d users: %s", len(data['member']),
+                    ', '.join('%s %.3f s' % (encoder, duration) for encoder, duration in durations.items()))
+
     def test_user_list(self):
         api_home = self.client.get(reverse('api:home')).json()
         users_url = expand(api_home['users'])
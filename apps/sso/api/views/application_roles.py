@@ -7,7 +7,7 @@ from django.urls import reverse
 from sso.accounts.models import User, Application, ApplicationRole
 from sso.api.views.generic import JsonDetailView, JsonListView
 from sso.api.views.home import UUIDS, replace_with_param_name
-from sso.utils.url import get_base_url
+from sso.utils.url import get_base_url, reverse_template
 
 logger = logging.getLogger(__name__)
 
@@ -18,7 +18,7 @@ class ApplicationMixin(object):
     def get_object_data(self, request, obj, details=False):
         base = get_base_url(request)
         data = {
-            '@id': "%s%s" % (base, reverse('api:v2_app', kwargs={'uuid': obj.uuid.hex})),
+            '@id': "%s%s" % (base, reverse_template('api:v2_app', uuid=obj.uuid.hex)),
             'id': '%s' % obj.uuid.hex,
             'order': obj.order,
             'link': {
@@ -1,12 +1,11 @@
 import logging
 
 from django.db.models import Q
-from django.urls import reverse
 from django.utils.encoding import force_str
 from sso.api.views.generic import JsonListView, JsonDetailView
 from sso.organisations.models import OrganisationCountry
 from sso.utils.parse import parse_datetime_with_timezone_support
-from sso.utils.url import get_base_url
+from sso.utils.url import get_base_url, reverse_template
 
 logger = logging.getLogger(__name__)
 
@@ -17,7 +16,7 @@ class CountryMixin(object):
     def get_object_data(self, request, obj, details=False):
         base = get_base_url(request)
         data = {
-            '@id': "%s%s" % (base, reverse('api:v2_country', kwargs={'iso2_code': obj.country.iso2_code})),
+            '@id': "%s%s" % (base, reverse_template('api:v2_country', iso2_code=obj.country.iso2_code)),
             'id': '%s' % obj.uuid.hex,
             'code': obj.country.iso2_code,
             'order': obj.order,
@@ -33,15 +32,15 @@ class CountryMixin(object):
             data['email'] = '%s' % obj.email
         if details:
             if ('users' in request.scopes) and (obj in request.user.get_administrable_user_countries()):
-                data['users'] = "%s%s?country=%s" % (base, reverse('api:v2_users'), obj.country.iso2_code)
+                data['users'] = "%s%s?country=%s" % (base, reverse_template('api:v2_users'), obj.country.iso2_code)
             if obj.organisation_set.exists():
                 data['organisations'] = "%s%s?country=%s" % (
-                base, reverse('api:v2_organisations'), obj.country.iso2_code)
+                base, reverse_template('api:v2_organisations'), obj.country.iso2_code)
             if obj.adminregion_set.exists():
-                data['regions'] = "%s%s?country=%s" % (base, reverse('api:v2_regions'), obj.country.iso2_code)
+                data['regions'] = "%s%s?country=%s" % (base, reverse_template('api:v2_regions'), obj.country.iso2_code)
             if obj.country_groups.all().exists():
                 data['country_groups'] = "%s%s?country=%s" % (
-                base, reverse('api:v2_country_groups'), obj.country.iso2_code)
+                base, reverse_template('api:v2_country_groups'), obj.country.iso2_code)
         return data
 
 
@@ -1,13 +1,12 @@
 import logging
 
 from django.db.models import Q
-from django.urls import reverse
 from django.utils.encoding import force_str
 from sso.accounts.models import User
 from sso.api.views.generic import JsonListView, JsonDetailView
 from sso.organisations.models import CountryGroup, OrganisationCountry, Organisation, AdminRegion
 from sso.utils.parse import parse_datetime_with_timezone_support
-from sso.utils.url import get_base_url
+from sso.utils.url import get_base_url, reverse_template
 
 logger = logging.getLogger(__name__)
 
@@ -18,7 +17,7 @@ class CountryGroupMixin(object):
     def get_object_data(self, request, obj, details=False):
         base = get_base_url(request)
         data = {
-            '@id': "%s%s" % (base, reverse('api:v2_country_group', kwargs={'uuid': obj.uuid.hex})),
+            '@id': "%s%s" % (base, reverse_template('api:v2_country_group', uuid=obj.uuid.hex)),
             'id': '%s' % obj.uuid.hex,
             'name': '%s' % force_str(obj),
             'homepage': obj.homepage,
@@ -31,15 +30,15 @@ class CountryGroupMixin(object):
                 users = User.objects.filter(organisations__organisation_country__country_groups=obj)
                 users = request.user.filter_administrable_users(users)
                 if users.exists():
-                    data['users'] = "%s%s?country_group_id=%s" % (base, reverse('api:v2_users'), obj.uuid.hex)
+                    data['users'] = "%s%s?country_group_id=%s" % (base, reverse_template('api:v2_users'), obj.uuid.hex)
 
             if Organisation.objects.filter(organisation_country__country_groups=obj).exists():
                 data['organisations'] = "%s%s?country_group_id=%s" % (
-                base, reverse('api:v2_organisations'), obj.uuid.hex)
+                base, reverse_template('api:v2_organisations'), obj.uuid.hex)
             if AdminRegion.objects.filter(organisation_country__country_groups=obj).exists():
-                data['regions'] = "%s%s?country_group_id=%s" % (base, reverse('api:v2_regions'), obj.uuid.hex)
+                data['regions'] = "%s%s?country_group_id=%s" % (base, reverse_template('api:v2_regions'), obj.uuid.hex)
             if OrganisationCountry.objects.filter(country_groups=obj).exists():
-                data['countries'] = "%s%s?country_group_id=%s" % (base, reverse('api:v2_countries'), obj.uuid.hex)
+                data['countries'] = "%s%s?country_group_id=%s" % (base, reverse_template('api:v2_countries'), obj.uuid.hex)
         return data
 
 
@@ -1,10 +1,16 @@
+import base64
+import binascii
+import json
 import logging
 
-from django.core.exceptions import ObjectDoesNotExist, PermissionDenied
-from django.db import transaction
+from django.conf import settings
+from django.core.exceptions import ObjectDoesNotExist, PermissionDenied, ValidationError
+from django.db import models, transaction
+from django.db.models import Q
 from django.forms.models import model_to_dict
-from django.http import HttpResponse, Http404
+from django.http import HttpResponse, Http404, StreamingHttpResponse
 from django.utils.decorators import method_decorator
+from django.utils.dateparse import parse_datetime
 from django.utils.encoding import force_str
 from django.utils.http import url_has_allowed_host_and_scheme
 from django.views.decorators.csrf import csrf_exempt
@@ -12,7 +18,7 @@ from django.views.decorators.vary import vary_on_headers
 from django.views.generic.detail import BaseDetailView
 from django.views.generic.list import BaseListView
 from sso.api.decorators import catch_errors
-from sso.api.response import JsonHttpResponse
+from sso.api.response import JsonHttpResponse, add_cors_header, get_json_encoder
 from sso.auth.utils import is_browser_client
 from sso.oauth2.models import allowed_hosts
 from sso.utils.http import parse_json
@@ -244,8 +250,21 @@ class JsonDetailView(JSONResponseMixin, PreflightMixin, PermissionMixin, BaseDet
 
 
 class JsonListView(JSONResponseMixin, PermissionMixin, BaseListView):
+    """
+    With the `cursor` parameter the list is paginated with a keyset over one of the cursor_orderings instead of
+    the page number and offset, e.g. ?cursor=&ordering=username. The next_page link carries the cursor of
+    the last item and the total_items are only counted with total_items=true.
+
+    If SSO_API_STREAMING_ENABLED is set, with `stream=1` or `Accept: application/x-ndjson` the whole list is
+    streamed without pagination, one json member per line. The queryset is read in chunks of stream_chunk_size
+    items, the prefetch_related lookups are done per chunk. The status code is sent before the first member,
+    so an error during the streaming ends the stream with a line {"error": "server_error", ...}.
+    """
     paginate_by = 100
     max_per_page = 1000
+    # name -> fields for the keyset pagination, the last field must be unique
+    cursor_orderings = {}
+    stream_chunk_size = 500
 
     @method_decorator(csrf_exempt)
     @method_decorator(catch_errors)
@@ -261,11 +280,125 @@ class JsonListView(JSONResponseMixin, PermissionMixin, BaseListView):
     def render_to_response(self, context, **response_kwargs):
         return self.render_to_json_response(context, **response_kwargs)
 
+    def is_cursor_request(self):
+        return bool(self.cursor_orderings) and 'cursor' in self.request.GET
+
+    def get_cursor_ordering(self):
+        name = self.request.GET.get('ordering', next(iter(self.cursor_orderings)))
+        if name not in self.cursor_orderings:
+            raise ValueError("ordering must be one of %s" % ', '.join(self.cursor_orderings))
+        return name, self.cursor_orderings[name]
+
+    @staticmethod
+    def encode_cursor(ordering_name, values):
+        values = [value.isoformat() if hasattr(value, 'isoformat') else value for value in values]
+        data = json.dumps([ordering_name, values], separators=(',', ':'))
+        return base64.urlsafe_b64encode(data.encode()).decode().rstrip('=')
+
+    @staticmethod
+    def decode_cursor(cursor, ordering_name, model, fields):
+        try:
+            data = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+        except (binascii.Error, UnicodeDecodeError, TypeError, ValueError):
+            raise ValueError("invalid cursor %s" % cursor)
+        # the cursor is sent by the client and may be forged
+        if not (isinstance(data, list) and len(data) == 2 and isinstance(data[0], str) and isinstance(data[1], list)):
+            raise ValueError("invalid cursor %s" % cursor)
+        name, values = data
+        if name != ordering_name or len(values) != len(fields):
+            raise ValueError("cursor does not match the ordering %s" % ordering_name)
+        for i, field_name in enumerate(fields):
+            value = values[i]
+            if isinstance(value, bool) or not isinstance(value, (str, int)):
+                raise ValueError("invalid cursor %s" % cursor)
+            field = model._meta.get_field(field_name)
+            if isinstance(field, models.DateTimeField):
+                value = parse_datetime(value) if isinstance(value, str) else None
+            else:
+                try:
+                    value = field.to_python(value)
+                except ValidationError:
+                    value = None
+            if value is None:
+                raise ValueError("invalid cursor %s" % cursor)
+            values[i] = value
+        return values
+
+    @staticmethod
+    def get_keyset_filter(fields, values):
+        # (a, b, c) > (x, y, z) <=> a > x or (a = x and b > y) or (a = x and b = y and c > z)
+        q = Q()
+        for i, field_name in enumerate(fields):
+            q |= Q(**dict(zip(fields[:i], values[:i])), **{'%s__gt' % field_name: values[i]})
+        return q
+
+    def is_stream_request(self):
+        if not settings.SSO_API_STREAMING_ENABLED:
+            return False
+        return self.request.GET.get('stream') in ['True', 'true', '1'] or \
+            'application/x-ndjson' in self.request.META.get('HTTP_ACCEPT', '')
+
+    def stream_members(self, queryset):
+        dumps = get_json_encoder()
+        try:
+            for obj in queryset.iterator(chunk_size=self.stream_chunk_size):
+                yield dumps(self.get_object_data(self.request, obj)) + b'\n'
+        except Exception:
+            # runs after the view returned, outside of catch_errors
+            logger.exception('Error while streaming %s' % self.request.path)
+            yield dumps({'error': 'server_error', 'error_description': 'the stream is incomplete'}) + b'\n'
+
+    def render_to_stream_response(self):
+        response = StreamingHttpResponse(self.stream_members(self.object_list), content_type='application/x-ndjson; charset=utf-8')
+        add_cors_header(self.request.META.get('HTTP_ORIGIN'), self.request.client, response)
+        return response
+
+    def get_cursor_context_data(self):
+        queryset = self.object_list
+        per_page = self.get_paginate_by(queryset)
+        ordering_name, fields = self.get_cursor_ordering()
+        cursor = self.request.GET['cursor']
+
+        if cursor:
+            values = self.decode_cursor(cursor, ordering_name, queryset.model, fields)
+            page_queryset = queryset.filter(self.get_keyset_filter(fields, values))
+        else:
+            page_queryset = queryset
+        # one more item tells if there is a next page
+        object_list = list(page_queryset.order_by(*fields)[:per_page + 1])
+        next_cursor = None
+        if len(object_list) > per_page:
+            object_list = object_list[:per_page]
+            last = object_list[-1]
+            next_cursor = self.encode_cursor(ordering_name, [getattr(last, field_name) for field_name in fields])
+
+        context = {'object_list': object_list, 'per_page': per_page, 'next_cursor': next_cursor}
+        if self.request.GET.get('total_items') in ['True', 'true', '1']:
+            context['total_items'] = queryset.count()
+        return context
+
+    def get_cursor_data(self, context, self_url):
+        data = {
+            'member': self.get_members_data(self.request, context['object_list']),
+            'items_per_page': context['per_page'],
+        }
+        if 'total_items' in context:
+            data['total_items'] = context['total_items']
+        if context['next_cursor']:
+            data['next_page'] = update_url(self_url, {'cursor': context['next_cursor']})
+        return data
+
     def get_data(self, context):
         page_base_url = "%s%s" % (get_base_url(self.request), self.request.path)
         self_url = update_url(page_base_url, self.request.GET)
+        if 'next_cursor' in context:
+            data = self.get_cursor_data(context, self_url)
+            data['@id'] = self_url
+            data['operation'] = self.get_allowed_operations(None)
+            return data
+
         data = {
-            'member': [self.get_object_data(self.request, obj) for obj in context['object_list']],
+            'member': self.get_members_data(self.request, context['object_list']),
             'total_items': context['paginator'].count
         }
         if context['is_paginated']:
@@ -281,12 +414,14 @@ class JsonListView(JSONResponseMixin, PermissionMixin, BaseListView):
         data['operation'] = self.get_allowed_operations(None)
         return data
 
-    @method_decorator(vary_on_headers('Access-Control-Allow-Origin', 'Authorization', 'Cookie'))
+    @method_decorator(vary_on_headers('Access-Control-Allow-Origin', 'Authorization', 'Cookie', 'Accept'))
     def get(self, request, *args, **kwargs):
         # permission check
         self.check_permission('read')
 
         self.object_list = self.get_queryset()
+        if self.is_stream_request():
+            return self.render_to_stream_response()
 
         allow_empty = self.get_allow_empty()
 
@@ -301,7 +436,10 @@ class JsonListView(JSONResponseMixin, PermissionMixin, BaseListView):
             if is_empty:
                 raise Http404(
                     "Empty list and '%(class_name)s.allow_empty' is False." % {'class_name': self.__class__.__name__})
-        context = self.get_context_data()
+        if self.is_cursor_request():
+            context = self.get_cursor_context_data()
+        else:
+            context = self.get_context_data()
         return self.render_to_response(context)
 
     def get_object_data(self, request, obj):
@@ -309,3 +447,9 @@ class JsonListView(JSONResponseMixin, PermissionMixin, BaseListView):
         custom function to transform the object into an object which can be json rendered
         """
         return model_to_dict(obj)
+
+    def get_members_data(self, request, object_list):
+        """
+        the data of the objects of a page, can be overridden to load the related data of all objects at once
+        """
+        return [self.get_object_data(request, obj) for obj in object_list]
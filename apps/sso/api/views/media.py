@@ -6,7 +6,6 @@ from sorl.thumbnail import get_thumbnail
 
 from django.core.files.base import ContentFile
 from django.db import transaction
-from django.urls import reverse
 from django.utils.crypto import get_random_string
 from django.utils.decorators import method_decorator
 from django.views.decorators.csrf import csrf_exempt
@@ -15,7 +14,7 @@ from sso.api.decorators import catch_errors
 from sso.api.decorators import condition
 from sso.api.views.generic import JsonDetailView
 from sso.api.views.users_v2 import read_permission
-from sso.utils.url import absolute_url, get_base_url
+from sso.utils.url import absolute_url, get_base_url, reverse_template
 
 logger = logging.getLogger(__name__)
 
@@ -84,7 +83,7 @@ class UserPictureDetailView(JsonDetailView):
     def get_object_data(self, request, obj):
         base = get_base_url(request)
         data = {
-            '@id': "%s%s" % (base, reverse('api:v2_picture', kwargs={'uuid': obj.uuid.hex})),
+            '@id': "%s%s" % (base, reverse_template('api:v2_picture', uuid=obj.uuid.hex)),
             'id': '%s' % obj.uuid.hex,
             'last_modified': obj.last_modified,
             'max_size': User.MAX_PICTURE_SIZE
@@ -4,12 +4,11 @@ from sorl.thumbnail import get_thumbnail
 
 from django.conf import settings
 from django.db.models import Q
-from django.urls import reverse
 from sso.api.views.generic import JsonListView, JsonDetailView
 from sso.organisations.models import Organisation, get_near_organisations, multiple_associations, \
     is_validation_period_active
 from sso.utils.parse import parse_datetime_with_timezone_support
-from sso.utils.url import absolute_url, get_base_url
+from sso.utils.url import absolute_url, get_base_url, reverse_template
 
 logger = logging.getLogger(__name__)
 
@@ -26,7 +25,7 @@ class OrganisationMixin(object):
 
         base = get_base_url(request)
         data = {
-            '@id': "%s%s" % (base, reverse('api:v2_organisation', kwargs={'uuid': obj.uuid.hex})),
+            '@id': "%s%s" % (base, reverse_template('api:v2_organisation', uuid=obj.uuid.hex)),
             'id': '%s' % obj.uuid.hex,
             'is_active': obj.is_active,
             'is_live': obj.is_live,
@@ -46,7 +45,7 @@ class OrganisationMixin(object):
         }
         if multiple_associations():
             data['association'] = {
-                '@id': "%s%s" % (base, reverse('api:v2_association', kwargs={'uuid': obj.association.uuid.hex})),
+                '@id': "%s%s" % (base, reverse_template('api:v2_association', uuid=obj.association.uuid.hex)),
                 'name': obj.association.name
             }
 
@@ -71,12 +70,12 @@ class OrganisationMixin(object):
             data['country'] = {
                 'code': obj.organisation_country.country.iso2_code,
                 '@id': "%s%s" % (
-                    base, reverse('api:v2_country', kwargs={'iso2_code': obj.organisation_country.country.iso2_code})),
+                    base, reverse_template('api:v2_country', iso2_code=obj.organisation_country.country.iso2_code)),
             }
         if obj.admin_region is not None:
             data['region'] = {
                 'id': obj.admin_region.uuid.hex,
-                '@id': "%s%s" % (base, reverse('api:v2_region', kwargs={'uuid': obj.admin_region.uuid.hex})),
+                '@id': "%s%s" % (base, reverse_template('api:v2_region', uuid=obj.admin_region.uuid.hex)),
             }
 
         try:
@@ -92,7 +91,7 @@ class OrganisationMixin(object):
 
         if details:
             if ('users' in request.scopes) and (obj in request.user.get_administrable_user_organisations()):
-                data['users'] = "%s%s?org_id=%s" % (base, reverse('api:v2_users'), obj.uuid.hex)
+                data['users'] = "%s%s?org_id=%s" % (base, reverse_template('api:v2_users'), obj.uuid.hex)
 
             if request.client.is_trustworthy or not obj.is_private:
                 data['addresses'] = {
@@ -150,6 +149,8 @@ class OrganisationDetailView(OrganisationMixin, JsonDetailView):
 
 
 class OrganisationList(OrganisationMixin, JsonListView):
+    cursor_orderings = {'name': ['name', 'id'], 'last_modified': ['last_modified', 'id']}
+
     def get_queryset(self):
         qs = super().get_queryset().prefetch_related(
             'organisation_country__country', 'admin_region', 'email', 'organisationaddress_set',
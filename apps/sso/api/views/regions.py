@@ -1,11 +1,10 @@
 import logging
 
 from django.db.models import Q
-from django.urls import reverse
 from sso.api.views.generic import JsonListView, JsonDetailView
 from sso.organisations.models import AdminRegion
 from sso.utils.parse import parse_datetime_with_timezone_support
-from sso.utils.url import get_base_url
+from sso.utils.url import get_base_url, reverse_template
 
 logger = logging.getLogger(__name__)
 
@@ -16,7 +15,7 @@ class RegionMixin(object):
     def get_object_data(self, request, obj, details=False):
         base = get_base_url(request)
         data = {
-            '@id': "%s%s" % (base, reverse('api:v2_region', kwargs={'uuid': obj.uuid.hex})),
+            '@id': "%s%s" % (base, reverse_template('api:v2_region', uuid=obj.uuid.hex)),
             'id': '%s' % obj.uuid.hex,
             'name': '%s' % obj.name,
             'slug': '%s' % obj.slug,
@@ -25,16 +24,16 @@ class RegionMixin(object):
             'country': {
                 'code': obj.organisation_country.country.iso2_code,
                 '@id': "%s%s" % (
-                    base, reverse('api:v2_country', kwargs={'iso2_code': obj.organisation_country.country.iso2_code})),
+                    base, reverse_template('api:v2_country', iso2_code=obj.organisation_country.country.iso2_code)),
             }
         }
         if obj.email:
             data['email'] = '%s' % obj.email
         if details:
             if ('users' in request.scopes) and (obj in request.user.get_administrable_user_regions()):
-                data['users'] = "%s%s?region_id=%s" % (base, reverse('api:v2_users'), obj.uuid.hex)
+                data['users'] = "%s%s?region_id=%s" % (base, reverse_template('api:v2_users'), obj.uuid.hex)
             if obj.organisation_set.exists():
-                data['organisations'] = "%s%s?region_id=%s" % (base, reverse('api:v2_organisations'), obj.uuid.hex)
+                data['organisations'] = "%s%s?region_id=%s" % (base, reverse_template('api:v2_organisations'), obj.uuid.hex)
 
         return data
 
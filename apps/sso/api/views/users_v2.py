@@ -6,7 +6,7 @@ from sorl.thumbnail import get_thumbnail
 from django.conf import settings
 from django.contrib.auth.decorators import login_required, permission_required
 from django.core.exceptions import ObjectDoesNotExist
-from django.db.models import Q
+from django.db.models import Q, Prefetch, prefetch_related_objects
 from django.http.response import HttpResponse
 from django.urls import reverse
 from django.utils.crypto import get_random_string
@@ -28,7 +28,7 @@ from sso.models import update_object_from_dict, map_dict2dict
 from sso.organisations.models import Organisation
 from sso.registration import default_username_generator
 from sso.utils.parse import parse_datetime_with_timezone_support, strtobool
-from sso.utils.url import absolute_url, get_base_url
+from sso.utils.url import absolute_url, get_base_url, reverse_template
 
 logger = logging.getLogger(__name__)
 
@@ -101,15 +101,46 @@ API_PHONE_MAP = {
 }
 
 
+# related objects of the users in lists, loaded once per page
+USER_LIST_PREFETCH = ['useraddress_set', 'userphonenumber_set', 'userattribute_set', 'useremail_set',
+                      Prefetch('userassociatedsystem_set', queryset=UserAssociatedSystem.objects.select_related('application'))]
+# additional related objects of the user details
+USER_DETAILS_PREFETCH = USER_LIST_PREFETCH + [
+    'useraddress_set__country', 'organisations__organisation_country__country', 'admin_regions__organisation_country__country',
+    'admin_organisation_countries__country', 'role_profiles']
+
+
 class UserMixin(object):
     model = User
 
-    def get_object_data(self, request, obj, details=False):
+    @staticmethod
+    def get_role_applications(users):
+        """
+        returns the active applications of the roles of the users by uuid hex ordered by 'order',
+        with one query for all users
+        """
+        app_uuids = set()
+        for user in users:
+            app_uuids.update(user.get_effective_roles()['roles'])
+        if not app_uuids:
+            return {}
+        applications = Application.objects.filter(uuid__in=[UUID(app_uuid) for app_uuid in app_uuids], is_active=True)
+        return {application.uuid.hex: application for application in applications.order_by('order')}
+
+    def get_members_data(self, request, object_list, details=False):
+        object_list = list(object_list)
+        role_applications = None
+        if details and 'role' in request.scopes:
+            role_applications = self.get_role_applications(object_list)
+        return [self.get_object_data(request, obj, details=details, role_applications=role_applications)
+                for obj in object_list]
+
+    def get_object_data(self, request, obj, details=False, role_applications=None):
         scopes = request.scopes
         base = get_base_url(request)
         email = obj.primary_email()
         data = {
-            '@id': "%s%s" % (base, reverse('api:v2_user', kwargs={'uuid': obj.uuid.hex})),
+            '@id': "%s%s" % (base, reverse_template('api:v2_user', uuid=obj.uuid.hex)),
             'id': '%s' % obj.uuid.hex,
             'sub': '%s' % obj.uuid.hex,
             'is_active': obj.is_active,
@@ -135,7 +166,7 @@ class UserMixin(object):
             data['email_verified'] = email.confirmed
 
         data['picture'] = {
-            '@id': "%s%s" % (base, reverse('api:v2_picture', kwargs={'uuid': obj.uuid.hex}))
+            '@id': "%s%s" % (base, reverse_template('api:v2_picture', uuid=obj.uuid.hex))
         }
         if obj.picture:
             data['picture']['url'] = absolute_url(request, obj.picture.url)
@@ -143,9 +174,12 @@ class UserMixin(object):
         data['associated_systems'] = {
             associated_system.application.uuid.hex: {
                 'userid': associated_system.userid
-            } for associated_system in UserAssociatedSystem.objects.filter(user=obj)}
+            } for associated_system in obj.userassociatedsystem_set.all()}
 
         if details:
+            # does nothing for the lookups which are already prefetched by the queryset
+            prefetch_related_objects([obj], *USER_DETAILS_PREFETCH)
+
             if obj.picture:
                 data['picture']['30x30'] = absolute_url(request, get_thumbnail(obj.picture, "30x30", crop="center").url)
                 data['picture']['60x60'] = absolute_url(request, get_thumbnail(obj.picture, "60x60", crop="center").url)
@@ -157,45 +191,46 @@ class UserMixin(object):
                 organisation.uuid.hex: {
                     'country': organisation.organisation_country.country.iso2_code,
                     'name': organisation.name,
-                    '@id': "%s%s" % (base, reverse('api:v2_organisation', kwargs={'uuid': organisation.uuid.hex}))
+                    '@id': "%s%s" % (base, reverse_template('api:v2_organisation', uuid=organisation.uuid.hex))
                 } if organisation.organisation_country else {
                     'name': organisation.name,
-                    '@id': "%s%s" % (base, reverse('api:v2_organisation', kwargs={'uuid': organisation.uuid.hex}))
-                } for organisation in obj.organisations.all().prefetch_related('organisation_country__country')
+                    '@id': "%s%s" % (base, reverse_template('api:v2_organisation', uuid=organisation.uuid.hex))
+                } for organisation in obj.organisations.all()
             }
             data['admin_regions'] = {
                 region.uuid.hex: {
                     'country': region.organisation_country.country.iso2_code,
                     'name': region.name,
-                    '@id': "%s%s" % (base, reverse('api:v2_region', kwargs={'uuid': region.uuid.hex}))
+                    '@id': "%s%s" % (base, reverse_template('api:v2_region', uuid=region.uuid.hex))
                 } if region.organisation_country else {
                     'name': region.name,
-                    '@id': "%s%s" % (base, reverse('api:v2_region', kwargs={'uuid': region.uuid.hex}))
-                } for region in obj.admin_regions.all().prefetch_related('organisation_country__country')
+                    '@id': "%s%s" % (base, reverse_template('api:v2_region', uuid=region.uuid.hex))
+                } for region in obj.admin_regions.all()
             }
             data['admin_countries'] = {
                 organisation_country.country.iso2_code: {
                     'code': organisation_country.country.iso2_code,
                     'name': organisation_country.country.printable_name,
                     '@id': "%s%s" % (
-                        base, reverse('api:v2_country', kwargs={'iso2_code': organisation_country.country.iso2_code}))
+                        base, reverse_template('api:v2_country', iso2_code=organisation_country.country.iso2_code))
                 } for organisation_country in obj.admin_organisation_countries.all()
             }
 
             if 'role' in scopes:
                 applications = {}
-                applicationroles = obj.get_applicationroles()
-
-                for application in obj.get_apps():
+                # role names by application uuid hex
+                roles = obj.get_effective_roles()['roles']
+                if role_applications is None:
+                    role_applications = self.get_role_applications([obj])
+                for application in role_applications.values():
+                    if application.uuid.hex not in roles:
+                        continue
                     if not application.required_scope or application.required_scope in scopes:
-                        application_data = {'order': application.order,
-                                            'link': {'href': application.url, 'title': application.title,
-                                                     'global_navigation': application.global_navigation}, 'roles': []}
-                        for applicationrole in applicationroles:
-                            if applicationrole.application == application:
-                                application_data['roles'].append(applicationrole.role.name)
-
-                        applications[application.uuid.hex] = application_data
+                        applications[application.uuid.hex] = {
+                            'order': application.order,
+                            'link': {'href': application.url, 'title': application.title,
+                                     'global_navigation': application.global_navigation},
+                            'roles': list(roles[application.uuid.hex])}
                 data['apps'] = applications
 
             # be carefully to assign role_profile, because there can be private / secret role_profiles
@@ -335,11 +370,10 @@ class UserDetailView(UserMixin, JsonDetailView):
         return super().dispatch(request, *args, **kwargs)
 
     def get_queryset(self):
-        return super().get_queryset().prefetch_related('useraddress_set', 'userphonenumber_set', 'userattribute_set',
-                                                       'userassociatedsystem_set')
+        return super().get_queryset().prefetch_related(*USER_DETAILS_PREFETCH)
 
-    def get_object_data(self, request, obj, details=True):
-        return super().get_object_data(request, obj, details=details)
+    def get_object_data(self, request, obj, details=True, role_applications=None):
+        return super().get_object_data(request, obj, details=details, role_applications=role_applications)
 
     def _update_user_organisation(self, data):
         request = self.request
@@ -551,7 +585,7 @@ class VerifyEmailView(JsonDetailView):
         base = get_base_url(request)
         user_email = self.get_unconfirmed_primary_email()
         data = {
-            '@id': "%s%s" % (base, reverse('api:v2_verify_email', kwargs={'uuid': obj.uuid.hex})),
+            '@id': "%s%s" % (base, reverse_template('api:v2_verify_email', uuid=obj.uuid.hex)),
             'id': '%s' % user_email.uuid.hex,
             'last_modified': user_email.last_modified
         }
@@ -620,6 +654,8 @@ class MyGlobalNavigationView(GlobalNavigationView):
 
 
 class UserList(UserMixin, JsonListView):
+    cursor_orderings = {'username': ['username', 'id'], 'last_modified': ['last_modified', 'id']}
+
     @classmethod
     def read_permission(cls, request, obj):
         user = request.user
@@ -656,8 +692,7 @@ class UserList(UserMixin, JsonListView):
         }
 
     def get_queryset(self):
-        qs = super().get_queryset().prefetch_related('useraddress_set', 'userphonenumber_set', 'userattribute_set',
-                                                     'useremail_set', 'userassociatedsystem_set').distinct()
+        qs = super().get_queryset().prefetch_related(*USER_LIST_PREFETCH).distinct()
         qs = qs.order_by('username')
         qs = self.request.user.filter_administrable_users(qs)
 
@@ -25,13 +25,17 @@ class SSOBackend(ModelBackend):
             return set()
         if not hasattr(user_obj, '_sso_group_perm_cache'):
             if user_obj.is_superuser:
-                perms = Permission.objects.all()
+                perms = Permission.objects.all().values_list('content_type__app_label', 'codename').order_by()
+                user_obj._sso_group_perm_cache = set(["%s.%s" % (ct, name) for ct, name in perms])
             else:
-                perms = user_obj.get_group_and_role_permissions()
-            perms = perms.values_list('content_type__app_label', 'codename').order_by()
-            user_obj._sso_group_perm_cache = set(["%s.%s" % (ct, name) for ct, name in perms])
+                user_obj._sso_group_perm_cache = user_obj.get_effective_roles()['permissions']
         return user_obj._sso_group_perm_cache
 
+    def get_user_permissions(self, user_obj, obj=None):
+        if not user_obj.is_active or user_obj.is_anonymous or obj is not None or user_obj.is_superuser:
+            return super().get_user_permissions(user_obj, obj)
+        return user_obj.get_effective_roles()['user_permissions']
+
     def get_user(self, user_id):
         try:
             return User.objects.get(uuid=user_id)
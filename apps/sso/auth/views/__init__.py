@@ -24,8 +24,9 @@ from sso.auth.models import Device
 from sso.auth.utils import get_safe_login_redirect_url, get_request_param, get_device_classes_for_user
 from sso.middleware import revision_exempt
 from sso.oauth2.crypt import loads_jwt
-from sso.oauth2.models import allowed_hosts, post_logout_redirect_uris, Client
+from sso.oauth2.models import allowed_hosts, post_logout_redirect_uris
 from sso.oauth2.models import get_oauth2_cancel_url
+from sso.oauth2.registry import get_client
 from sso.utils.http import HttpPostLogoutRedirect
 from sso.utils.url import get_safe_redirect_uri, REDIRECT_URI_FIELD_NAME, update_url, remove_value_from_url_param
 from throttle.decorators import throttle
@@ -243,7 +244,7 @@ def logout(request, next_page=None, template_name='sso_auth/logged_out.html', re
             # token maybe expired
             data = loads_jwt(id_token, options={"verify_exp": False, "verify_aud": False})
             if user.is_anonymous or user.uuid == UUID(data['sub']):
-                client = Client.objects.get(uuid=data['aud'])
+                client = get_client(data['aud'])
                 if redirect_uri in client.post_logout_redirect_uris.split():
                     # allow unsafe schemes
                     redirect_to = redirect_uri
@@ -1,17 +1,78 @@
 import logging
+import pickle
+import threading
+import time
+from collections import Counter
 
+from pymemcache.exceptions import MemcacheError
+
+from django.conf import settings
+from django.core.cache.backends.base import DEFAULT_TIMEOUT
 from django.core.cache.backends.memcached import PyMemcacheCache
+from .local import LocalCache
 
 logger = logging.getLogger(__name__)
 
+# marker for a key which is not in memcached
+_NEGATIVE = object()
+
+
+class CircuitBreaker:
+    """
+    Opens after failure_threshold consecutive failures. While the breaker is open, no calls are made
+    for reset_timeout seconds, then the next call is tried again.
+    """
+
+    def __init__(self, failure_threshold=5, reset_timeout=30):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at = None
+
+    def is_open(self):
+        opened_at = self._opened_at
+        return opened_at is not None and time.monotonic() - opened_at < self.reset_timeout
+
+    def success(self):
+        if self._failures:
+            with self._lock:
+                if self._opened_at is not None:
+                    logger.info("memcached is reachable again")
+                self._failures = 0
+                self._opened_at = None
+
+    def failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._failures >= self.failure_threshold:
+                if not self.is_open():
+                    logger.warning("memcached seems to be not reachable, skipping memcached for %s seconds", self.reset_timeout)
+                self._opened_at = time.monotonic()
+
 
 class SSOCache(PyMemcacheCache):
+    """
+    memcached with an in-process L1 cache in front.
+
+    Values and misses (negative caching) of the keys starting with one of SSO_CACHE_L1_KEY_PREFIXES are kept
+    in the L1 cache for a few seconds, so that hot keys need no memcached round trip. The L1 cache is local to
+    the process, changes of other processes are visible after SSO_CACHE_L1_TIMEOUT seconds
+    (SSO_CACHE_L1_NEGATIVE_TIMEOUT for misses). Therefore version, lock and invalidation keys must not use it,
+    the lock keys of get_or_set_single_flight (ending with '.lock') never use it.
+
+    memcached errors are handled like misses. After SSO_CACHE_CIRCUIT_BREAKER_THRESHOLD consecutive errors
+    memcached is skipped for SSO_CACHE_CIRCUIT_BREAKER_TIMEOUT seconds and only the L1 cache is used.
+    get_or_set computes the value of a key only once per process at the same time.
+    """
+    num_locks = 64
+
     def __init__(self, server, params):
         server = server if server else ['127.0.0.1:11211']
         params = params if params is not None else {}
         default_options = {
             'no_delay': True,
-            'ignore_exc': True,
+            'ignore_exc': False,  # errors are handled by the circuit breaker
             'max_pool_size': 4,
             'use_pooling': True,
             'connect_timeout': 1,
@@ -21,13 +82,172 @@ class SSOCache(PyMemcacheCache):
         params['TIMEOUT'] = params.get('TIMEOUT', 300)
         super().__init__(server, params)
 
+        self.l1_timeout = settings.SSO_CACHE_L1_TIMEOUT
+        self.l1_negative_timeout = settings.SSO_CACHE_L1_NEGATIVE_TIMEOUT
+        self.l1 = LocalCache(max_size=settings.SSO_CACHE_L1_SIZE, timeout=self.l1_timeout) if self.l1_timeout > 0 else None
+        self.l1_key_prefixes = tuple(settings.SSO_CACHE_L1_KEY_PREFIXES)
+        self.circuit_breaker = CircuitBreaker(failure_threshold=settings.SSO_CACHE_CIRCUIT_BREAKER_THRESHOLD,
+                                              reset_timeout=settings.SSO_CACHE_CIRCUIT_BREAKER_TIMEOUT)
+        self.stats = Counter()
+        self._locks = [threading.Lock() for i in range(self.num_locks)]
+
+    def get_stats(self):
+        """
+        returns the hit, miss and error counts and the average latency of the memcached calls in milliseconds
+        """
+        stats = dict(self.stats)
+        calls = stats.pop('calls', 0)
+        latency = stats.pop('latency', 0.0)
+        stats['latency_ms'] = 1000 * latency / calls if calls else 0.0
+        return stats
+
+    def _run(self, func, *args, failure_value=None, **kwargs):
+        if self.circuit_breaker.is_open():
+            self.stats['skipped'] += 1
+            return failure_value
+        start = time.perf_counter()
+        try:
+            result = func(*args, **kwargs)
+        except (MemcacheError, OSError) as e:
+            self.stats['errors'] += 1
+            logger.debug("memcached error: %s", e)
+            self.circuit_breaker.failure()
+            return failure_value
+        finally:
+            self.stats['calls'] += 1
+            self.stats['latency'] += time.perf_counter() - start
+        self.circuit_breaker.success()
+        return result
+
+    def is_available(self):
+        return not self.circuit_breaker.is_open()
+
+    def _is_local(self, key):
+        # key without KEY_PREFIX and version
+        return self.l1 is not None and key.startswith(self.l1_key_prefixes) and not key.endswith('.lock')
+
+    def _l1_get(self, key):
+        if self.l1 is None:
+            return None
+        item = self.l1.get(key)
+        if item is None:
+            self.stats['l1_misses'] += 1
+        else:
+            self.stats['l1_hits'] += 1
+        return item
+
+    def _l1_set(self, key, value, timeout=DEFAULT_TIMEOUT):
+        if self.l1 is None:
+            return
+        if timeout is DEFAULT_TIMEOUT or timeout is None:
+            timeout = self.l1_timeout
+        else:
+            timeout = min(self.l1_timeout, timeout)
+        if timeout <= 0:
+            self.l1.delete(key)
+        else:
+            # pickled like in memcached, so that the callers can not change the cached value
+            self.l1.set(key, pickle.dumps(value, pickle.HIGHEST_PROTOCOL), timeout)
+
+    def _l1_delete(self, key):
+        if self.l1 is not None:
+            self.l1.delete(key)
+
     def get(self, key, default=None, version=None):
-        key = self.make_key(key, version=version)
-        self.validate_key(key)
-        val = self._cache.get(key, default)
-        # if memcached is not reachable ('ignore_exc': True)
-        # returns None instead of default
-        if val is None and default is not None:
-            logger.warning("memcached seems to be not reachable")
+        local = self._is_local(key)
+        key = self.make_and_validate_key(key, version=version)
+        if local:
+            item = self._l1_get(key)
+            if item is _NEGATIVE:
+                return default
+            if item is not None:
+                return pickle.loads(item)
+
+        val = self._run(self._cache.get, key, _NEGATIVE, failure_value=_NEGATIVE)
+        if val is _NEGATIVE:
+            self.stats['misses'] += 1
+            if local and not self.circuit_breaker.is_open():
+                self.l1.set(key, _NEGATIVE, self.l1_negative_timeout)
             return default
+        self.stats['hits'] += 1
+        if local:
+            self._l1_set(key, val)
         return val
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        made_key = self.make_and_validate_key(key, version=version)
+        if self._is_local(key):
+            self._l1_set(made_key, value, timeout)
+        self._run(super().set, key, value, timeout=timeout, version=version)
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        made_key = self.make_and_validate_key(key, version=version)
+        local = self._is_local(key)
+        if self.circuit_breaker.is_open():
+            if not local:
+                # without memcached no caller gets a lock, the callers must not wait for each other
+                return False
+            # only the L1 cache is available
+            if self._l1_get(made_key) not in (None, _NEGATIVE):
+                return False
+            self._l1_set(made_key, value, timeout)
+            return True
+        added = self._run(super().add, key, value, timeout=timeout, version=version, failure_value=False)
+        if local:
+            if added:
+                self._l1_set(made_key, value, timeout)
+            else:
+                # the current value is in memcached
+                self._l1_delete(made_key)
+        return added
+
+    def get_or_set(self, key, default, timeout=DEFAULT_TIMEOUT, version=None):
+        """
+        like BaseCache.get_or_set but concurrent calls for the same key in this process wait for one call
+        which computes the value
+        """
+        val = self.get(key, self._missing_key, version=version)
+        if val is not self._missing_key:
+            return val
+        with self._locks[hash(self.make_key(key, version=version)) % self.num_locks]:
+            # computed by a concurrent call
+            val = self.get(key, self._missing_key, version=version)
+            if val is not self._missing_key:
+                return val
+            if callable(default):
+                default = default()
+            self.add(key, default, timeout=timeout, version=version)
+            return self.get(key, default, version=version)
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        return self._run(super().touch, key, timeout=timeout, version=version, failure_value=False)
+
+    def delete(self, key, version=None):
+        self._l1_delete(self.make_and_validate_key(key, version=version))
+        return self._run(super().delete, key, version=version, failure_value=False)
+
+    def get_many(self, keys, version=None):
+        return self._run(super().get_many, keys, version=version, failure_value={})
+
+    def incr(self, key, delta=1, version=None):
+        made_key = self.make_and_validate_key(key, version=version)
+        self._l1_delete(made_key)
+        val = self._run(super().incr, key, delta=delta, version=version)
+        if val is None:
+            raise ValueError("Key '%s' not found" % made_key)
+        return val
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        for key in data:
+            self._l1_delete(self.make_and_validate_key(key, version=version))
+        return self._run(super().set_many, data, timeout=timeout, version=version, failure_value=list(data))
+
+    def delete_many(self, keys, version=None):
+        for key in keys:
+            self._l1_delete(self.make_and_validate_key(key, version=version))
+        self._run(super().delete_many, keys, version=version)
+
+    def clear(self):
+        if self.l1 is not None:
+            self.l1.clear()
+        self._run(super().clear)
@@ -0,0 +1,151 @@
+import threading
+import time
+from unittest import mock
+
+from django.core.cache import cache
+from django.test import SimpleTestCase, override_settings
+from sso.cache.backends import SSOCache
+from sso.cache.utils import get_or_set_single_flight
+
+
+@override_settings(SSO_CACHE_L1_SIZE=100, SSO_CACHE_L1_TIMEOUT=60, SSO_CACHE_L1_NEGATIVE_TIMEOUT=60,
+                   SSO_CACHE_L1_KEY_PREFIXES=['local.'],
+                   SSO_CACHE_CIRCUIT_BREAKER_THRESHOLD=2, SSO_CACHE_CIRCUIT_BREAKER_TIMEOUT=60)
+class SSOCacheTest(SimpleTestCase):
+    def get_cache(self):
+        # no memcached is listening on port 1, every call fails fast
+        return SSOCache(['127.0.0.1:1'], {'OPTIONS': {
+            'ignore_exc': False, 'retry_attempts': 0, 'connect_timeout': 0.1, 'timeout': 0.1}})
+
+    def test_circuit_breaker(self):
+        cache = self.get_cache()
+        self.assertIsNone(cache.get('key1'))
+        self.assertEqual(cache.get('key2', 'default'), 'default')
+        self.assertEqual(cache.stats['errors'], 2)
+        self.assertTrue(cache.circuit_breaker.is_open())
+
+        # memcached is skipped and the values of the local keys are kept in the L1 cache
+        cache.set('local.key3', {'a': 1})
+        value = cache.get('local.key3')
+        self.assertEqual(value, {'a': 1})
+        value['a'] = 2
+        self.assertEqual(cache.get('local.key3'), {'a': 1})
+        self.assertEqual(cache.stats['errors'], 2)
+        self.assertGreater(cache.stats['skipped'], 0)
+
+        cache.delete('local.key3')
+        self.assertIsNone(cache.get('local.key3'))
+        self.assertTrue(cache.add('local.key4', 1))
+        self.assertFalse(cache.add('local.key4', 1))
+
+        # other keys are not cached and no caller gets a lock
+        cache.set('key3', {'a': 1})
+        self.assertIsNone(cache.get('key3'))
+        self.assertRaises(ValueError, cache.incr, 'counter')
+        self.assertFalse(cache.add('counter', 1))
+        self.assertFalse(cache.add('local.key5.lock', 1))
+        self.assertFalse(cache.is_available())
+
+        stats = cache.get_stats()
+        self.assertEqual(stats['errors'], 2)
+        self.assertIn('latency_ms', stats)
+
+    def test_circuit_breaker_reset(self):
+        cache = self.get_cache()
+        cache.circuit_breaker.reset_timeout = 0.1
+        cache.get('key1')
+        cache.get('key2')
+        self.assertTrue(cache.circuit_breaker.is_open())
+        time.sleep(0.2)
+        self.assertFalse(cache.circuit_breaker.is_open())
+        cache.circuit_breaker.success()
+        self.assertFalse(cache.circuit_breaker.is_open())
+
+    def test_negative_caching(self):
+        cache = self.get_cache()
+        cache.circuit_breaker.failure_threshold = 100
+        self.assertIsNone(cache.get('local.key'))
+        self.assertEqual(cache.stats['errors'], 1)
+        # the miss is cached
+        self.assertIsNone(cache.get('local.key'))
+        self.assertEqual(cache.get('local.key', 'default'), 'default')
+        self.assertEqual(cache.stats['errors'], 1)
+        self.assertEqual(cache.stats['l1_hits'], 2)
+
+    def test_not_local_keys(self):
+        cache = self.get_cache()
+        cache.circuit_breaker.failure_threshold = 100
+        # e.g. versions and locks, every call goes to memcached
+        self.assertIsNone(cache.get('version'))
+        self.assertIsNone(cache.get('version'))
+        self.assertEqual(cache.stats['errors'], 2)
+        # the lock keys of get_or_set_single_flight
+        self.assertIsNone(cache.get('local.key.lock'))
+        self.assertIsNone(cache.get('local.key.lock'))
+        self.assertEqual(cache.stats['errors'], 4)
+        self.assertNotIn('l1_hits', cache.stats)
+        self.assertEqual(len(cache.l1._data), 0)
+
+    def test_get_or_set_single_flight(self):
+        cache = self.get_cache()
+        cache.get('key1')
+        cache.get('key2')
+        self.assertTrue(cache.circuit_breaker.is_open())
+
+        calls = []
+        results = []
+        num_threads = 10
+        barrier = threading.Barrier(num_threads)
+
+        def compute():
+            calls.append(1)
+            time.sleep(0.1)
+            return 'value'
+
+        def worker():
+            barrier.wait()
+            results.append(cache.get_or_set('local.key', compute))
+
+        threads = [threading.Thread(target=worker) for i in range(num_threads)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, ['value'] * num_threads)
+
+    def test_single_flight_without_memcached(self):
+        cache = self.get_cache()
+        cache.get('key1')
+        cache.get('key2')
+        self.assertTrue(cache.circuit_breaker.is_open())
+        # nobody can get the lock, so the callers compute the value without waiting
+        with mock.patch('sso.cache.utils.cache', cache), mock.patch('sso.cache.utils.time.sleep') as sleep:
+            self.assertEqual(get_or_set_single_flight('key', lambda: 'value', 60), 'value')
+        sleep.assert_not_called()
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'single-flight-tests'}})
+class SingleFlightTest(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_wait_for_lock(self):
+        # the owner of the lock does not finish, the waiting caller computes the value itself
+        cache.add('key.lock', 'owner', 30)
+        self.assertEqual(get_or_set_single_flight('key', lambda: 'value', 60, max_wait=0.1), 'value')
+        self.assertEqual(cache.get('key.lock'), 'owner')
+        self.assertEqual(get_or_set_single_flight('key', lambda: 'other value', 60), 'value')
+
+    def test_expired_lock(self):
+        def compute():
+            # the lock expires during the computation and another caller takes it
+            cache.set('key.lock', 'owner', 30)
+            return 'value'
+
+        self.assertEqual(get_or_set_single_flight('key', compute, 60), 'value')
+        self.assertEqual(cache.get('key.lock'), 'owner')
+
+    def test_release_lock(self):
+        self.assertEqual(get_or_set_single_flight('key', lambda: 'value', 60), 'value')
+        self.assertIsNone(cache.get('key.lock'))
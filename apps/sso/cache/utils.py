@@ -0,0 +1,84 @@
+import logging
+import time
+import uuid
+from collections import namedtuple
+
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+# value with the time when it must be recomputed, the entry itself stays stale_timeout seconds longer in the cache
+CacheEntry = namedtuple('CacheEntry', ['value', 'fresh_until'])
+
+
+def get_or_set_single_flight(key, default, timeout, stale_timeout=60, lock_timeout=30, max_wait=0.3, wait_interval=0.05):
+    """
+    like cache.get_or_set, but the value is computed by one caller at the same time over all processes.
+
+    The caller which gets the lock key `<key>.lock` computes the value. While a stale value exists, the other
+    callers return the stale value (stale-while-revalidate), if no value exists they wait up to max_wait
+    seconds for the value and then compute it themselves. The lock expires after lock_timeout seconds and
+    is only released by its owner. The value must be deleted from the cache with cache.delete(key).
+    """
+    entry = cache.get(key)
+    if not isinstance(entry, CacheEntry):
+        entry = None
+    elif _is_fresh(entry):
+        return entry.value
+
+    lock_key = f"{key}.lock"
+    # identifies the owner of the lock, an expired lock may have been taken over by another caller
+    token = uuid.uuid4().hex
+    deadline = time.monotonic() + max_wait
+    locked = cache.add(lock_key, token, lock_timeout)
+    while not locked:
+        if entry is not None:
+            # another caller is recomputing the value
+            return entry.value
+        if not is_cache_available():
+            # nobody can get the lock
+            break
+        if time.monotonic() > deadline:
+            logger.info("waiting for the lock %s timed out", lock_key)
+            break
+        time.sleep(wait_interval)
+        entry = cache.get(key)
+        if isinstance(entry, CacheEntry):
+            return entry.value
+        entry = None
+        locked = cache.add(lock_key, token, lock_timeout)
+
+    try:
+        # the value may have been computed between the get and the add of the lock
+        entry = cache.get(key)
+        if isinstance(entry, CacheEntry) and _is_fresh(entry):
+            return entry.value
+        value = default() if callable(default) else default
+        set_cache_entry(key, value, timeout, stale_timeout)
+        return value
+    finally:
+        # not atomic, but a lock which expired during the computation is not deleted
+        if locked and cache.get(lock_key) == token:
+            cache.delete(lock_key)
+
+
+def set_cache_entry(key, value, timeout, stale_timeout=60):
+    """
+    sets the value for get_or_set_single_flight, e.g. after an update of the value
+    """
+    if timeout is None:
+        cache.set(key, CacheEntry(value, None), None)
+    else:
+        cache.set(key, CacheEntry(value, time.time() + timeout), timeout + stale_timeout)
+
+
+def is_cache_available():
+    """
+    False if the cache is known to be not reachable (see SSOCache.is_available)
+    """
+    is_available = getattr(cache, 'is_available', None)
+    return is_available is None or is_available()
+
+
+def _is_fresh(entry):
+    return entry.fresh_until is None or entry.fresh_until > time.time()
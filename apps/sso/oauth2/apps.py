@@ -5,3 +5,8 @@ from django.utils.translation import gettext_lazy as _
 class OAuth2Config(AppConfig):
     name = 'sso.oauth2'
     verbose_name = _("OAuth2")
+
+    def ready(self):
+        # connect the receivers
+        # https://docs.djangoproject.com/en/1.8/topics/signals/
+        from . import signals
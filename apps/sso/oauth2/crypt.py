@@ -4,7 +4,7 @@ import time
 from jwt import decode, encode, InvalidSignatureError, get_unverified_header
 
 from django.conf import settings
-from sso.oauth2.keys import get_default_encoding_key_and_kid, get_decoding_key_by_kid
+from sso.oauth2.keys import get_default_encoding_key_obj_and_kid, get_decoding_key_obj_by_kid
 
 logger = logging.getLogger(__name__)
 
@@ -25,7 +25,7 @@ def make_jwt(payload, max_age=settings.SESSION_COOKIE_AGE, algorithm="RS256"):
     if "exp" not in payload:
         payload["exp"] = int(time.time()) + max_age  # add  expired at time
 
-    key, kid = get_default_encoding_key_and_kid(algorithm)
+    key, kid = get_default_encoding_key_obj_and_kid(algorithm)
     return encode(payload, key=key, algorithm=algorithm, headers={"kid": kid})
 
 
@@ -45,5 +45,5 @@ def loads_jwt(jwt, algorithm="RS256", options=None):
         raise InvalidSignatureError(jwt)
 
     kid = header['kid']
-    key = get_decoding_key_by_kid(kid, algorithm)
+    key = get_decoding_key_obj_by_kid(kid, algorithm)
     return decode(jwt, algorithms=[algorithm], key=key, options=options)
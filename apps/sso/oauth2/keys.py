@@ -1,4 +1,8 @@
+import hashlib
+import json
 import logging
+import time
+import uuid
 from base64 import b64encode, urlsafe_b64encode
 from datetime import timedelta
 
@@ -6,13 +10,16 @@ from cryptography import x509
 from cryptography.hazmat.primitives import hashes, serialization
 from cryptography.hazmat.primitives.asymmetric import rsa
 from cryptography.x509 import OID_COMMON_NAME
+from jwt.algorithms import get_default_algorithms, RSAAlgorithm
 
 from django.conf import settings
 from django.core.cache import cache
 from django.core.management.utils import get_random_secret_key
-from django.db import transaction
+from django.db import connection, transaction
 from django.utils.encoding import force_str
 from django.utils.timezone import now
+from sso.cache.local import LocalCache
+from sso.cache.utils import get_or_set_single_flight
 from sso.components.models import ComponentConfig, Component
 
 logger = logging.getLogger(__name__)
@@ -24,6 +31,33 @@ _CACHE_KEY_SIGNING_CERTS = "signing_certs"
 _CACHE_KEY_SIGNING_CERTS_JWKS = "signing_certs_jwks"
 _CACHE_KEY_PUBLIC_KEYS = "public_keys"
 _CACHE_KEY_DEFAULT_SIGNING_CERT = "default_signing_cert"
+_CACHE_KEY_JWKS = "jwks"
+# changed by every key rotation, so that the other processes clear their parsed keys
+_CACHE_KEY_SIGNING_KEYS_VERSION = "signing_keys_version"
+
+# parsed decoding keys (RSAPublicKey objects or HMAC secrets) indexed by kid and algorithm
+_decoding_key_objs = LocalCache(max_size=settings.SSO_DECODING_KEY_CACHE_SIZE,
+                                timeout=settings.SSO_DECODING_KEY_CACHE_TIMEOUT)
+# parsed default signing key and kid tuple indexed by algorithm
+_encoding_key_objs = LocalCache(max_size=len(_ENCODING_KEYS), timeout=settings.SSO_ENCODING_KEY_CACHE_TIMEOUT)
+# the signing keys version of the parsed keys and the time of the last check
+_local_keys_version = {'version': None, 'checked_at': 0.0}
+
+
+def _check_signing_keys_version():
+    """
+    clears the parsed keys of the current process if the keys were rotated by another process. The version
+    in the shared cache is checked every SSO_SIGNING_KEYS_CHECK_INTERVAL seconds.
+    """
+    now = time.monotonic()
+    if now - _local_keys_version['checked_at'] < settings.SSO_SIGNING_KEYS_CHECK_INTERVAL:
+        return
+    _local_keys_version['checked_at'] = now
+    version = cache.get(_CACHE_KEY_SIGNING_KEYS_VERSION)
+    if version != _local_keys_version['version']:
+        _local_keys_version['version'] = version
+        _encoding_key_objs.clear()
+        _decoding_key_objs.clear()
 
 
 def clear_cache(algorithm=None):
@@ -31,12 +65,16 @@ def clear_cache(algorithm=None):
         for algorithm in ['RS256', 'HS256']:
             clear_cache(algorithm)
     else:
+        cache.set(_CACHE_KEY_SIGNING_KEYS_VERSION, uuid.uuid4().hex, None)
         cache.delete(_CACHE_KEY_LATEST_ENCODING_KEY.format(algorithm))
         if algorithm == 'RS256':
             cache.delete(_CACHE_KEY_SIGNING_CERTS)
             cache.delete(_CACHE_KEY_SIGNING_CERTS_JWKS)
             cache.delete(_CACHE_KEY_DEFAULT_SIGNING_CERT)
             cache.delete(_CACHE_KEY_PUBLIC_KEYS)
+            cache.delete(_CACHE_KEY_JWKS)
+        _encoding_key_objs.delete(algorithm)
+        _decoding_key_objs.clear()
 
 
 def create_rs_key(algorithm_obj):
@@ -104,6 +142,11 @@ def create_key(algorithm, rotate=True):
         component.delete()
 
     clear_cache(algorithm)
+    # the keys may have been loaded again before the commit
+    transaction.on_commit(lambda: clear_cache(algorithm))
+    if algorithm == 'RS256':
+        # publish the new key set right after the rotation
+        transaction.on_commit(get_jwks)
     logger.info(f"Created new {algorithm} key with kid {key_obj.component.uuid.hex}")
     return key_obj
 
@@ -128,6 +171,21 @@ def get_decoding_key_by_kid(kid, algorithm):
     return _get_key_by_kid_and_name(kid, name)
 
 
+def get_decoding_key_obj_by_kid(kid, algorithm):
+    """
+    returns the prepared decoding key for PyJWT from the in-process cache, so that the memcached
+    round trip and the PEM parsing is only done once per kid and worker process
+    """
+    _check_signing_keys_version()
+    cache_key = (kid, algorithm)
+    key_obj = _decoding_key_objs.get(cache_key)
+    if key_obj is None:
+        key = get_decoding_key_by_kid(kid, algorithm)
+        key_obj = get_default_algorithms()[algorithm].prepare_key(key)
+        _decoding_key_objs.set(cache_key, key_obj)
+    return key_obj
+
+
 def get_public_keys():
     algorithm = 'RS256'
 
@@ -140,7 +198,7 @@ def get_public_keys():
             name=_DECODING_KEYS[algorithm]
         ).select_related('component')
 
-    return cache.get_or_set(_CACHE_KEY_PUBLIC_KEYS, _get_public_keys, settings.SSO_SIGNING_KEYS_VALIDITY_PERIOD)
+    return get_or_set_single_flight(_CACHE_KEY_PUBLIC_KEYS, _get_public_keys, settings.SSO_SIGNING_KEYS_VALIDITY_PERIOD)
 
 
 def get_default_cert():
@@ -154,7 +212,7 @@ def get_default_cert():
                 componentconfig__value='True'),
             name='CERTIFICATE').select_related('component').order_by('-component__created_at')[0]
 
-    return cache.get_or_set(_CACHE_KEY_DEFAULT_SIGNING_CERT, _get_default_cert, settings.SSO_SIGNING_KEYS_VALIDITY_PERIOD)
+    return get_or_set_single_flight(_CACHE_KEY_DEFAULT_SIGNING_CERT, _get_default_cert, settings.SSO_SIGNING_KEYS_VALIDITY_PERIOD)
 
 
 def get_certs():
@@ -168,7 +226,7 @@ def get_certs():
                 componentconfig__value='True'),
             name='CERTIFICATE').select_related('component').order_by('-component__created_at'))
 
-    return cache.get_or_set(_CACHE_KEY_SIGNING_CERTS, _get_certs, settings.SSO_SIGNING_KEYS_VALIDITY_PERIOD)
+    return get_or_set_single_flight(_CACHE_KEY_SIGNING_CERTS, _get_certs, settings.SSO_SIGNING_KEYS_VALIDITY_PERIOD)
 
 
 def get_certs_jwks():
@@ -182,33 +240,94 @@ def get_certs_jwks():
             jwks_cert = {
                 'x5t': force_str(urlsafe_b64encode(c.fingerprint(hashes.SHA1()))).rstrip("="),
                 'x5t#S256': force_str(urlsafe_b64encode(c.fingerprint(hashes.SHA256()))).rstrip("="),
-                'x5c': [force_str(b64encode(x509.load_pem_x509_certificate(cert.value.encode()).public_bytes(serialization.Encoding.DER)))]
+                'x5c': [force_str(b64encode(c.public_bytes(serialization.Encoding.DER)))]
             }
             certs[cert.component.uuid.hex] = jwks_cert
         return certs
 
-    return cache.get_or_set(_CACHE_KEY_SIGNING_CERTS_JWKS, _get_certs_jwks, settings.SSO_SIGNING_KEYS_VALIDITY_PERIOD)
-
-
-def get_default_encoding_key_and_kid(algorithm):
-    def get_or_create_key():
+    return get_or_set_single_flight(_CACHE_KEY_SIGNING_CERTS_JWKS, _get_certs_jwks, settings.SSO_SIGNING_KEYS_VALIDITY_PERIOD)
+
+
+def get_jwks():
+    """
+    returns the serialized jwks document of the active RS256 keys and its ETag. The document is computed once
+    per key set and deleted from the cache by the key rotation.
+    """
+    def _get_jwks():
+        certs = get_certs_jwks()
+        rsa256 = RSAAlgorithm(RSAAlgorithm.SHA256)
+        keys = []
+        for pub_key in get_public_keys():
+            key_obj = rsa256.prepare_key(pub_key.value)
+            key = json.loads(RSAAlgorithm.to_jwk(key_obj))
+            key["kid"] = pub_key.component.uuid.hex
+            key["alg"] = pub_key.component.name
+            key["use"] = "sig"
+            if pub_key.component.uuid.hex in certs:
+                key.update(certs[pub_key.component.uuid.hex])
+            keys.append(key)
+        content = json.dumps({'keys': keys}, ensure_ascii=False).encode('utf-8')
+        etag = '"%s"' % hashlib.sha256(content).hexdigest()
+        return content, etag
+
+    return get_or_set_single_flight(_CACHE_KEY_JWKS, _get_jwks, settings.SSO_SIGNING_KEYS_VALIDITY_PERIOD)
+
+
+def _get_default_key(algorithm):
+    return ComponentConfig.objects.filter(
+        component__in=Component.objects.filter(
+            name=algorithm,
+            # created_at__gt=now() - timedelta(seconds=settings.SSO_SIGNING_KEYS_VALIDITY_PERIOD),
+            componentconfig__name='DEFAULT',
+            componentconfig__value='True'),
+        name=_ENCODING_KEYS[algorithm]).select_related('component').latest()
+
+
+def get_or_create_default_key(algorithm):
+    """
+    returns the default signing key and creates it if it does not exist. The creation is serialized with a
+    transaction level advisory lock, so that concurrent callers of all processes create only one key, also
+    if the caller is inside an outer transaction.
+    """
+    try:
+        return _get_default_key(algorithm)
+    except ComponentConfig.DoesNotExist:
+        pass
+    with transaction.atomic():
+        if connection.vendor == 'postgresql':
+            lock_id = int.from_bytes(hashlib.sha256(f"{__name__}.{algorithm}".encode()).digest()[:8], 'big', signed=True)
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT pg_advisory_xact_lock(%s)", [lock_id])
         try:
-            key = ComponentConfig.objects.filter(
-                component__in=Component.objects.filter(
-                    name=algorithm,
-                    # created_at__gt=now() - timedelta(seconds=settings.SSO_SIGNING_KEYS_VALIDITY_PERIOD),
-                    componentconfig__name='DEFAULT',
-                    componentconfig__value='True'),
-                name=_ENCODING_KEYS[algorithm]).select_related('component').latest()
+            # another caller may have created the key while we were waiting for the lock
+            return _get_default_key(algorithm)
         except ComponentConfig.DoesNotExist:
-            key = create_key(algorithm)
-        return key
+            return create_key(algorithm)
+
 
+def get_default_encoding_key_and_kid(algorithm):
     cache_key = _CACHE_KEY_LATEST_ENCODING_KEY.format(algorithm)
-    key_obj = cache.get_or_set(cache_key, get_or_create_key, settings.SSO_SIGNING_KEYS_VALIDITY_PERIOD)
+    key_obj = get_or_set_single_flight(cache_key, lambda: get_or_create_default_key(algorithm),
+                                       settings.SSO_SIGNING_KEYS_VALIDITY_PERIOD)
     return key_obj.value, key_obj.component.uuid.hex
 
 
+def get_default_encoding_key_obj_and_kid(algorithm):
+    """
+    returns the prepared default signing key for PyJWT and its kid from the in-process cache.
+    The key and the kid are stored as one tuple, so that a rotation replaces both at once.
+    Other worker processes pick up a rotated key after SSO_SIGNING_KEYS_CHECK_INTERVAL, which is
+    fine because the previous default key stays active and published in the jwks.
+    """
+    _check_signing_keys_version()
+    key_obj_and_kid = _encoding_key_objs.get(algorithm)
+    if key_obj_and_kid is None:
+        key, kid = get_default_encoding_key_and_kid(algorithm)
+        key_obj_and_kid = get_default_algorithms()[algorithm].prepare_key(key), kid
+        _encoding_key_objs.set(algorithm, key_obj_and_kid)
+    return key_obj_and_kid
+
+
 def get_secret(kid=None):
     if kid is None:
         secret, _ = get_default_encoding_key_and_kid('HS256')
@@ -18,3 +18,7 @@ class Command(BaseCommand):
         # Refresh Tokens are valid for REFRESH_TOKEN_LIFE_TIME days and are deleted
         # automatically when they BearerToken are deleted.
         BearerToken.objects.filter(created_at__lt=refresh_token_life_time).delete()
+        if settings.SSO_STATELESS_ACCESS_TOKENS:
+            # BearerToken without refresh token from before the stateless mode are not needed any more
+            access_token_life_time = timezone.now() - timedelta(seconds=settings.SSO_ACCESS_TOKEN_AGE)
+            BearerToken.objects.filter(refresh_token__isnull=True, created_at__lt=access_token_life_time).delete()
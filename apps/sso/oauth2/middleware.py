@@ -1,5 +1,6 @@
 import logging
 import time
+from collections import Counter
 
 from jwt import InvalidTokenError
 
@@ -17,12 +18,17 @@ from django.utils.functional import SimpleLazyObject, empty
 from django.utils.http import http_date
 from sso import auth as sso_auth
 from sso.auth import verify_session_auth_hash
+from sso.sessions.backends import jwt_cookies
 from .crypt import loads_jwt
-from .models import Client
+from .registry import get_client
+from .token_cache import access_token_cache
 from .views import get_oidc_session_state
 
 logger = logging.getLogger(__name__)
 
+# number of session cookie responses with 'set' and 'skipped' Set-Cookie headers of the current process
+session_cookie_counter = Counter()
+
 
 class IterableLazyObject(SimpleLazyObject):
     def __iter__(self):
@@ -47,8 +53,12 @@ def get_auth_data_from_token(access_token):
     try:
         if not access_token:
             return AnonymousUser(), None, set()
+        if settings.SSO_ACCESS_TOKEN_CACHE_ENABLED:
+            auth_data = access_token_cache.get(access_token)
+            if auth_data is not None:
+                return auth_data
         data = loads_jwt(access_token)
-        client = Client.objects.get(uuid=data['aud'])
+        client = get_client(data['aud'])
 
         user = get_user_model().objects.get(uuid=data['sub'])
         session_hash_verified = verify_session_auth_hash(data, user, client)
@@ -62,6 +72,8 @@ def get_auth_data_from_token(access_token):
     except (ObjectDoesNotExist, InvalidTokenError, ValueError) as e:
         logger.warning(e)
         return AnonymousUser(), None, set()
+    if settings.SSO_ACCESS_TOKEN_CACHE_ENABLED:
+        access_token_cache.set(access_token, data['exp'], user, client, scopes)
     return user, client, scopes
 
 
@@ -70,7 +82,7 @@ def get_auth_data_from_cookie(request, with_client_and_scopes=False):
     scopes = set()
     if with_client_and_scopes:  # get a client id for using the API in the Browser
         try:
-            client = Client.objects.get(uuid=settings.SSO_BROWSER_CLIENT_ID)
+            client = get_client(settings.SSO_BROWSER_CLIENT_ID)
             scopes = set(client.scopes.split())
         except ObjectDoesNotExist:
             pass
@@ -116,6 +128,17 @@ class OAuthAuthenticationMiddleware(AuthenticationMiddleware):
 
 
 class SsoSessionMiddleware(SessionMiddleware):
+    @staticmethod
+    def is_cookie_unchanged(request, max_age):
+        """
+        True if the browser has the session cookie already. The JWT session key contains the expiry
+        and the oidc session state depends only on the session key, so that a new Set-Cookie header is
+        only needed for a cookie with max_age, which expires relative to the current time.
+        """
+        return (isinstance(request.session, jwt_cookies.SessionStore)
+                and not settings.SESSION_SAVE_EVERY_REQUEST and max_age is None
+                and request.COOKIES.get(settings.SESSION_COOKIE_NAME) == request.session.session_key)
+
     def process_response(self, request, response):
         """
         If request.session was modified, or if the configuration is to save the
@@ -166,6 +189,10 @@ class SsoSessionMiddleware(SessionMiddleware):
                             "request completed. The user may have logged "
                             "out in a concurrent request, for example."
                         )
+                    if self.is_cookie_unchanged(request, max_age):
+                        session_cookie_counter['skipped'] += 1
+                        return response
+                    session_cookie_counter['set'] += 1
                     response.set_cookie(
                         settings.SESSION_COOKIE_NAME,
                         request.session.session_key, max_age=max_age,
@@ -1,4 +1,6 @@
 import logging
+import time
+import uuid
 from urllib.parse import urlparse, urlsplit, urlunsplit
 
 from django.conf import settings
@@ -6,17 +8,20 @@ from django.contrib.auth.models import Permission
 from django.contrib.contenttypes.models import ContentType
 from django.core.cache import cache
 from django.core.exceptions import ObjectDoesNotExist, ValidationError
-from django.db import models
+from django.db import models, transaction
 from django.http import QueryDict
 from django.urls import reverse
 from django.utils.crypto import get_random_string
 from django.utils.encoding import force_str
+from django.utils.functional import cached_property
 from django.utils.safestring import mark_safe
 from django.utils.translation import gettext_lazy as _
 from sso.accounts.models import Application, User, ApplicationAdmin
 from sso.auth.models import Device
+from sso.cache.utils import CacheEntry, get_or_set_single_flight, is_cache_available, set_cache_entry
 from sso.models import AbstractBaseModel, AbstractBaseModelManager
 from sso.registration import default_username_generator
+from sso.utils.url import get_origin
 
 logger = logging.getLogger(__name__)
 
@@ -30,10 +35,7 @@ def replace_query_param(url, attr, val):
 
 
 def check_redirect_uri(client, redirect_uri):
-    if redirect_uri in client.redirect_uris.split():
-        return True
-    else:
-        return False
+    return redirect_uri in client.redirect_uri_set
 
 
 def get_oauth2_cancel_url(redirect_to):
@@ -41,11 +43,12 @@ def get_oauth2_cancel_url(redirect_to):
     If the redirect_to parameter comes from OAuth2 it contains a redirect_uri, to
     which we want to redirect if the user cancels login
     """
+    from sso.oauth2.registry import get_client
     query_dict = QueryDict(urlsplit(redirect_to).query)
     if ('redirect_uri' in query_dict) and ('client_id' in query_dict):
         redirect_uri = query_dict['redirect_uri']
         try:
-            client = Client.objects.get(uuid=query_dict['client_id'])
+            client = get_client(query_dict['client_id'])
             if check_redirect_uri(client, redirect_uri):
                 redirect_uri = replace_query_param(redirect_uri, 'error', 'access_denied')
                 return redirect_uri
@@ -121,40 +124,85 @@ def get_clients_by_response_type(response_type):
     return clients
 
 
+_CACHE_KEY_CLIENT_URI_INDEX = "client_uri_index"
+# the lock of get_or_set_single_flight, so that an update waits for a running rebuild
+_CACHE_KEY_CLIENT_URI_INDEX_LOCK = "client_uri_index.lock"
+
+
 def get_default_secret():
     return get_random_string(30)
 
 
 class ClientManager(AbstractBaseModelManager):
+    """
+    The hosts and post_logout_redirect_uris of all active clients are kept in an index in the cache.
+    After the commit of a Client save or delete (see sso.oauth2.signals) only the entry of this client
+    is replaced in the index. The index is only rebuilt from all clients if it is missing from the
+    cache or older than SSO_CLIENT_URI_INDEX_TIMEOUT.
+    """
+    @staticmethod
+    def _make_uri_index(clients):
+        hosts = {settings.SSO_DOMAIN}
+        post_logout_redirect_uris = set()
+        for client_hosts, client_post_logout_redirect_uris in clients.values():
+            hosts.update(client_hosts)
+            post_logout_redirect_uris.update(client_post_logout_redirect_uris)
+        return {
+            'clients': clients,
+            'allowed_hosts': hosts,
+            'post_logout_redirect_uris': post_logout_redirect_uris
+        }
+
+    def _build_uri_index(self):
+        return self._make_uri_index({client.pk: client.get_uri_index_entry() for client in self.filter(is_active=True)})
+
+    def get_uri_index(self):
+        return get_or_set_single_flight(_CACHE_KEY_CLIENT_URI_INDEX, self._build_uri_index,
+                                        settings.SSO_CLIENT_URI_INDEX_TIMEOUT)
+
+    def update_uri_index(self, client, deleted=False):
+        """
+        replaces the entry of the client in the index after the commit
+        """
+        # the pk of a deleted client is set to None after the post_delete signal
+        pk = client.pk
+        entry = None if deleted or not client.is_active else client.get_uri_index_entry()
+        transaction.on_commit(lambda: self._update_uri_index(pk, entry))
+
+    def _update_uri_index(self, pk, entry, max_wait=2, wait_interval=0.05):
+        token = uuid.uuid4().hex
+        deadline = time.monotonic() + max_wait
+        while not cache.add(_CACHE_KEY_CLIENT_URI_INDEX_LOCK, token, 30):
+            if not is_cache_available() or time.monotonic() > deadline:
+                # the index is rebuilt with the next usage instead of losing the update
+                logger.warning("waiting for the lock %s timed out", _CACHE_KEY_CLIENT_URI_INDEX_LOCK)
+                cache.delete(_CACHE_KEY_CLIENT_URI_INDEX)
+                return
+            time.sleep(wait_interval)
+        try:
+            index_entry = cache.get(_CACHE_KEY_CLIENT_URI_INDEX)
+            if isinstance(index_entry, CacheEntry):
+                clients = dict(index_entry.value['clients'])
+                clients.pop(pk, None)
+                if entry is not None:
+                    clients[pk] = entry
+                index = self._make_uri_index(clients)
+            else:
+                # the clients are committed, so the index is complete
+                index = self._build_uri_index()
+            set_cache_entry(_CACHE_KEY_CLIENT_URI_INDEX, index, settings.SSO_CLIENT_URI_INDEX_TIMEOUT)
+        finally:
+            if cache.get(_CACHE_KEY_CLIENT_URI_INDEX_LOCK) == token:
+                cache.delete(_CACHE_KEY_CLIENT_URI_INDEX_LOCK)
+
     def get_allowed_hosts(self):
         """
         all host from active client redirect_uris and default_redirect_uri are allowed
         """
-        hosts = cache.get('allowed_hosts')
-        if hosts is None:
-            hosts = {settings.SSO_DOMAIN}
-            for client in self.filter(is_active=True):
-                redirect_uris = client.redirect_uris.split() + [client.default_redirect_uri]
-                for redirect_uri in redirect_uris:
-                    if redirect_uri:
-                        netloc = urlparse(redirect_uri)[1]
-                        if netloc:
-                            hosts.add(netloc)
-            cache.set('allowed_hosts', hosts)
-
-        return hosts
+        return self.get_uri_index()['allowed_hosts']
 
     def get_post_logout_redirect_uris(self):
-        post_logout_redirect_uris = cache.get('post_logout_redirect_uris')
-        if post_logout_redirect_uris is None:
-            post_logout_redirect_uris = set()
-            for client in self.filter(is_active=True):
-                for post_logout_redirect_uri in client.post_logout_redirect_uris.split():
-                    if post_logout_redirect_uri:
-                        post_logout_redirect_uris.add(post_logout_redirect_uri)
-            cache.set('post_logout_redirect_uris', post_logout_redirect_uris)
-
-        return post_logout_redirect_uris
+        return self.get_uri_index()['post_logout_redirect_uris']
 
 
 def allowed_hosts():
@@ -223,6 +271,30 @@ class Client(AbstractBaseModel):
     def get_absolute_url(self):
         return reverse('oauth2:client.details.json', args=[str(self.id)])
 
+    @cached_property
+    def redirect_uri_set(self):
+        return frozenset(self.redirect_uris.split())
+
+    @cached_property
+    def allowed_origins(self):
+        origins = (get_origin(redirect_uri) for redirect_uri in self.redirect_uris.split())
+        return frozenset(origin for origin in origins if origin is not None)
+
+    def is_origin_allowed(self, origin):
+        return get_origin(origin) in self.allowed_origins
+
+    def get_uri_index_entry(self):
+        """
+        returns the hosts of the redirect uris and the post logout redirect uris for the ClientManager uri index
+        """
+        hosts = set()
+        for redirect_uri in self.redirect_uris.split() + [self.default_redirect_uri]:
+            if redirect_uri:
+                netloc = urlparse(redirect_uri)[1]
+                if netloc:
+                    hosts.add(netloc)
+        return frozenset(hosts), frozenset(self.post_logout_redirect_uris.split())
+
     @property
     def has_supported_client_type(self):
         allowed_client_types = {x[0] for x in ALLOWED_CLIENT_TYPES}
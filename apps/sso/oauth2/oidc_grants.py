@@ -81,6 +81,8 @@ class RefreshTokenGrantEx(GrantTypeBase):
 
     def add_id_token(self, token, token_handler, request):
         # if not request.scopes or 'openid' not in request.scopes:
+        # the id_token claims are taken from the claim context of the request (see oidc_token.get_claim_context),
+        # which was filled by the access token generator
         return super().add_id_token(token, token_handler, request)
 
 
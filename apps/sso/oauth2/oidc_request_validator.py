@@ -5,6 +5,7 @@ from uuid import UUID
 from django.utils.crypto import constant_time_compare
 from jwt import InvalidTokenError
 
+from django.conf import settings
 from django.contrib.auth import authenticate, get_user_model
 from django.core import signing
 from django.core.exceptions import ObjectDoesNotExist, ValidationError
@@ -13,10 +14,11 @@ from django.utils.encoding import force_bytes
 from oauthlib.oauth2 import FatalClientError
 from oauthlib.openid.connect.core.request_validator import RequestValidator
 from .crypt import loads_jwt
-from .models import BearerToken, RefreshToken, AuthorizationCode, Client, check_redirect_uri, CONFIDENTIAL_CLIENTS, \
+from .models import BearerToken, RefreshToken, AuthorizationCode, check_redirect_uri, CONFIDENTIAL_CLIENTS, \
     CLIENT_RESPONSE_TYPES
 from .oidc_token import get_idtoken_finalizer
-from ..api.response import same_origin
+from .registry import get_client
+from .write_behind import token_write_behind_queue
 
 logger = logging.getLogger(__name__)
 
@@ -36,7 +38,7 @@ class OIDCRequestValidator(RequestValidator):
             assert (request.client.uuid == UUID(client_id))
         else:
             try:
-                request.client = Client.objects.get(uuid=client_id, is_active=True)
+                request.client = get_client(client_id, is_active=True)
             except ValidationError as e:
                 raise FatalClientError(e)
         return request.client
@@ -47,11 +49,7 @@ class OIDCRequestValidator(RequestValidator):
 
     def is_origin_allowed(self, client_id, origin, request, *args, **kwargs):
         client = self._get_client(client_id, request)
-        for redirect_uri in client.redirect_uris.split():
-             if same_origin(redirect_uri, origin):
-                 return True
-
-        return False
+        return client.is_origin_allowed(origin)
 
     def get_code_challenge(self, code, request):
         return request.client.authorization_code.code_challenge or None
@@ -165,7 +163,10 @@ class OIDCRequestValidator(RequestValidator):
                 user = request.client.user
                 if user:
                     user.last_login = timezone.now()
-                    user.save(update_fields=['last_login'])
+                    if settings.SSO_TOKEN_WRITE_BEHIND_ENABLED:
+                        token_write_behind_queue.add_last_login(user, user.last_login)
+                    else:
+                        user.save(update_fields=['last_login'])
                     request.user = user
                     return True
                 else:
@@ -236,6 +237,13 @@ class OIDCRequestValidator(RequestValidator):
 
     def save_bearer_token(self, token, request, *args, **kwargs):
         if 'access_token' in token:
+            if 'refresh_token' not in token:
+                if settings.SSO_STATELESS_ACCESS_TOKENS:
+                    # the BearerToken row is only needed for the refresh token
+                    return
+                if settings.SSO_TOKEN_WRITE_BEHIND_ENABLED:
+                    token_write_behind_queue.add_bearer_token(request.client, request.user, token['access_token'])
+                    return
             bearer_token = BearerToken.objects.create(client=request.client, access_token=token['access_token'],
                                                       user=request.user)
             if 'refresh_token' in token:
@@ -264,7 +272,7 @@ class OIDCRequestValidator(RequestValidator):
                 logger.debug('Bearer Token with no scope')
             user = get_user_model().objects.get(uuid=data['sub'])
             request.user = user
-            request.client = Client.objects.get(uuid=data['aud'], is_active=True)
+            request.client = get_client(data['aud'], is_active=True)
         except (ObjectDoesNotExist, signing.BadSignature, ValueError):
             return False
         return True
@@ -1,7 +1,7 @@
 import calendar
 import logging
 import time
-from functools import lru_cache
+from functools import lru_cache, cached_property
 from urllib.parse import urlsplit
 
 from django.conf import settings
@@ -20,39 +20,88 @@ def get_iss_from_absolute_uri(abs_uri):
     return f"{r.scheme}://{r.netloc}"
 
 
+class ClaimContext:
+    """
+    Claims which are shared between the access token and the id_token of one oauthlib request.
+    The values are computed on first use.
+    """
+
+    def __init__(self, request):
+        self.request = request
+        self.user = request.user
+        self.client = request.client
+
+    @cached_property
+    def iss(self):
+        return get_iss_from_absolute_uri(self.request.uri)
+
+    @cached_property
+    def acr(self):
+        return '2' if self.user.is_verified else '1'
+
+    @cached_property
+    def email(self):
+        return force_str(self.user.primary_email())
+
+    @cached_property
+    def session_auth_hash(self):
+        return get_session_auth_hash(self.user, self.client)
+
+    @cached_property
+    def roles(self):
+        return get_roles(self.user, self.client)
+
+    def get_roles(self):
+        # the caller may modify the list
+        return self.roles if isinstance(self.roles, str) else list(self.roles)
+
+
+def get_claim_context(request):
+    """
+    returns the ClaimContext of the oauthlib request, a new one when the user or client has changed
+    """
+    context = getattr(request, '_sso_claim_context', None)
+    if context is None or context.user is not request.user or context.client is not request.client:
+        context = ClaimContext(request)
+        request._sso_claim_context = context
+    return context
+
+
 def get_token_claim_set(request, max_age=settings.SSO_ACCESS_TOKEN_AGE):
     user = request.user
+    context = get_claim_context(request)
     claim_set = {
         'jti': get_random_string(12),
-        'iss': get_iss_from_absolute_uri(request.uri),
+        'iss': context.iss,
         'sub': user.uuid.hex,  # required
         'aud': request.client.client_id,  # required
         'exp': int(time.time()) + max_age,  # required
         'iat': int(time.time()),  # required
-        'acr': '2' if user.is_verified else '1',
+        'acr': context.acr,
         'scope': ' '.join(request.scopes),  # custom, required
-        'email': force_str(user.primary_email()),  # custom
+        'email': context.email,  # custom
         'name': user.username,  # custom
         # session authentication hash,
-        HASH_SESSION_KEY: get_session_auth_hash(user, request.client),  # custom, required
+        HASH_SESSION_KEY: context.session_auth_hash,  # custom, required
     }
     if request.client.application:
-        claim_set['roles'] = get_roles(user, request.client)
+        claim_set['roles'] = context.get_roles()
     return claim_set
 
 
 def get_roles(user, client):
+    """
+    roles claim of the user for the client application with one roles and at most one organisations query
+    """
     roles_type = client.roles_type
+    role_names = user.get_role_names_by_app(client.application.uuid)
     if roles_type == Client.ROLE_LIST:
-        return [role for role in user.get_roles_by_app(client.application.uuid).values_list('name', flat=True)]
+        return list(role_names)
     elif roles_type == Client.ROLE_LIST_WITH_ORGANISATIONS:
-        roles = []
-        for organisation in user.organisations.all():
-            for role in user.get_roles_by_app(client.application.uuid).values_list('name', flat=True):
-                roles.append(f"{organisation.name.replace(' ', '-')}-{role}")
-        return roles
+        organisation_names = [name.replace(' ', '-') for name in user.organisations.values_list('name', flat=True)]
+        return [f"{organisation_name}-{role}" for organisation_name in organisation_names for role in role_names]
     else:
-        return ' '.join(user.get_roles_by_app(client.application.uuid).values_list('name', flat=True))  # custom
+        return ' '.join(role_names)  # custom
 
 
 def default_token_generator(request, max_age=settings.SSO_ACCESS_TOKEN_AGE):
@@ -65,20 +114,21 @@ def get_idtoken_claim_set(request, max_age=settings.SSO_ID_TOKEN_AGE):
     The generated id_token contains additionally email, name and roles
     """
     user = request.user
+    context = get_claim_context(request)
     auth_time = int(calendar.timegm(user.last_login.utctimetuple()))
     claim_set = {
-        'iss': get_iss_from_absolute_uri(request.uri),
+        'iss': context.iss,
         'sub': user.uuid.hex,
         'exp': int(time.time()) + max_age,
         'auth_time': auth_time,  # required when max_age is in the request
-        'acr': '2' if user.is_verified else '1',
-        'email': force_str(user.primary_email()),  # custom
+        'acr': context.acr,
+        'email': context.email,  # custom
         'name': user.username,  # custom
         'given_name': user.first_name,  # custom
         'family_name': user.last_name,  # custom
     }
     if request.client.application:
-        claim_set['roles'] = get_roles(user, request.client)
+        claim_set['roles'] = context.get_roles()
     return claim_set
 
 
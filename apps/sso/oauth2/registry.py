@@ -0,0 +1,107 @@
+import copy
+import logging
+import threading
+import time
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from sso.oauth2.models import Client
+
+logger = logging.getLogger(__name__)
+
+_CACHE_KEY_CLIENT_REGISTRY_VERSION = "client_registry_version"
+
+
+class ClientRegistry:
+    """
+    In-memory registry of all clients of the current worker process.
+
+    The clients are loaded once with their precomputed redirect uri set and allowed origins.
+    A Client save or delete (see sso.oauth2.signals) resets the registry of the current process
+    and changes the version in the shared cache, which the other processes check every
+    SSO_CLIENT_REGISTRY_CHECK_INTERVAL seconds. Independent of the version the clients are
+    reloaded after SSO_CLIENT_REGISTRY_TIMEOUT seconds.
+    """
+
+    def __init__(self, check_interval, timeout):
+        self.check_interval = check_interval
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._clients = None
+        self._version = None
+        self._loaded_at = 0
+        self._checked_at = 0
+
+    def _is_stale(self):
+        if self._clients is None:
+            return True
+        now = time.monotonic()
+        if now - self._loaded_at > self.timeout:
+            return True
+        if now - self._checked_at > self.check_interval:
+            self._checked_at = now
+            return cache.get(_CACHE_KEY_CLIENT_REGISTRY_VERSION) != self._version
+        return False
+
+    def _load(self):
+        # read the version before the clients, so that a concurrent change causes a reload
+        version = cache.get(_CACHE_KEY_CLIENT_REGISTRY_VERSION)
+        clients = {}
+        for client in Client.objects.all():
+            # precompute the indexes, they are shared with the copies
+            client.redirect_uri_set, client.allowed_origins
+            clients[client.uuid] = client
+        now = time.monotonic()
+        self._clients, self._version, self._loaded_at, self._checked_at = clients, version, now, now
+        logger.debug("loaded %d clients into the client registry", len(clients))
+        return clients
+
+    def _get_clients(self):
+        loaded_at = self._loaded_at
+        clients = self._clients
+        if self._is_stale():
+            with self._lock:
+                clients = self._clients
+                # another thread may have reloaded the clients in the meantime
+                if clients is None or self._loaded_at == loaded_at:
+                    clients = self._load()
+        return clients
+
+    def get(self, client_id, is_active=None):
+        """
+        returns a copy of the client with the uuid client_id, like
+        Client.objects.get(uuid=client_id[, is_active=is_active])
+        """
+        if not isinstance(client_id, uuid.UUID):
+            # raises ValidationError like the ORM
+            client_id = Client._meta.get_field('uuid').to_python(client_id)
+        client = self._get_clients().get(client_id)
+        if client is None or (is_active is not None and client.is_active != is_active):
+            raise Client.DoesNotExist(f"Client {client_id} does not exist.")
+        # callers set attributes on the client (e.g. authorization_code)
+        return copy.copy(client)
+
+    def clear(self):
+        with self._lock:
+            self._clients = None
+
+    def invalidate(self):
+        def invalidate():
+            # the clients may have been reloaded before the commit
+            self.clear()
+            cache.set(_CACHE_KEY_CLIENT_REGISTRY_VERSION, uuid.uuid4().hex, None)
+        self.clear()
+        transaction.on_commit(invalidate)
+
+
+client_registry = ClientRegistry(check_interval=settings.SSO_CLIENT_REGISTRY_CHECK_INTERVAL,
+                                 timeout=settings.SSO_CLIENT_REGISTRY_TIMEOUT)
+
+
+def get_client(client_id, is_active=None):
+    if not settings.SSO_CLIENT_REGISTRY_ENABLED:
+        filters = {} if is_active is None else {'is_active': is_active}
+        return Client.objects.get(uuid=client_id, **filters)
+    return client_registry.get(client_id, is_active)
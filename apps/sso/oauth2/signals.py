@@ -0,0 +1,52 @@
+from django.conf import settings
+from django.db.models.signals import post_save, post_delete
+from django.dispatch.dispatcher import receiver
+from sso.accounts.models import User
+from sso.oauth2.models import Client
+from sso.oauth2.registry import client_registry
+from sso.oauth2.token_cache import update_user_version, update_client_version, delete_user_version, \
+    delete_client_version
+from sso.utils.loaddata import disable_for_loaddata
+
+
+@receiver(post_save, sender=User)
+@disable_for_loaddata
+def update_access_token_cache_user_version(sender, instance, **kwargs):
+    if settings.SSO_ACCESS_TOKEN_CACHE_ENABLED:
+        update_user_version(instance)
+
+
+@receiver(post_delete, sender=User)
+def delete_access_token_cache_user_version(sender, instance, **kwargs):
+    if settings.SSO_ACCESS_TOKEN_CACHE_ENABLED:
+        delete_user_version(instance)
+
+
+@receiver(post_save, sender=Client)
+@disable_for_loaddata
+def update_access_token_cache_client_version(sender, instance, **kwargs):
+    if settings.SSO_ACCESS_TOKEN_CACHE_ENABLED:
+        update_client_version(instance)
+
+
+@receiver(post_delete, sender=Client)
+def delete_access_token_cache_client_version(sender, instance, **kwargs):
+    if settings.SSO_ACCESS_TOKEN_CACHE_ENABLED:
+        delete_client_version(instance)
+
+
+@receiver(post_save, sender=Client)
+@receiver(post_delete, sender=Client)
+def invalidate_client_registry(sender, instance, **kwargs):
+    # also for loaddata, the registry must not keep clients from a previous fixture
+    client_registry.invalidate()
+
+
+@receiver(post_save, sender=Client)
+def update_client_uri_index(sender, instance, **kwargs):
+    Client.objects.update_uri_index(instance)
+
+
+@receiver(post_delete, sender=Client)
+def delete_from_client_uri_index(sender, instance, **kwargs):
+    Client.objects.update_uri_index(instance, deleted=True)
@@ -1,18 +1,39 @@
 import base64
 import hashlib
 import re
+import threading
 
 from django.core import mail
-from time import sleep
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from time import sleep, time
 from urllib.parse import urlsplit
 
+from jwt import get_unverified_header
+from oauthlib.common import Request
+
 from django.conf import settings
-from django.http import QueryDict, SimpleCookie
-from django.test import TestCase
+from django.contrib.sessions.backends.signed_cookies import SessionStore as SignedCookiesSessionStore
+from django.db import connection, transaction, IntegrityError
+from django.http import QueryDict, SimpleCookie, HttpResponse
+from django.test import override_settings, RequestFactory
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from django.utils.crypto import get_random_string
+from sso.accounts.models import User
+from sso.components.models import Component
+from sso.organisations.models import Organisation
+from sso.sessions.backends import jwt_cookies
 from sso.test.client import SSOClient
-from . import crypt
+from sso.test.testcases import SSOTestCase, SSOTransactionTestCase
+from . import crypt, keys
+from .middleware import get_auth_data_from_token, SsoSessionMiddleware, session_cookie_counter
+from .models import Client, BearerToken
+from .oidc_token import get_roles, get_token_claim_set, get_idtoken_claim_set
+from .registry import client_registry, get_client, _CACHE_KEY_CLIENT_REGISTRY_VERSION
+from .token_cache import access_token_cache
+from .views import token_throttle_key
+from .write_behind import token_write_behind_queue
 
 
 def get_query_dict(url):
@@ -27,13 +48,14 @@ def get_fragment_dict(url):
     return fragment_dict
 
 
-class OAuth2BaseTestCase(TestCase):
+class OAuth2BaseTestCase(SSOTestCase):
     fixtures = ['roles.json', 'test_l10n_data.json', 'test_organisation_data.json', 'app_roles.json',
                 'test_app_roles.json', 'test_user_data.json', 'test_oauth2_data.json']
     _client_id = "ec1e39cbe3e746c787b770ace4165d13"
     _state = 'eyJub25jZSI6Ik1sSllaUlc3VWdGdyIsInByb3ZpZGVyIjoyLCJuZXh0IjoiLyJ9'
 
     def setUp(self):
+        super().setUp()
         self.client = SSOClient()
 
     def logout(self):
@@ -533,6 +555,249 @@ class OAuth2Tests(OAuth2BaseTestCase):
         self.assertEqual('invalid_request', query_dict['error'])
         self.assertEqual('Code challenge required.', query_dict['error_description'])
 
+    @override_settings(SSO_ACCESS_TOKEN_CACHE_ENABLED=True)
+    def test_access_token_cache(self):
+        access_token = self.get_authorization().split()[1]
+        access_token_cache.clear()
+        user, client, scopes = get_auth_data_from_token(access_token)
+        self.assertTrue(user.is_authenticated)
+
+        with self.assertNumQueries(0):
+            cached_user, cached_client, cached_scopes = get_auth_data_from_token(access_token)
+        self.assertEqual((user, client, scopes), (cached_user, cached_client, cached_scopes))
+        self.assertIsNot(user, cached_user)
+
+        # a password change invalidates the cached access token
+        user.set_password('new_password')
+        user.save()
+        user, client, scopes = get_auth_data_from_token(access_token)
+        self.assertFalse(user.is_authenticated)
+
+    @override_settings(SSO_ACCESS_TOKEN_CACHE_ENABLED=True)
+    def test_access_token_cache_stale_fill(self):
+        access_token = self.get_authorization().split()[1]
+        access_token_cache.clear()
+        # a request read the user before a password change and fills the cache afterwards
+        stale_user, client, scopes = get_auth_data_from_token(access_token)
+        user = User.objects.get(pk=stale_user.pk)
+        user.set_password('new_password')
+        user.save()
+        access_token_cache.clear()
+        access_token_cache.set(access_token, int(time()) + 60, stale_user, client, scopes)
+
+        # the stale version neither overwrites the new version nor is the token cached
+        self.assertIsNone(access_token_cache.get(access_token))
+        user, client, scopes = get_auth_data_from_token(access_token)
+        self.assertFalse(user.is_authenticated)
+
+    def test_client_registry(self):
+        client = get_client(self._client_id)
+        with self.assertNumQueries(0):
+            self.assertEqual(client, get_client(self._client_id, is_active=True))
+            self.assertIsNot(client, get_client(self._client_id))
+            self.assertTrue(client.is_origin_allowed('http://localhost'))
+            self.assertFalse(client.is_origin_allowed('http://localhost:8000'))
+            self.assertRaises(ValidationError, get_client, 'invalid')
+
+        # a client change resets the registry
+        client.is_active = False
+        client.save()
+        self.assertRaises(Client.DoesNotExist, get_client, self._client_id, is_active=True)
+        client.is_active = True
+        client.save()
+        self.assertTrue(self.get_authorization().startswith('Bearer'))
+
+    def test_client_registry_invalidation_after_commit(self):
+        client = get_client(self._client_id)
+        clients = client_registry._clients
+        version = cache.get(_CACHE_KEY_CLIENT_REGISTRY_VERSION)
+        with self.captureOnCommitCallbacks(execute=True):
+            client.is_active = False
+            client.save()
+            # a concurrent request reloads the clients before the commit
+            client_registry._clients = clients
+        self.assertRaises(Client.DoesNotExist, get_client, self._client_id, is_active=True)
+        # the other processes reload the clients
+        self.assertNotEqual(cache.get(_CACHE_KEY_CLIENT_REGISTRY_VERSION), version)
+
+    def test_client_uri_index(self):
+        self.assertNotIn('example.test', Client.objects.get_allowed_hosts())
+        with self.captureOnCommitCallbacks(execute=True):
+            client = Client.objects.create(name='test', redirect_uris='https://example.test/callback',
+                                           post_logout_redirect_uris='https://example.test/logout')
+            # a concurrent request builds the index before the commit
+            self.assertIn('example.test', Client.objects.get_allowed_hosts())
+        # the entry of the client is updated in the index without a rebuild
+        with self.assertNumQueries(0):
+            self.assertIn('example.test', Client.objects.get_allowed_hosts())
+            self.assertIn('https://example.test/logout', Client.objects.get_post_logout_redirect_uris())
+
+        with self.captureOnCommitCallbacks(execute=True):
+            client.redirect_uris = 'https://example2.test/callback'
+            client.save()
+        with self.assertNumQueries(0):
+            self.assertIn('example2.test', Client.objects.get_allowed_hosts())
+            self.assertNotIn('example.test', Client.objects.get_allowed_hosts())
+
+        with self.captureOnCommitCallbacks(execute=True):
+            client.is_active = False
+            client.save()
+            self.assertIn('example2.test', Client.objects.get_allowed_hosts())
+        with self.assertNumQueries(0):
+            self.assertNotIn('example2.test', Client.objects.get_allowed_hosts())
+            self.assertNotIn('https://example.test/logout', Client.objects.get_post_logout_redirect_uris())
+
+        with self.captureOnCommitCallbacks(execute=True):
+            client.is_active = True
+            client.save()
+        self.assertIn('example2.test', Client.objects.get_allowed_hosts())
+        with self.captureOnCommitCallbacks(execute=True):
+            client.delete()
+        with self.assertNumQueries(0):
+            self.assertNotIn('example2.test', Client.objects.get_allowed_hosts())
+
+    def test_client_uri_index_rollback(self):
+        self.assertNotIn('example.test', Client.objects.get_allowed_hosts())
+        with self.assertRaises(IntegrityError):
+            with transaction.atomic():
+                Client.objects.create(name='test', redirect_uris='https://example.test/callback')
+                raise IntegrityError()
+        self.assertNotIn('example.test', Client.objects.get_allowed_hosts())
+
+    def test_get_roles_query_count(self):
+        client = Client.objects.get(uuid=self._client_id)
+        client.roles_type = Client.ROLE_LIST_WITH_ORGANISATIONS
+        user = User.objects.get(username='GunnarScherf')
+
+        def get_roles_and_query_count():
+            with CaptureQueriesContext(connection) as context:
+                roles = get_roles(User.objects.get(pk=user.pk), client)
+            return roles, len(context.captured_queries)
+
+        roles, query_count = get_roles_and_query_count()
+        self.assertEqual(user.organisations.count(), 1)
+        organisations = list(Organisation.objects.exclude(user=user))
+        self.assertTrue(organisations)
+        user.organisations.add(*organisations)
+
+        # the number of queries does not depend on the number of organisations
+        all_roles, all_query_count = get_roles_and_query_count()
+        self.assertEqual(query_count, all_query_count)
+        self.assertEqual(len(all_roles), len(roles) * (len(organisations) + 1))
+
+    def test_claim_context(self):
+        request = Request('http://testserver/oauth2/token/')
+        request.user = User.objects.get(username='GunnarScherf')
+        request.client = Client.objects.get(uuid=self._client_id)
+        request.scopes = ['openid', 'profile', 'email']
+        token_claim_set = get_token_claim_set(request)
+
+        # the id_token reuses the claims of the access token
+        with self.assertNumQueries(0):
+            id_token_claim_set = get_idtoken_claim_set(request)
+        for claim in ['iss', 'acr', 'email', 'roles']:
+            self.assertEqual(token_claim_set[claim], id_token_claim_set[claim])
+
+    @override_settings(SSO_STATELESS_ACCESS_TOKENS=True)
+    def test_stateless_access_tokens(self):
+        bearer_token_count = BearerToken.objects.count()
+        authorization = self.get_authorization()
+        self.assertEqual(BearerToken.objects.count(), bearer_token_count)
+        response = self.client.get(reverse('api:v2_users_me'), HTTP_AUTHORIZATION=authorization)
+        self.assertEqual(response.status_code, 200)
+
+        # tokens with a refresh token are stored
+        client_id = '5614cdb0aa3c48d59828681bd62e1741'
+        code = self.login_and_get_code(client_id=client_id, scope='openid profile email offline_access')
+        token_data = {
+            'grant_type': "authorization_code",
+            'redirect_uri': "http://localhost",
+            'client_secret': "geheim",
+            'client_id': client_id,
+            'code': code,
+        }
+        token = self.token_request(token_data).json()
+        self.assertTrue(BearerToken.objects.filter(refresh_token__token=token['refresh_token']).exists())
+
+    @override_settings(SSO_TOKEN_WRITE_BEHIND_ENABLED=True)
+    def test_token_write_behind(self):
+        client = Client.objects.get(uuid='b740653ccaa14feba7e223c609896672')
+        last_login = client.user.last_login
+        bearer_token_count = BearerToken.objects.count()
+
+        authorization = self.get_authorization_with_client_credentials(client_id=client.client_id, scope="openid")
+        self.assertEqual(BearerToken.objects.count(), bearer_token_count)
+        self.assertEqual(len(token_write_behind_queue), 2)
+
+        token_write_behind_queue.flush()
+        self.assertEqual(len(token_write_behind_queue), 0)
+        self.assertTrue(BearerToken.objects.filter(access_token=authorization.split()[1]).exists())
+        client.user.refresh_from_db()
+        self.assertNotEqual(client.user.last_login, last_login)
+
+    def test_unchanged_session_cookie(self):
+        self.client.login(username='GunnarScherf', password='gsf')
+        session_key = self.client.cookies[settings.SESSION_COOKIE_NAME].value
+        request = RequestFactory().get('/')
+        request.COOKIES[settings.SESSION_COOKIE_NAME] = session_key
+        request.session = jwt_cookies.SessionStore(session_key)
+        self.assertIsNotNone(request.session.get('_auth_user_id'))
+        request.session.modified = True
+
+        skipped = session_cookie_counter['skipped']
+        middleware = SsoSessionMiddleware(lambda r: HttpResponse())
+        response = middleware.process_response(request, HttpResponse())
+        self.assertNotIn(settings.SESSION_COOKIE_NAME, response.cookies)
+        self.assertNotIn(settings.SSO_OIDC_SESSION_COOKIE_NAME, response.cookies)
+        self.assertEqual(session_cookie_counter['skipped'], skipped + 1)
+
+        # changed data
+        request.session['last_modified'] = 1
+        response = middleware.process_response(request, HttpResponse())
+        self.assertNotEqual(response.cookies[settings.SESSION_COOKIE_NAME].value, session_key)
+        self.assertIn(settings.SSO_OIDC_SESSION_COOKIE_NAME, response.cookies)
+
+    def test_unchanged_session_cookie_refresh(self):
+        self.client.login(username='GunnarScherf', password='gsf')
+        session_key = self.client.cookies[settings.SESSION_COOKIE_NAME].value
+        request = RequestFactory().get('/')
+        request.COOKIES[settings.SESSION_COOKIE_NAME] = session_key
+        request.session = jwt_cookies.SessionStore(session_key)
+        middleware = SsoSessionMiddleware(lambda r: HttpResponse())
+
+        # the expiry of the cookie is refreshed
+        for setting in [{'SESSION_SAVE_EVERY_REQUEST': True}, {'SESSION_EXPIRE_AT_BROWSER_CLOSE': False}]:
+            with override_settings(**setting):
+                request.session.modified = True
+                response = middleware.process_response(request, HttpResponse())
+                self.assertEqual(response.cookies[settings.SESSION_COOKIE_NAME].value, session_key)
+                self.assertIn(settings.SSO_OIDC_SESSION_COOKIE_NAME, response.cookies)
+
+        # other session backends
+        request.session = SignedCookiesSessionStore()
+        request.session['_auth_user_id'] = '1'
+        request.session.save()
+        request.COOKIES[settings.SESSION_COOKIE_NAME] = request.session.session_key
+        response = middleware.process_response(request, HttpResponse())
+        self.assertIn(settings.SESSION_COOKIE_NAME, response.cookies)
+
+    def test_token_throttle_key(self):
+        client = Client.objects.get(uuid=self._client_id)
+
+        def get_key(data, **extra):
+            return token_throttle_key(RequestFactory().post('/', data, REMOTE_ADDR='192.0.2.1', **extra))
+
+        client_key = 'token.%s.192.0.2.1' % client.client_id
+        self.assertEqual(get_key({'client_id': client.client_id, 'client_secret': client.client_secret}), client_key)
+        credentials = base64.b64encode(('%s:%s' % (client.client_id, client.client_secret)).encode()).decode()
+        self.assertEqual(get_key({}, HTTP_AUTHORIZATION='Basic %s' % credentials), client_key)
+
+        # without valid client credentials only the address is used
+        for data in [{'client_id': client.client_id}, {'client_id': client.client_id, 'client_secret': 'wrong'},
+                     {'client_id': 'invalid', 'client_secret': 'wrong'}, {}]:
+            self.assertEqual(get_key(data), 'token.192.0.2.1')
+        self.assertEqual(get_key({}, HTTP_X_FORWARDED_FOR='198.51.100.1'), 'token.192.0.2.1')
+
     def test_get_token_failure(self):
         code = self.login_and_get_code()
         token_data = {
@@ -565,3 +830,134 @@ class OAuth2Tests(OAuth2BaseTestCase):
         self.assertIn('error', token)
         expected = {'error': 'invalid_grant'}
         self.assertTrue(set(expected.items()).issubset(set(token.items())))
+
+
+class KeysTests(SSOTestCase):
+    def test_decoding_key_cache(self):
+        jwt = crypt.make_jwt({'sub': 'test'})
+        kid = get_unverified_header(jwt)['kid']
+        key_obj = keys.get_decoding_key_obj_by_kid(kid, 'RS256')
+        self.assertIs(key_obj, keys.get_decoding_key_obj_by_kid(kid, 'RS256'))
+        self.assertEqual(crypt.loads_jwt(jwt)['sub'], 'test')
+
+        # rotating the keys invalidates the parsed keys
+        keys.create_key('RS256')
+        self.assertIsNot(key_obj, keys.get_decoding_key_obj_by_kid(kid, 'RS256'))
+        self.assertEqual(crypt.loads_jwt(jwt)['sub'], 'test')
+
+    def test_encoding_key_cache(self):
+        key_obj, kid = keys.get_default_encoding_key_obj_and_kid('RS256')
+        self.assertEqual((key_obj, kid), keys.get_default_encoding_key_obj_and_kid('RS256'))
+
+        # the 2-nd active key becomes the default after the rotation
+        keys.create_key('RS256')
+        keys.create_key('RS256')
+        new_key_obj, new_kid = keys.get_default_encoding_key_obj_and_kid('RS256')
+        self.assertNotEqual(kid, new_kid)
+        jwt = crypt.make_jwt({'sub': 'test'})
+        self.assertEqual(get_unverified_header(jwt)['kid'], new_kid)
+        self.assertEqual(crypt.loads_jwt(jwt)['sub'], 'test')
+
+    def test_key_rotation_of_other_process(self):
+        key_obj, kid = keys.get_default_encoding_key_obj_and_kid('RS256')
+        jwt = crypt.make_jwt({'sub': 'test'})
+        decoding_key_obj = keys.get_decoding_key_obj_by_kid(kid, 'RS256')
+
+        # another process rotates the keys and changes the version in the shared cache
+        cache.set(keys._CACHE_KEY_SIGNING_KEYS_VERSION, 'other process')
+        # the parsed keys are cleared with the next check
+        keys._local_keys_version['checked_at'] = 0.0
+        self.assertIsNot(decoding_key_obj, keys.get_decoding_key_obj_by_kid(kid, 'RS256'))
+        self.assertIsNot(key_obj, keys.get_default_encoding_key_obj_and_kid('RS256')[0])
+        self.assertEqual(crypt.loads_jwt(jwt)['sub'], 'test')
+
+    def test_jwks(self):
+        response = self.client.get(reverse('oauth2:jwks'))
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+        self.assertIn('max-age=%d' % settings.SSO_JWKS_MAX_AGE, response['Cache-Control'])
+        kids = [key['kid'] for key in response.json()['keys']]
+        self.assertTrue(kids)
+
+        response = self.client.get(reverse('oauth2:jwks'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        # the rotation publishes a new key set
+        key_obj = keys.create_key('RS256')
+        response = self.client.get(reverse('oauth2:jwks'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertIn(key_obj.component.uuid.hex, [key['kid'] for key in response.json()['keys']])
+
+    @override_settings(SSO_SESSION_PAYLOAD_CACHE_ENABLED=True)
+    def test_session_payload_cache(self):
+        session = jwt_cookies.SessionStore()
+        session['_auth_user_id'] = '1'
+        session.save()
+        session_key = session.session_key
+
+        session = jwt_cookies.SessionStore(session_key)
+        self.assertEqual(session['_auth_user_id'], '1')
+        self.assertIn(session_key, jwt_cookies._payloads)
+
+        # unchanged data is not encoded again
+        session.save()
+        self.assertEqual(session.session_key, session_key)
+        session['last_modified'] = 1
+        session.save()
+        self.assertNotEqual(session.session_key, session_key)
+        self.assertEqual(jwt_cookies.SessionStore(session.session_key)['last_modified'], 1)
+
+
+class KeysConcurrencyTests(SSOTransactionTestCase):
+    def tearDown(self):
+        keys.clear_cache()
+
+    def test_rotate_keys_under_load(self):
+        keys.clear_cache()
+        Component.objects.filter(name='HS256').delete()
+        keys.create_key('RS256')
+        num_threads = 8
+        barrier = threading.Barrier(num_threads + 1)
+        stop = threading.Event()
+        errors = []
+        hs256_kids = set()
+
+        def load():
+            try:
+                barrier.wait()
+                while not stop.is_set():
+                    hs256_kids.add(keys.get_default_encoding_key_and_kid('HS256')[1])
+                    keys.get_default_encoding_key_and_kid('RS256')
+                    keys.get_certs_jwks()
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=load) for i in range(num_threads)]
+        for thread in threads:
+            thread.start()
+        barrier.wait()
+        for i in range(3):
+            keys.create_key('RS256')
+            sleep(0.1)
+        stop.set()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        # the missing HS256 key is created only once
+        self.assertEqual(len(hs256_kids), 1)
+        self.assertEqual(Component.objects.filter(name='HS256').count(), 1)
+
+    def test_create_default_key_once(self):
+        Component.objects.filter(name='HS256').delete()
+        cache_key = keys._CACHE_KEY_LATEST_ENCODING_KEY.format('HS256')
+        # another process holds the lock of the cache entry and the waiting callers time out
+        cache.add(f"{cache_key}.lock", 'other', 30)
+        kid = keys.get_default_encoding_key_and_kid('HS256')[1]
+        cache.delete(cache_key)
+        with transaction.atomic():
+            self.assertEqual(keys.get_default_encoding_key_and_kid('HS256')[1], kid)
+        self.assertEqual(Component.objects.filter(name='HS256').count(), 1)
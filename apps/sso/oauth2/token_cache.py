@@ -0,0 +1,104 @@
+import copy
+import hashlib
+import logging
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.crypto import salted_hmac
+from django.utils.encoding import force_bytes
+from sso.auth import get_session_auth_hash
+from sso.cache.local import LocalCache
+
+logger = logging.getLogger(__name__)
+
+_CACHE_KEY_USER_VERSION = "access_token_cache.user.{0}"
+_CACHE_KEY_CLIENT_VERSION = "access_token_cache.client.{0}"
+# version of a deleted user or client, never equal to a computed version
+_DELETED_VERSION = "deleted"
+
+
+def get_user_version(user):
+    # changes with the password, is_active (session auth hash) and any other saved user data
+    return f"{get_session_auth_hash(user)}.{user.last_modified.timestamp()}"
+
+
+def get_client_version(client):
+    data = f"{client.client_secret}.{client.is_active}.{client.last_modified.timestamp()}"
+    return salted_hmac('access_token_cache', data, algorithm='sha256').hexdigest()[:10]
+
+
+def update_user_version(user):
+    cache.set(_CACHE_KEY_USER_VERSION.format(user.pk), get_user_version(user), settings.SSO_ACCESS_TOKEN_AGE)
+
+
+def update_client_version(client):
+    cache.set(_CACHE_KEY_CLIENT_VERSION.format(client.pk), get_client_version(client), settings.SSO_ACCESS_TOKEN_AGE)
+
+
+def delete_user_version(user):
+    # a tombstone instead of a delete, so that a concurrent cache fill can not add the old version again
+    cache.set(_CACHE_KEY_USER_VERSION.format(user.pk), _DELETED_VERSION, settings.SSO_ACCESS_TOKEN_AGE)
+
+
+def delete_client_version(client):
+    cache.set(_CACHE_KEY_CLIENT_VERSION.format(client.pk), _DELETED_VERSION, settings.SSO_ACCESS_TOKEN_AGE)
+
+
+class AccessTokenCache:
+    """
+    Per process LRU cache of verified access tokens.
+
+    The entries are indexed by the sha256 digest of the access token and expire at the latest
+    with the token. A user or client change is detected with a version in the shared cache, which
+    is updated by the post_save signals (see sso.oauth2.signals). Changes done with
+    QuerySet.update() are not detected, they are visible after SSO_ACCESS_TOKEN_CACHE_TIMEOUT.
+    """
+
+    def __init__(self, max_size, timeout):
+        self.timeout = timeout
+        self._cache = LocalCache(max_size=max_size, timeout=timeout)
+
+    @staticmethod
+    def _get_key(access_token):
+        return hashlib.sha256(force_bytes(access_token)).hexdigest()
+
+    def get(self, access_token):
+        key = self._get_key(access_token)
+        entry = self._cache.get(key)
+        if entry is None:
+            return None
+
+        user, client, scopes, user_version, client_version = entry
+        user_key = _CACHE_KEY_USER_VERSION.format(user.pk)
+        client_key = _CACHE_KEY_CLIENT_VERSION.format(client.pk)
+        versions = cache.get_many([user_key, client_key])
+        if versions.get(user_key) != user_version or versions.get(client_key) != client_version:
+            self._cache.delete(key)
+            return None
+        # every request gets its own copy of the model instances
+        return copy.copy(user), copy.copy(client), set(scopes)
+
+    def set(self, access_token, exp, user, client, scopes):
+        timeout = min(self.timeout, exp - int(time.time()))
+        if timeout <= 0:
+            return
+        user_version = get_user_version(user)
+        client_version = get_client_version(client)
+        user_key = _CACHE_KEY_USER_VERSION.format(user.pk)
+        client_key = _CACHE_KEY_CLIENT_VERSION.format(client.pk)
+        cache.add(user_key, user_version, settings.SSO_ACCESS_TOKEN_AGE)
+        cache.add(client_key, client_version, settings.SSO_ACCESS_TOKEN_AGE)
+        versions = cache.get_many([user_key, client_key])
+        if versions.get(user_key) != user_version or versions.get(client_key) != client_version:
+            # the user or client was changed after it was read
+            return
+        entry = (copy.copy(user), copy.copy(client), frozenset(scopes), user_version, client_version)
+        self._cache.set(self._get_key(access_token), entry, timeout)
+
+    def clear(self):
+        self._cache.clear()
+
+
+access_token_cache = AccessTokenCache(max_size=settings.SSO_ACCESS_TOKEN_CACHE_SIZE,
+                                      timeout=settings.SSO_ACCESS_TOKEN_CACHE_TIMEOUT)
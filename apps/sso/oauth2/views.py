@@ -1,9 +1,9 @@
 import json
 import logging
+from functools import lru_cache
 from urllib.parse import urlparse, urlunparse, urlsplit, urlunsplit
 
 from jwt import InvalidTokenError
-from jwt.algorithms import RSAAlgorithm
 from oauthlib import oauth2
 from oauthlib.common import Request
 from oauthlib.common import urlencode, urlencoded, quote
@@ -12,11 +12,13 @@ from oauthlib.oauth2.rfc6749.utils import scope_to_list
 from django.conf import settings
 from django.contrib.auth import REDIRECT_FIELD_NAME
 from django.contrib.auth.decorators import permission_required, login_required
+from django.core.exceptions import ObjectDoesNotExist, ValidationError
 from django.http import HttpResponseRedirect, HttpResponse, QueryDict
 from django.http.response import HttpResponseRedirectBase, Http404
 from django.shortcuts import render, get_object_or_404, resolve_url
 from django.urls import reverse
-from django.utils.crypto import salted_hmac
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.crypto import constant_time_compare, salted_hmac
 from django.utils.decorators import method_decorator
 from django.utils.encoding import iri_to_uri, force_str
 from django.views import View
@@ -25,17 +27,21 @@ from django.views.decorators.clickjacking import xframe_options_exempt
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.vary import vary_on_headers
 from django.views.generic import TemplateView
-from sso.api.response import JsonHttpResponse, same_origin
+from sso.api.response import JsonHttpResponse, add_cors_header
 from sso.api.views.generic import PreflightMixin
 from sso.auth.utils import is_recent_auth_time
 from sso.auth.views import TWO_FACTOR_PARAM
 from sso.middleware import revision_exempt
 from sso.utils.http import get_request_param
 from sso.utils.url import get_base_url
+from throttle.decorators import throttle
+from throttle.limiters import client_addr
 from .crypt import loads_jwt
-from .keys import get_public_keys, get_certs, get_certs_jwks
+from .keys import get_certs, get_jwks
 from .models import Client
+from .oidc_request_validator import get_client_id_and_secret_from_auth_header
 from .oidc_server import oidc_server
+from .registry import get_client
 
 logger = logging.getLogger(__name__)
 
@@ -141,21 +147,18 @@ class JwksView(PreflightMixin, View):
         """
         jwks_uri view (http://openid.net/specs/openid-connect-discovery-1_0.html#ProviderMetadata)
         """
-        certs = get_certs_jwks()
-
-        rsa256 = RSAAlgorithm(RSAAlgorithm.SHA256)
-        keys = []
-        for pub_key in get_public_keys():
-            key_obj = rsa256.prepare_key(pub_key.value)
-            key = json.loads(RSAAlgorithm.to_jwk(key_obj))
-            key["kid"] = pub_key.component.uuid.hex
-            key["alg"] = pub_key.component.name
-            key["use"] = "sig"
-            if pub_key.component.uuid.hex in certs:
-                key.update(certs[pub_key.component.uuid.hex])
-            keys.append(key)
-        data = {'keys': keys}
-        return JsonHttpResponse(data, request, allow_jsonp=True, public_cors=True)
+        content, etag = get_jwks()
+        if request.GET.get('callback'):
+            # jsonp
+            return JsonHttpResponse(json.loads(content), request, allow_jsonp=True, public_cors=True)
+
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            response = HttpResponse(content, content_type='application/json; charset=utf-8;')
+        response['ETag'] = etag
+        patch_cache_control(response, public=True, max_age=settings.SSO_JWKS_MAX_AGE)
+        add_cors_header(request.META.get('HTTP_ORIGIN'), None, response, public_cors=True)
+        return response
 
 
 class CertsView(PreflightMixin, View):
@@ -184,11 +187,13 @@ class SessionView(TemplateView):
 def session_init(request):
     client_id = request.GET.get('client_id')
     origin = request.GET.get('origin')
-    client = get_object_or_404(Client, uuid=client_id)
+    try:
+        client = get_client(client_id)
+    except (ObjectDoesNotExist, ValidationError):
+        raise Http404()
 
-    for redirect_uri in client.redirect_uris.split():
-        if same_origin(redirect_uri, origin):
-            return HttpResponse(status=204)
+    if client.is_origin_allowed(origin):
+        return HttpResponse(status=204)
     return Http404()
 
 
@@ -217,13 +222,18 @@ def redirect_to_login(request, redirect_field_name=REDIRECT_FIELD_NAME, two_fact
     return HttpResponseRedirect(urlunparse(login_url_parts))
 
 
+@lru_cache(maxsize=1024)
+def _get_oidc_session_state(session_key):
+    key_salt = 'get_oidc_session_state'
+    return salted_hmac(key_salt, session_key, algorithm='sha256').hexdigest()
+
+
 def get_oidc_session_state(request):
     if request.session.session_key is None:
         data = ""
     else:
         data = request.session.session_key
-    key_salt = 'get_oidc_session_state'
-    return salted_hmac(key_salt, data, algorithm='sha256').hexdigest()
+    return _get_oidc_session_state(data)
 
 
 class TwoFactorRequiredError(oauth2.OAuth2Error):
@@ -314,11 +324,40 @@ def token(request):
     return response
 
 
+def token_throttle_key(request):
+    """
+    the client address, and the client_id if the client authenticated with its client_secret, so that the
+    confidential clients behind a shared address are throttled separately. The client_id of a request
+    without valid client credentials is not used, because every request could send another client_id.
+    """
+    addr = client_addr(request)
+    client_id, client_secret = request.POST.get('client_id'), request.POST.get('client_secret')
+    if not client_id:
+        try:
+            client_id, client_secret = get_client_id_and_secret_from_auth_header(request)
+        except (TypeError, ValueError, UnicodeDecodeError):
+            client_id = None
+    if client_id and client_secret:
+        try:
+            client = get_client(client_id, is_active=True)
+        except (ObjectDoesNotExist, ValidationError):
+            client = None
+        if client is not None and constant_time_compare(client.client_secret, client_secret):
+            return 'token.{client_id}.{addr}'.format(client_id=client.client_id, addr=addr)
+    return 'token.{addr}'.format(addr=addr)
+
+
+def token_throttled(request):
+    return JsonHttpResponse(data={'error': 'slow_down', 'error_description': 'Too many token requests.'}, status=429)
+
+
 class TokenView(PreflightMixin, View):
     http_method_names = ['post', 'options']
 
     @method_decorator(revision_exempt)
     @method_decorator(csrf_exempt)
+    @method_decorator(throttle(duration=settings.SSO_TOKEN_THROTTLING_DURATION, max_calls=settings.SSO_TOKEN_THROTTLING_MAX_CALLS,
+                               response=token_throttled, key=token_throttle_key))
     def dispatch(self, request, *args, **kwargs):
         return super().dispatch(request, *args, **kwargs)
 
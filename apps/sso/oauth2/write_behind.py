@@ -0,0 +1,78 @@
+import atexit
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import DatabaseError
+from sso.oauth2.models import BearerToken
+
+logger = logging.getLogger(__name__)
+
+
+class TokenWriteBehindQueue:
+    """
+    Bounded in-process queue for the BearerToken rows of access tokens without refresh token
+    and the last_login updates of the client_credentials users.
+
+    The queue is written with bulk_create and bulk_update when it has max_size entries or when
+    the oldest entry is older than interval seconds. The check is done when an entry is added
+    and at the exit of the process, so the rows are written at the latest with the next token
+    request of the process. created_at of the BearerToken rows is the time of the write.
+    """
+
+    def __init__(self, max_size, interval):
+        self.max_size = max_size
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._bearer_tokens = []
+        self._last_logins = {}
+        self._first_added_at = None
+
+    def __len__(self):
+        return len(self._bearer_tokens) + len(self._last_logins)
+
+    def add_bearer_token(self, client, user, access_token):
+        with self._lock:
+            self._bearer_tokens.append(BearerToken(client_id=client.pk, user_id=user.pk, access_token=access_token))
+            self._added()
+        self._flush_if_due()
+
+    def add_last_login(self, user, last_login):
+        with self._lock:
+            self._last_logins[user.pk] = last_login
+            self._added()
+        self._flush_if_due()
+
+    def _added(self):
+        if self._first_added_at is None:
+            self._first_added_at = time.monotonic()
+
+    def _flush_if_due(self):
+        first_added_at = self._first_added_at
+        if first_added_at is None:
+            return
+        if len(self) >= self.max_size or time.monotonic() - first_added_at >= self.interval:
+            self.flush()
+
+    def flush(self):
+        with self._lock:
+            bearer_tokens, self._bearer_tokens = self._bearer_tokens, []
+            last_logins, self._last_logins = self._last_logins, {}
+            self._first_added_at = None
+
+        try:
+            if bearer_tokens:
+                BearerToken.objects.bulk_create(bearer_tokens, ignore_conflicts=True)
+            if last_logins:
+                user_model = get_user_model()
+                users = [user_model(pk=pk, last_login=last_login) for pk, last_login in last_logins.items()]
+                user_model.objects.bulk_update(users, ['last_login'])
+        except DatabaseError:
+            logger.exception("failed to write %d bearer tokens and %d last logins", len(bearer_tokens), len(last_logins))
+
+
+token_write_behind_queue = TokenWriteBehindQueue(max_size=settings.SSO_TOKEN_WRITE_BEHIND_MAX_SIZE,
+                                                 interval=settings.SSO_TOKEN_WRITE_BEHIND_INTERVAL)
+atexit.register(token_write_behind_queue.flush)
@@ -1,15 +1,16 @@
 from django.conf import settings
-from django.test import TransactionTestCase
 from django.urls import reverse
 from sso.organisations.forms import OrganisationEmailAdminForm
 from sso.organisations.models import OrganisationCountry, Organisation, AdminRegion
 from sso.test.client import SSOClient
+from sso.test.testcases import SSOTransactionTestCase
 
 
-class OrganisationsTest(TransactionTestCase):
+class OrganisationsTest(SSOTransactionTestCase):
     fixtures = ['roles.json', 'app_roles.json', 'test_l10n_data.json', 'test_organisation_data.json', 'test_app_roles.json', 'test_user_data.json']
 
     def setUp(self):
+        super().setUp()
         self.client = SSOClient()
 
     def tearDown(self):
@@ -453,13 +453,7 @@ class OrganisationList(ListView):
         qs = super().get_queryset().prefetch_related('email', 'organisationpicture_set', 'organisation_country__country', 'admin_region')
         return self.apply_filters(qs)
 
-    def get_context_data(self, **kwargs):
-        headers = list(self.cl.result_headers())
-        num_sorted_fields = 0
-        for h in headers:
-            if h['sortable'] and h['sorted']:
-                num_sorted_fields += 1
-
+    def get_filters(self):
         my_organisations_filter = MyOrganisationsFilter().get(self)
 
         if multiple_associations():
@@ -494,6 +488,14 @@ class OrganisationList(ListView):
         if self.request.user.is_organisation_admin:
             filters.append(IsActiveFilter().get(self))
             filters.append(IsLiveFilter().get(self))
+        return filters
+
+    def get_context_data(self, **kwargs):
+        headers = list(self.cl.result_headers())
+        num_sorted_fields = 0
+        for h in headers:
+            if h['sortable'] and h['sorted']:
+                num_sorted_fields += 1
 
         context = {
             'result_headers': headers,
@@ -502,7 +504,9 @@ class OrganisationList(ListView):
             'page_var': main.PAGE_VAR,
             'query': self.request.GET.get(main.SEARCH_VAR, ''),
             'cl': self.cl,
-            'filters': filters,
+            # the template calls get_filters only if the filters are not in the fragment cache
+            'filters': self.get_filters,
+            'filters_cache_key': self.cl.get_cache_key(self.request.user.id),
         }
         context.update(kwargs)
         return super().get_context_data(**context)
@@ -7,11 +7,12 @@ from selenium.webdriver.support.select import Select
 
 from django.conf import settings
 from django.core import mail
-from django.test import TestCase, override_settings
+from django.test import override_settings
 from django.urls import reverse
 from sso.organisations.models import Organisation
 from sso.registration import default_username_generator
 from sso.test.client import SSOClient
+from sso.test.testcases import SSOTestCase
 from sso.tests import SSOSeleniumTests
 
 
@@ -52,12 +53,13 @@ class RegistrationSeleniumTests(SSOSeleniumTests):
         self.selenium.find_element(by=By.XPATH, value='//button[@name="_edit_again"]')
 
 
-class RegistrationTest(TestCase):
+class RegistrationTest(SSOTestCase):
     fixtures = ['roles.json', 'app_roles.json', 'test_l10n_data.json', 'test_organisation_data.json',
                 'test_app_roles.json',
                 'test_user_data.json']
 
     def setUp(self):
+        super().setUp()
         os.environ['RECAPTCHA_TESTING'] = 'True'
         self.client = SSOClient()
 
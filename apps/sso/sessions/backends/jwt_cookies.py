@@ -1,18 +1,40 @@
+import copy
 import logging
+import time
 
 from jwt import InvalidTokenError
 
 from django.conf import settings
 from django.contrib.sessions.backends.signed_cookies import SessionStore as SignedCookiesSessionStore
 from django.core import signing
+from sso.cache.local import LocalCache
 from sso.oauth2.crypt import loads_jwt, make_jwt
 from sso.sessions.backends import map_keys, inv_key_map, key_map
 from sso.utils.url import get_base_url
 
 logger = logging.getLogger(__name__)
 
+# verified session cookie payloads indexed by the cookie value
+_payloads = LocalCache(max_size=settings.SSO_SESSION_PAYLOAD_CACHE_SIZE, timeout=settings.SSO_SESSION_PAYLOAD_CACHE_TIMEOUT)
+
+
+def loads_session_jwt(session_key):
+    """
+    decode the session cookie, an unchanged cookie is verified only once per process
+    and SSO_SESSION_PAYLOAD_CACHE_TIMEOUT seconds
+    """
+    if not settings.SSO_SESSION_PAYLOAD_CACHE_ENABLED:
+        return loads_jwt(session_key, algorithm="HS256")
+
+    payload = _payloads.get(session_key)
+    if payload is None or payload['exp'] <= time.time():
+        payload = loads_jwt(session_key, algorithm="HS256")
+        _payloads.set(session_key, payload, min(_payloads.timeout, payload['exp'] - int(time.time())))
+    return copy.deepcopy(payload)
+
 
 class SessionStore(SignedCookiesSessionStore):
+    _payload = None
 
     def load(self):
         """
@@ -21,7 +43,8 @@ class SessionStore(SignedCookiesSessionStore):
         raises BadSignature if signature fails.
         """
         try:
-            parsed = loads_jwt(self.session_key, algorithm="HS256")
+            parsed = loads_session_jwt(self.session_key)
+            self._payload = copy.deepcopy(parsed)
             parsed = map_keys(parsed, inv_key_map)
             if "_auth_user_backend" not in parsed:
                 parsed["_auth_user_backend"] = "sso.auth.backends.EmailBackend"
@@ -44,4 +67,7 @@ class SessionStore(SignedCookiesSessionStore):
             del session_cache["_auth_user_backend"]
         session_cache["iss"] = get_base_url()
 
+        if self.session_key and session_cache == self._payload:
+            # unchanged data, the JWT would be the same
+            return self.session_key
         return make_jwt(session_cache, max_age=settings.SESSION_COOKIE_AGE, algorithm="HS256")
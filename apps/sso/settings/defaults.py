@@ -77,8 +77,37 @@ SSO_USER_RECOVERY_PERIOD_MINUTES = 60 * 24 * 30  # 30 days
 SSO_ACCESS_TOKEN_AGE = 60 * 60  # 1 hour
 SSO_REFRESH_TOKEN_AGE = int(os.getenv('SSO_REFRESH_TOKEN_AGE', 60 * 60 * 24 * 90))  # default 90 days
 SSO_ID_TOKEN_AGE = 60 * 5  # 5 minutes
+# per process cache of verified access tokens for the API
+SSO_ACCESS_TOKEN_CACHE_ENABLED = os.getenv("SSO_ACCESS_TOKEN_CACHE_ENABLED", 'False').lower() in ('true', '1', 't')
+SSO_ACCESS_TOKEN_CACHE_SIZE = int(os.getenv('SSO_ACCESS_TOKEN_CACHE_SIZE', '1024'))
+SSO_ACCESS_TOKEN_CACHE_TIMEOUT = int(os.getenv('SSO_ACCESS_TOKEN_CACHE_TIMEOUT', '300'))
+# per process registry of the OAuth2 clients
+SSO_CLIENT_REGISTRY_ENABLED = os.getenv("SSO_CLIENT_REGISTRY_ENABLED", 'True').lower() in ('true', '1', 't')
+SSO_CLIENT_REGISTRY_CHECK_INTERVAL = 5  # seconds between the checks for client changes in other processes
+SSO_CLIENT_REGISTRY_TIMEOUT = 60 * 5  # reload the clients at least every 5 minutes
+SSO_CLIENT_URI_INDEX_TIMEOUT = 60 * 60  # rebuild the allowed hosts and post logout redirect uris at least every hour
+# store BearerToken rows only for access tokens with a refresh token, the access tokens are self-contained JWTs
+SSO_STATELESS_ACCESS_TOKENS = os.getenv("SSO_STATELESS_ACCESS_TOKENS", 'False').lower() in ('true', '1', 't')
+# write the BearerToken rows without refresh token and the last_login of client_credentials users in batches
+SSO_TOKEN_WRITE_BEHIND_ENABLED = os.getenv("SSO_TOKEN_WRITE_BEHIND_ENABLED", 'False').lower() in ('true', '1', 't')
+SSO_TOKEN_WRITE_BEHIND_MAX_SIZE = int(os.getenv('SSO_TOKEN_WRITE_BEHIND_MAX_SIZE', '100'))
+SSO_TOKEN_WRITE_BEHIND_INTERVAL = int(os.getenv('SSO_TOKEN_WRITE_BEHIND_INTERVAL', '5'))  # seconds
 SSO_LOGIN_MAX_AGE = int(os.getenv('SSO_LOGIN_MAX_AGE', '300'))
 SSO_SIGNING_KEYS_VALIDITY_PERIOD = 60 * 60 * 24 * 30  # 30 days
+# a new key is published in the jwks and becomes the default signing key with the next rotation. The clients
+# and CDNs may cache the jwks for max-age seconds, which must be much shorter than the time between two rotations.
+SSO_JWKS_MAX_AGE = int(os.getenv('SSO_JWKS_MAX_AGE', str(60 * 60)))
+# allow the api lists to be streamed as NDJSON without pagination (?stream=1), i.e. all items in one request
+SSO_API_STREAMING_ENABLED = os.getenv("SSO_API_STREAMING_ENABLED", 'False').lower() in ('true', '1', 't')
+# json encoder of the api responses, 'json' or 'orjson' (faster, needs the orjson package, writes compact json
+# without spaces after the separators)
+SSO_JSON_ENCODER = os.getenv('SSO_JSON_ENCODER', 'json')
+# cache timeout of the application roles and permissions of a user
+SSO_EFFECTIVE_ROLES_CACHE_TIMEOUT = 60 * 60
+SSO_DECODING_KEY_CACHE_SIZE = 32  # parsed decoding keys per worker process
+SSO_DECODING_KEY_CACHE_TIMEOUT = 60 * 60  # 1 hour
+SSO_ENCODING_KEY_CACHE_TIMEOUT = 60 * 5  # 5 minutes, after a key rotation the default signing key is reloaded
+SSO_SIGNING_KEYS_CHECK_INTERVAL = 5  # seconds between the checks for key rotations of other processes
 SSO_USER_MAX_PICTURE_SIZE = int(os.getenv('SSO_USER_MAX_PICTURE_SIZE', '1048576'))
 SSO_USER_PICTURE_WIDTH = 550
 SSO_USER_PICTURE_HEIGHT = 550
@@ -96,6 +125,10 @@ SSO_RECAPTCHA_EXPIRATION_TIME = 120
 SSO_RECAPTCHA_ENABLED = os.getenv("SSO_RECAPTCHA_ENABLED", 'True').lower() in ('true', '1', 't')
 SSO_THROTTLING_DURATION = int(os.getenv('SSO_THROTTLING_DURATION', '30'))
 SSO_THROTTLING_MAX_CALLS = int(os.getenv('SSO_THROTTLING_MAX_CALLS', '5'))
+# addresses or networks of the reverse proxies, whose X-Forwarded-For header is used for the throttling keys
+SSO_THROTTLING_TRUSTED_PROXIES = [proxy for proxy in os.getenv('SSO_THROTTLING_TRUSTED_PROXIES', '').split(',') if proxy]
+SSO_TOKEN_THROTTLING_DURATION = int(os.getenv('SSO_TOKEN_THROTTLING_DURATION', '60'))
+SSO_TOKEN_THROTTLING_MAX_CALLS = int(os.getenv('SSO_TOKEN_THROTTLING_MAX_CALLS', '600'))
 SSO_DEFAULT_THEME = os.getenv("SSO_DEFAULT_THEME", 'auto')
 SSO_ENABLE_PLAUSIBLE = os.getenv('SSO_ENABLE_PLAUSIBLE', 'False').lower() in ('true', '1', 't')
 # Celery settings see https://www.cloudamqp.com/docs/celery.html
@@ -325,6 +358,22 @@ SESSION_COOKIE_AGE = int(os.getenv("SESSION_COOKIE_AGE", f'{60 * 60 * 24 * 7 * 2
 SESSION_EXPIRE_AT_BROWSER_CLOSE = True
 SESSION_SAVE_EVERY_REQUEST = False
 SESSION_ENGINE = 'sso.sessions.backends.jwt_cookies'
+# per process cache of the verified session cookie payloads
+SSO_SESSION_PAYLOAD_CACHE_ENABLED = os.getenv("SSO_SESSION_PAYLOAD_CACHE_ENABLED", 'True').lower() in ('true', '1', 't')
+SSO_SESSION_PAYLOAD_CACHE_SIZE = int(os.getenv('SSO_SESSION_PAYLOAD_CACHE_SIZE', '1024'))
+SSO_SESSION_PAYLOAD_CACHE_TIMEOUT = int(os.getenv('SSO_SESSION_PAYLOAD_CACHE_TIMEOUT', '300'))
+# in-process cache in front of memcached (sso.cache.backends.SSOCache), 0 disables the L1 cache
+SSO_CACHE_L1_SIZE = int(os.getenv('SSO_CACHE_L1_SIZE', '1024'))
+SSO_CACHE_L1_TIMEOUT = int(os.getenv('SSO_CACHE_L1_TIMEOUT', '5'))
+SSO_CACHE_L1_NEGATIVE_TIMEOUT = int(os.getenv('SSO_CACHE_L1_NEGATIVE_TIMEOUT', '1'))
+# only keys with these prefixes use the L1 cache, by default the template fragments, the signing keys and the
+# allowed hosts and post logout redirect uris
+SSO_CACHE_L1_KEY_PREFIXES = os.getenv(
+    'SSO_CACHE_L1_KEY_PREFIXES',
+    'template.cache.,latest_encoding_key_and_kid.,signing_certs,public_keys,default_signing_cert,jwks,client_uri_index'
+).split(',')
+SSO_CACHE_CIRCUIT_BREAKER_THRESHOLD = int(os.getenv('SSO_CACHE_CIRCUIT_BREAKER_THRESHOLD', '5'))
+SSO_CACHE_CIRCUIT_BREAKER_TIMEOUT = int(os.getenv('SSO_CACHE_CIRCUIT_BREAKER_TIMEOUT', '30'))
 CSRF_COOKIE_HTTPONLY = os.getenv('CSRF_COOKIE_HTTPONLY', 'True').lower() in ('true', '1', 't')
 
 if not (RUNNING_DEVSERVER or RUNNING_TEST):
@@ -1,47 +1,78 @@
+from collections import namedtuple
+from functools import lru_cache
+
 from django.apps import apps
 from django.conf import settings
-from django.urls import reverse
+from django.urls import reverse, get_script_prefix
 from django.utils.translation import gettext_lazy as _
 
-
-def sidebar(request):
-    def set_active_item(menu):
-        # iterate menu and find the active menu item
-        # if the item is inside a submenu, the submenu  is expanded and marked active
-        for item in menu:
-            if 'submenu' in item:
-                if set_active_item(item['submenu']):
-                    item['active'] = True
-                    item['expanded'] = True
-                    return True
-            elif request.resolver_match.view_name in item['view_names']:
-                item['active'] = True
-                return True
-
+# the permissions and settings which determine the items of the sidebar
+SidebarFlags = namedtuple('SidebarFlags', [
+    'is_staff', 'view_application', 'add_application', 'email_list', 'email_create', 'country_list', 'region_list',
+    'country_create', 'region_create', 'org_create', 'registration_list', 'user_list', 'roles_list', 'change_user',
+    'user_create', 'my_emails', 'my_security', 'script_prefix'])
+
+
+def get_sidebar_flags(user, no_reg):
+    return SidebarFlags(
+        is_staff=user.is_staff,
+        view_application=user.has_perm('accounts.view_application'),
+        add_application=user.has_perm('accounts.add_application'),
+        email_list=settings.SSO_ORGANISATION_EMAIL_MANAGEMENT and user.is_groupemail_admin,
+        email_create=settings.SSO_ORGANISATION_EMAIL_MANAGEMENT and user.has_perm('emails.add_groupemail'),
+        country_list=settings.SSO_COUNTRY_MANAGEMENT,
+        region_list=settings.SSO_REGION_MANAGEMENT and user.has_perm('organisations.change_adminregion'),
+        country_create=bool(settings.SSO_COUNTRY_MANAGEMENT and user.has_perm('organisations.add_organisationcountry')
+                            and user.get_administrable_associations()),
+        region_create=settings.SSO_REGION_MANAGEMENT and user.has_perm('organisations.add_adminregion'),
+        org_create=user.has_perm('organisations.add_organisation'),
+        registration_list=(settings.REGISTRATION.get('OPEN', True) or no_reg > 0) and user.has_perm('registration.change_registrationprofile'),
+        user_list=user.is_user_admin,
+        roles_list=user.is_app_user_admin(),
+        change_user=user.has_perm('accounts.change_user'),
+        user_create=user.has_perms(['accounts.change_user', 'accounts.add_user']),
+        my_emails=not user.is_center,
+        my_security=user.is_mfa_enabled,
+        script_prefix=get_script_prefix(),
+    )
+
+
+@lru_cache(maxsize=128)
+def build_sidebar(flags):
+    """
+    returns the menu for the flags with the reversed urls, an index from view name to the position of the item
+    and an index from badge name to the position of the item. The result is shared by all requests with the
+    same flags and must not be changed.
+    """
     def reverse_url(menu):
         # reverse the 1. item in from view_names and add an 'url' attribute for creating
-        # the link in the menu. Could also be done in the view
+        # the link in the menu.
         for item in menu:
             if 'submenu' in item:
                 reverse_url(item['submenu'])
             else:
                 item['url'] = reverse(item['view_names'][0])
 
+    def index_items(menu, path=()):
+        for i, item in enumerate(menu):
+            if 'submenu' in item:
+                index_items(item['submenu'], path + (i,))
+            else:
+                for view_name in item['view_names']:
+                    view_name_index.setdefault(view_name, path + (i,))
+                if 'badge_name' in item:
+                    badge_index[item['badge_name']] = path + (i,)
+
     def append_submenu(menu):
         if len(menu['submenu']) == 1:
             sidebar_nav.append(menu['submenu'][0])
         elif len(menu['submenu']) > 1:
             sidebar_nav.append(menu)
 
-    user = request.user
     # Main menu
     sidebar_nav = []
 
-    # for 404 response request.resolver_match is None
-    if not user.is_authenticated or request.resolver_match is None:
-        return sidebar_nav
-
-    if user.is_staff:
+    if flags.is_staff:
         sidebar_nav.append({'view_names': ['admin:index'], 'icon': 'wrench', 'title': _('Administration')})
 
     # Application submenu
@@ -51,9 +82,9 @@ def sidebar(request):
     application_create = {'view_names': ['accounts:application_add'], 'icon': 'plus', 'title': _('Add Application')}
 
     application_submenu = {'name': 'applications', 'icon': 'grid-3x3-gap-fill', 'title': _('Applications'), 'submenu': []}
-    if user.has_perm('accounts.view_application'):
+    if flags.view_application:
         application_submenu['submenu'].append(application_list)
-    if user.has_perm('accounts.add_application'):
+    if flags.add_application:
         application_submenu['submenu'].append(application_create)
 
     # E-Mail submenu
@@ -64,9 +95,9 @@ def sidebar(request):
     email_create = {'view_names': ['emails:groupemail_create'], 'icon': 'plus', 'title': _('Add Email')}
 
     email_submenu = {'name': 'emails', 'icon': 'envelope', 'title': _('E-Mails'), 'submenu': []}
-    if settings.SSO_ORGANISATION_EMAIL_MANAGEMENT and user.is_groupemail_admin:
+    if flags.email_list:
         email_submenu['submenu'].append(email_list)
-    if settings.SSO_ORGANISATION_EMAIL_MANAGEMENT and user.has_perm('emails.add_groupemail'):
+    if flags.email_create:
         email_submenu['submenu'].append(email_create)
 
     # Organisations submenu
@@ -82,51 +113,45 @@ def sidebar(request):
     region_create = {'view_names': ['organisations:adminregion_create'], 'icon': 'plus', 'title': _('Add Region')}
     org_create = {'view_names': ['organisations:organisation_create'], 'icon': 'plus', 'title': _('Add Organisation')}
     my_org = {'view_names': ['organisations:my_organisation_detail'], 'icon': 'house', 'title': _('My Organisation')}
-    orgs_submenu = {'name': 'organisations', 'icon': 'house', 'title': _('Organisations'), 'submenu': []}
-    if user.organisations.exists:
-        orgs_submenu['submenu'].append(my_org)
-    if settings.SSO_COUNTRY_MANAGEMENT and user.is_authenticated:
+    orgs_submenu = {'name': 'organisations', 'icon': 'house', 'title': _('Organisations'), 'submenu': [my_org]}
+    if flags.country_list:
         orgs_submenu['submenu'].append(country_list)
-    if settings.SSO_REGION_MANAGEMENT and user.has_perm('organisations.change_adminregion'):
+    if flags.region_list:
         orgs_submenu['submenu'].append(region_list)
-    if user.is_authenticated:
-        orgs_submenu['submenu'].append(org_list)
-    if settings.SSO_COUNTRY_MANAGEMENT and user.has_perm('organisations.add_organisationcountry') and user.get_administrable_associations():
+    orgs_submenu['submenu'].append(org_list)
+    if flags.country_create:
         orgs_submenu['submenu'].append(country_create)
-    if settings.SSO_REGION_MANAGEMENT and user.has_perm('organisations.add_adminregion'):
+    if flags.region_create:
         orgs_submenu['submenu'].append(region_create)
-    if user.has_perm('organisations.add_organisation'):
+    if flags.org_create:
         orgs_submenu['submenu'].append(org_create)
 
     # Accounts submenu
     ###################
-    no_reg = user.get_count_of_registrationprofiles()
-    no_orgchg = user.get_count_of_organisationchanges()
-    no_ext = user.get_count_of_extend_access()
     registration_list = {'view_names': ['registration:user_registration_list', 'registration:update_user_registration',
                                         'registration:delete_user_registration', 'registration:process_user_registration'],
-                         'icon': 'people', 'title': _('Registrations'), 'badge': no_reg}
+                         'icon': 'people', 'title': _('Registrations'), 'badge_name': 'registrations'}
     user_list = {'view_names': ['accounts:user_list', 'accounts:update_user', 'accounts:delete_user', 'accounts:organisation_detail',
                                 'accounts:organisation_picture_update'], 'icon': 'people', 'title': _('Users')}
     roles_list = {'view_names': ['accounts:app_admin_user_list', 'accounts:app_admin_update_user'], 'icon': 'people', 'title': _('Roles')}
     org_changes_list = {'view_names': ['accounts:organisationchange_list', 'accounts:organisationchange_accept'], 'icon': 'arrow-left-right',
-                        'title': _('Organisation Changes'), 'badge': no_orgchg}
+                        'title': _('Organisation Changes'), 'badge_name': 'organisation_changes'}
     access_req_list = {'view_names': ['access_requests:extend_access_list', 'access_requests:extend_access_accept', 'access_requests:process_access_request'],
-                       'icon': 'folder-plus', 'title': _('Access Requests'), 'badge': no_ext}
+                       'icon': 'folder-plus', 'title': _('Access Requests'), 'badge_name': 'access_requests'}
     user_create = {'view_names': ['accounts:add_user'], 'icon': 'person-plus', 'title': _('Add User')}
 
     accounts_submenu = {'name': 'accounts', 'icon': 'people', 'title': _('Accounts'), 'submenu': []}
-    if (settings.REGISTRATION.get('OPEN', True) or no_reg > 0) and user.has_perm('registration.change_registrationprofile'):
+    if flags.registration_list:
         accounts_submenu['submenu'].append(registration_list)
-    if user.is_user_admin:
+    if flags.user_list:
         accounts_submenu['submenu'].append(user_list)
-    if user.is_app_user_admin():
+    if flags.roles_list:
         accounts_submenu['submenu'].append(roles_list)
-    if user.has_perm('accounts.change_user'):
+    if flags.change_user:
         accounts_submenu['submenu'].append(org_changes_list)
-    if apps.is_installed('sso.access_requests') and user.has_perm('accounts.change_user'):
+    if apps.is_installed('sso.access_requests') and flags.change_user:
         accounts_submenu['submenu'].append(access_req_list)
-    if user.has_perms(['accounts.change_user', 'accounts.add_user']):
+    if flags.user_create:
         accounts_submenu['submenu'].append(user_create)
 
     # my account items
@@ -140,19 +165,61 @@ def sidebar(request):
 
     my_data_submenu = {'name': 'my-data', 'icon': 'person', 'title': _('Personal Data'), 'submenu': [my_account, my_password]}
 
-    if not user.is_center:
+    if flags.my_emails:
         my_data_submenu['submenu'].append(my_emails)
-    if user.is_mfa_enabled:
+    if flags.my_security:
         my_data_submenu['submenu'].append(my_security)
 
-    if user.has_perm('accounts.view_application'):
+    if flags.view_application:
         append_submenu(application_submenu)
     append_submenu(email_submenu)
     append_submenu(orgs_submenu)
     append_submenu(accounts_submenu)
     append_submenu(my_data_submenu)
 
-    set_active_item(sidebar_nav)
     reverse_url(sidebar_nav)
+    view_name_index = {}
+    badge_index = {}
+    index_items(sidebar_nav)
+    return sidebar_nav, view_name_index, badge_index
+
+
+def update_item(menu, path, attrs, parent_attrs=None):
+    """
+    returns a copy of the menu with the item at path updated with attrs and the submenus on the path
+    updated with parent_attrs. Only the items on the path are copied.
+    """
+    menu = list(menu)
+    item = dict(menu[path[0]])
+    if len(path) > 1:
+        item.update(parent_attrs or {})
+        item['submenu'] = update_item(item['submenu'], path[1:], attrs, parent_attrs)
+    else:
+        item.update(attrs)
+    menu[path[0]] = item
+    return menu
 
+
+def sidebar(request):
+    user = request.user
+
+    # for 404 response request.resolver_match is None
+    if not user.is_authenticated or request.resolver_match is None:
+        return []
+
+    badges = {
+        'registrations': user.get_count_of_registrationprofiles(),
+        'organisation_changes': user.get_count_of_organisationchanges(),
+        'access_requests': user.get_count_of_extend_access(),
+    }
+    sidebar_nav, view_name_index, badge_index = build_sidebar(get_sidebar_flags(user, badges['registrations']))
+
+    for badge_name, path in badge_index.items():
+        if badges[badge_name]:
+            sidebar_nav = update_item(sidebar_nav, path, {'badge': badges[badge_name]})
+
+    # mark the active menu item, if the item is inside a submenu, the submenu is expanded and marked active
+    path = view_name_index.get(request.resolver_match.view_name)
+    if path is not None:
+        sidebar_nav = update_item(sidebar_nav, path, {'active': True}, {'active': True, 'expanded': True})
     return sidebar_nav
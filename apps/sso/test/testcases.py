@@ -0,0 +1,31 @@
+from django.core.cache import cache
+from django.test import TestCase, TransactionTestCase
+
+
+def clear_caches():
+    """
+    The shared cache and the per process caches are not reset by the rollback of the test database,
+    so that entries of a previous test would be used.
+    """
+    from sso.oauth2 import keys
+    from sso.oauth2.registry import client_registry
+    from sso.oauth2.token_cache import access_token_cache
+
+    cache.clear()
+    keys.clear_cache()
+    client_registry.clear()
+    access_token_cache.clear()
+
+
+class ClearCachesMixin:
+    def setUp(self):
+        clear_caches()
+        super().setUp()
+
+
+class SSOTestCase(ClearCachesMixin, TestCase):
+    pass
+
+
+class SSOTransactionTestCase(ClearCachesMixin, TransactionTestCase):
+    pass
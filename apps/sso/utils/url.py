@@ -1,15 +1,22 @@
 import logging
+import threading
 import uuid
-from urllib.parse import urlsplit, urlunsplit
+from urllib.parse import urlsplit, urlunsplit, urlparse, quote
 from django.conf import settings
+from django.core.signals import setting_changed
 from django.http import QueryDict
+from django.urls import reverse, get_script_prefix
 from django.utils.functional import lazy
-from django.utils.http import url_has_allowed_host_and_scheme
+from django.utils.http import RFC3986_SUBDELIMS, url_has_allowed_host_and_scheme
 from sso.utils.http import get_request_param
 
 logger = logging.getLogger(__name__)
 
 REDIRECT_URI_FIELD_NAME = 'redirect_uri'
+PROTOCOL_TO_PORT = {
+    'http': 80,
+    'https': 443,
+}
 
 
 class SSOUUIDConverter:
@@ -25,6 +32,19 @@ class SSOUUIDConverter:
         return str(value)
 
 
+def get_origin(url):
+    """
+    returns the (scheme, hostname, port) tuple of an url or None if the url has no http(s) origin
+    """
+    if not url:
+        return None
+    p = urlparse(url)
+    try:
+        return p.scheme, p.hostname, p.port or PROTOCOL_TO_PORT[p.scheme]
+    except (ValueError, KeyError):
+        return None
+
+
 def get_safe_redirect_uri(request, allowed_hosts, redirect_field_name=REDIRECT_URI_FIELD_NAME):
     # redirect_field_name may be an array of field names
     if isinstance(redirect_field_name, list):
@@ -91,6 +111,10 @@ def get_base_url(request=None):
     # import django.contrib.sites here, because we want to import this module in urls, which is loaded before the apps are initialized
     from django.contrib.sites.shortcuts import get_current_site
     if request:
+        # computed once per request
+        url = getattr(request, '_sso_base_url', None)
+        if url is not None:
+            return url
         domain = get_current_site(request).domain
         use_https = request.is_secure()
         url = '%s://%s' % ('https' if use_https else 'http', domain)
@@ -100,10 +124,52 @@ def get_base_url(request=None):
                              settings.SSO_USE_HTTPS, request.headers)
             if domain.lower().split(':')[0] != settings.SSO_DOMAIN.lower().split(':')[0]:
                 logger.error('Please check your SSO_DOMAIN setting. %s != %s', domain, settings.SSO_DOMAIN)
+        request._sso_base_url = url
         return url
     return base_url
 
 
+# url path templates with {kwarg} placeholders by view name, kwarg names and script prefix
+_url_templates = {}
+_url_templates_lock = threading.Lock()
+
+
+def get_url_template(view_name, *kwarg_names):
+    """
+    returns the path of the named url with {kwarg} placeholders, e.g. '/api/v2/users/{uuid}/'.
+    The url is resolved only once, the placeholders are replaced by values which match the
+    uuid, slug and str converters.
+    """
+    key = (view_name, kwarg_names, get_script_prefix())
+    template = _url_templates.get(key)
+    if template is None:
+        samples = {name: 'f0f0f0f0f0f0f0f0f0f0f0f0f0f0%04x' % i for i, name in enumerate(kwarg_names)}
+        template = reverse(view_name, kwargs=samples)
+        for name, sample in samples.items():
+            template = template.replace(sample, '{%s}' % name)
+        with _url_templates_lock:
+            _url_templates[key] = template
+    return template
+
+
+def reverse_template(view_name, **kwargs):
+    """
+    fast reverse for the urls in api serializers, only string interpolation after the 1. call
+    """
+    template = get_url_template(view_name, *sorted(kwargs))
+    # quoted like the path in django.urls.resolvers, so that the url is the same as from reverse
+    return template.format(**{name: quote(str(value), safe=RFC3986_SUBDELIMS + "/~:@") for name, value in kwargs.items()})
+
+
+def clear_url_templates(*, setting, **kwargs):
+    if setting == 'ROOT_URLCONF':
+        with _url_templates_lock:
+            _url_templates.clear()
+
+
+setting_changed.connect(clear_url_templates)
+
+
 def absolute_url(request, url):
     # import django.contrib.sites here, because we want to import this module in urls, which is loaded before the apps are initialized
     from django.contrib.sites.shortcuts import get_current_site
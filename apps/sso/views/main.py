@@ -1,3 +1,5 @@
+import hashlib
+import json
 from collections import OrderedDict
 
 from django.core.exceptions import FieldDoesNotExist
@@ -46,6 +48,14 @@ class ChangeList(object):
             del self.params[ERROR_FLAG]
         self.default_ordering = default_ordering
 
+    def get_cache_key(self, *args):
+        """
+        digest of the request params and args for the template fragment cache,
+        unlike hash() it is the same in all worker processes
+        """
+        data = json.dumps([self.params, args], sort_keys=True, default=str)
+        return hashlib.sha256(data.encode()).hexdigest()
+
     def get_query_string(self, new_params=None, remove=None):
         if new_params is None:
             new_params = {}
@@ -1,10 +1,9 @@
-import hashlib
 import logging
 import os
 from functools import wraps
 
-from django.core.cache import cache
 from django.http import HttpResponse
+from .limiters import SlidingWindowLimiter, remote_addr_key
 
 logger = logging.getLogger(__name__)
 
@@ -13,7 +12,7 @@ class HttpResponseTooManyRequests(HttpResponse):
     status_code = 403  # maybe 429 is better?
 
 
-def throttle(method='POST', duration=15, max_calls=1, response=None):
+def throttle(method='POST', duration=15, max_calls=1, response=None, key=remote_addr_key, limiter_class=SlidingWindowLimiter):
     """
     This decorator is based on Django snippet #1573 code that
     can be found at http://djangosnippets.org/snippets/1573/
@@ -32,6 +31,12 @@ def throttle(method='POST', duration=15, max_calls=1, response=None):
 
     Custom
 
+        @throttle(duration=60, max_calls=100, key=lambda request: request.POST.get('client_id', ''))
+        def my_view(request)
+            ""
+
+    key is a function which returns the key of the request, the default is the client address and
+    the path. limiter_class is the class of the rate limiter (see throttle.limiters).
     """
     def decorator(func):
         if response:
@@ -39,27 +44,19 @@ def throttle(method='POST', duration=15, max_calls=1, response=None):
                 raise TypeError("The `response` keyword argument must " +
                                 "be a either HttpResponse instance or " +
                                 "callable with `request` argument.    ")
+        limiter = limiter_class(duration=duration, max_calls=max_calls)
 
         @wraps(func)
         def inner(request, *args, **kwargs):
             if request.method == method and not os.environ.get('THROTTLING_DISABLED', 'False').lower() in ('true', '1', 't'):
-                remote_addr = request.META.get('HTTP_X_FORWARDED_FOR') or \
-                    request.META.get('REMOTE_ADDR')
-                path = request.get_full_path()
-                key = hashlib.md5('{addr}.{path}'.format(addr=remote_addr, path=path).encode('utf-8')).hexdigest()
-
-                called = cache.get(key, 0) + 1
-
-                if called > max_calls:
+                if not limiter.hit(key(request)):
                     if callable(response):
                         return response(request)
                     elif response:
                         return response
                     else:
-                        logger.warning('throttling client: %s:%s', remote_addr, path)
+                        logger.warning('throttling client: %s', key(request))
                         return HttpResponseTooManyRequests('Try slowing down a little.')
-
-                cache.set(key, called, duration)
             return func(request, *args, **kwargs)
         return inner
     return decorator
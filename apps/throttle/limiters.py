@@ -0,0 +1,188 @@
+import hashlib
+import ipaddress
+import logging
+import threading
+import time
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.cache import cache as default_cache
+
+logger = logging.getLogger(__name__)
+
+
+@lru_cache(maxsize=8)
+def _get_networks(proxies):
+    return tuple(ipaddress.ip_network(proxy.strip(), strict=False) for proxy in proxies)
+
+
+def _is_trusted_proxy(addr, networks):
+    try:
+        ip = ipaddress.ip_address(addr)
+    except ValueError:
+        return False
+    return any(ip in network for network in networks)
+
+
+def client_addr(request):
+    """
+    the REMOTE_ADDR, or if the request came from a proxy in SSO_THROTTLING_TRUSTED_PROXIES the right-most
+    address in X-Forwarded-For, which is not a trusted proxy. The other X-Forwarded-For addresses are set
+    by the client and are not used, so that the limit can not be bypassed by sending a different header.
+    """
+    addr = request.META.get('REMOTE_ADDR', '')
+    networks = _get_networks(tuple(getattr(settings, 'SSO_THROTTLING_TRUSTED_PROXIES', ())))
+    if networks and _is_trusted_proxy(addr, networks):
+        forwarded_addrs = [forwarded_addr.strip() for forwarded_addr in request.META.get('HTTP_X_FORWARDED_FOR', '').split(',')]
+        for forwarded_addr in reversed(forwarded_addrs):
+            if not forwarded_addr:
+                break
+            addr = forwarded_addr
+            if not _is_trusted_proxy(addr, networks):
+                break
+    return addr
+
+
+def remote_addr_key(request):
+    """
+    the client address and the path without the query string, so that the limit can not be
+    bypassed by varying query parameters
+    """
+    return '{addr}.{path}'.format(addr=client_addr(request), path=request.path)
+
+
+class LocalCounter:
+    """
+    Per process hit counter of the current and the previous window.
+
+    A process sees only a part of the requests, so the local counts are a lower bound
+    of the shared counts and a client which exceeds the limit locally can be rejected
+    without a cache round trip.
+    """
+
+    def __init__(self, max_keys=10000):
+        self.max_keys = max_keys
+        self._lock = threading.Lock()
+        self._window = None
+        self._counts = {}
+        self._previous_counts = {}
+
+    def incr(self, key, window):
+        with self._lock:
+            if window != self._window:
+                self._previous_counts = self._counts if self._window == window - 1 else {}
+                self._counts = {}
+                self._window = window
+            if key not in self._counts and len(self._counts) >= self.max_keys:
+                # bounded memory, forget the current window
+                self._counts = {}
+            count = self._counts.get(key, 0) + 1
+            self._counts[key] = count
+            return count, self._previous_counts.get(key, 0)
+
+    def decr(self, key, window):
+        with self._lock:
+            if window == self._window and key in self._counts:
+                self._counts[key] -= 1
+
+
+class SlidingWindowLimiter:
+    """
+    Rate limiter with atomic counters (add/incr) in the shared cache.
+
+    The number of calls is the count of the current window plus the count of the previous window
+    weighted with the part of the previous window which is inside the sliding window. Rejected
+    calls are not counted. If the cache is not available, the calls are allowed.
+    """
+    prefix = 'throttle'
+
+    def __init__(self, duration, max_calls, cache=None, local=True):
+        self.duration = duration
+        self.max_calls = max_calls
+        self.cache = default_cache if cache is None else cache
+        self.local_counter = LocalCounter() if local else None
+
+    def get_count(self, current, previous, elapsed):
+        return current + previous * (1 - elapsed)
+
+    def _make_key(self, key, window):
+        return '{prefix}.{key}.{window}'.format(
+            prefix=self.prefix, key=hashlib.md5(key.encode('utf-8')).hexdigest(), window=window)
+
+    def _incr(self, cache_key):
+        try:
+            return self.cache.incr(cache_key)
+        except ValueError:
+            pass
+        # the counter lives for the current and the next window
+        if self.cache.add(cache_key, 1, 2 * self.duration):
+            return 1
+        try:
+            # created by a concurrent request
+            return self.cache.incr(cache_key)
+        except ValueError:
+            logger.warning('throttling cache is not available')
+            return None
+
+    def _decr(self, cache_key):
+        try:
+            self.cache.decr(cache_key)
+        except ValueError:
+            pass
+
+    def hit(self, key):
+        """
+        count a call for key and return True if the call is allowed
+        """
+        if self.duration <= 0:
+            return True
+        window, elapsed = divmod(time.time() / self.duration, 1)
+        window = int(window)
+
+        if self.local_counter is not None:
+            current, previous = self.local_counter.incr(key, window)
+            if self.get_count(current, previous, elapsed) > self.max_calls:
+                self.local_counter.decr(key, window)
+                return False
+
+        cache_key = self._make_key(key, window)
+        current = self._incr(cache_key)
+        if current is None:
+            return True
+        previous = self.cache.get(self._make_key(key, window - 1), 0)
+        if self.get_count(current, previous, elapsed) > self.max_calls:
+            self._decr(cache_key)
+            if self.local_counter is not None:
+                self.local_counter.decr(key, window)
+            return False
+        return True
+
+
+class FixedWindowLimiter(SlidingWindowLimiter):
+    """
+    Rate limiter which counts the calls of the current window only, it needs one cache
+    round trip per allowed call.
+    """
+
+    def get_count(self, current, previous, elapsed):
+        return current
+
+    def hit(self, key):
+        if self.duration <= 0:
+            return True
+        window = int(time.time() // self.duration)
+
+        if self.local_counter is not None:
+            current, previous = self.local_counter.incr(key, window)
+            if current > self.max_calls:
+                self.local_counter.decr(key, window)
+                return False
+
+        cache_key = self._make_key(key, window)
+        current = self._incr(cache_key)
+        if current is not None and current > self.max_calls:
+            self._decr(cache_key)
+            if self.local_counter is not None:
+                self.local_counter.decr(key, window)
+            return False
+        return True
@@ -1,7 +1,16 @@
+import logging
+import threading
+import time
+from unittest import mock
+
 from django import test
+from django.core.cache import caches
 from django.http import HttpResponse
-from django.test import override_settings
+from django.test import RequestFactory, override_settings, tag
 from django.urls import reverse
+from throttle.limiters import SlidingWindowLimiter, FixedWindowLimiter, client_addr
+
+logger = logging.getLogger(__name__)
 
 
 @override_settings(ROOT_URLCONF='throttle.tests.urls')
@@ -59,6 +68,142 @@ class ThrottleTest(test.TestCase):
         self.assertEqual(200, self.request('test_duration').status_code)
         self.assertEqual(200, self.request('test_duration').status_code)
 
+    def test_forwarded_for(self):
+        """
+        Tests that the limit can not be bypassed with a different X-Forwarded-For header
+        """
+        self.assertEqual(200, self.request('test_forwarded_for', HTTP_X_FORWARDED_FOR='10.0.0.1').status_code)
+        self.assertEqual(403, self.request('test_forwarded_for', HTTP_X_FORWARDED_FOR='10.0.0.2').status_code)
+
+    def test_query_string(self):
+        """
+        Tests that the limit can not be bypassed with a different query string
+        """
+        url = reverse('test_query_string')
+        self.assertEqual(200, test.Client().post(url + '?a=1').status_code)
+        self.assertEqual(403, test.Client().post(url + '?a=2').status_code)
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'throttle-tests'}})
+class LimiterTest(test.SimpleTestCase):
+    """
+    Rate limiter test suite
+    """
+
+    def setUp(self):
+        self.cache = caches['default']
+        self.cache.clear()
+
+    def hit_concurrently(self, limiter, key, num_threads, calls_per_thread):
+        allowed = []
+        barrier = threading.Barrier(num_threads)
+
+        def worker():
+            barrier.wait()
+            for i in range(calls_per_thread):
+                if limiter.hit(key):
+                    allowed.append(1)
+
+        threads = [threading.Thread(target=worker) for i in range(num_threads)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return len(allowed)
+
+    def test_concurrent_hits(self):
+        """
+        Tests that concurrent calls are not undercounted
+        """
+        for limiter_class in [SlidingWindowLimiter, FixedWindowLimiter]:
+            for local in [True, False]:
+                self.cache.clear()
+                # a long window, so that the test does not run over a window border
+                limiter = limiter_class(duration=3600, max_calls=20, cache=self.cache, local=local)
+                self.assertEqual(20, self.hit_concurrently(limiter, 'concurrent', num_threads=10, calls_per_thread=10))
+
+    def test_shared_counter(self):
+        """
+        Tests that limiters of different processes share the counter in the cache
+        """
+        limiter1 = SlidingWindowLimiter(duration=3600, max_calls=3, cache=self.cache)
+        limiter2 = SlidingWindowLimiter(duration=3600, max_calls=3, cache=self.cache)
+        self.assertTrue(limiter1.hit('shared'))
+        self.assertTrue(limiter2.hit('shared'))
+        self.assertTrue(limiter1.hit('shared'))
+        self.assertFalse(limiter2.hit('shared'))
+        self.assertFalse(limiter1.hit('shared'))
+        # other keys are not affected
+        self.assertTrue(limiter1.hit('other'))
+
+    def test_sliding_window(self):
+        """
+        Tests that the calls of the previous window are weighted with the part inside the sliding window
+        """
+        for local in [True, False]:
+            self.cache.clear()
+            limiter = SlidingWindowLimiter(duration=10, max_calls=10, cache=self.cache, local=local)
+            with mock.patch('throttle.limiters.time.time', return_value=1009.0):
+                for i in range(10):
+                    self.assertTrue(limiter.hit('sliding'))
+            # 10 * 0.8 calls of the previous window count
+            with mock.patch('throttle.limiters.time.time', return_value=1012.0):
+                self.assertTrue(limiter.hit('sliding'))
+                self.assertTrue(limiter.hit('sliding'))
+                self.assertFalse(limiter.hit('sliding'))
+            # the fixed window limiter allows a burst over the window border
+            limiter = FixedWindowLimiter(duration=10, max_calls=10, cache=self.cache, local=local)
+            with mock.patch('throttle.limiters.time.time', return_value=1021.0):
+                for i in range(10):
+                    self.assertTrue(limiter.hit('fixed'))
+
+    def test_rejected_call_without_cache(self):
+        """
+        Tests that the local pre-filter rejects calls without a cache round trip
+        """
+        limiter = SlidingWindowLimiter(duration=3600, max_calls=1, cache=self.cache)
+        self.assertTrue(limiter.hit('rejected'))
+        limiter.cache = mock.Mock(wraps=self.cache)
+        for i in range(10):
+            self.assertFalse(limiter.hit('rejected'))
+        self.assertEqual(limiter.cache.method_calls, [])
+
+    @tag('benchmark')
+    def test_benchmark(self):
+        """
+        Measures the calls which are rejected by the local pre-filter
+        """
+        limiter = SlidingWindowLimiter(duration=3600, max_calls=1, cache=self.cache)
+        self.assertTrue(limiter.hit('benchmark'))
+        num_calls = 10000
+        start = time.perf_counter()
+        for i in range(num_calls):
+            limiter.hit('benchmark')
+        elapsed = time.perf_counter() - start
+        logger.info("%d rejected calls: %.3f s", num_calls, elapsed)
+
+
+class ClientAddrTest(test.SimpleTestCase):
+    def get_client_addr(self, remote_addr, forwarded_for=None):
+        request = RequestFactory().get('/', REMOTE_ADDR=remote_addr)
+        if forwarded_for is not None:
+            request.META['HTTP_X_FORWARDED_FOR'] = forwarded_for
+        return client_addr(request)
+
+    @override_settings(SSO_THROTTLING_TRUSTED_PROXIES=[])
+    def test_without_proxies(self):
+        self.assertEqual('192.0.2.1', self.get_client_addr('192.0.2.1', '198.51.100.1'))
+
+    @override_settings(SSO_THROTTLING_TRUSTED_PROXIES=['10.0.0.0/8', '192.0.2.1'])
+    def test_trusted_proxies(self):
+        # the address which the trusted proxies added
+        self.assertEqual('198.51.100.1', self.get_client_addr('10.0.0.1', '198.51.100.1'))
+        self.assertEqual('198.51.100.1', self.get_client_addr('10.0.0.1', '203.0.113.1, 198.51.100.1, 192.0.2.1'))
+        # the header of other addresses is not used
+        self.assertEqual('198.51.100.2', self.get_client_addr('198.51.100.2', '203.0.113.1'))
+        self.assertEqual('10.0.0.1', self.get_client_addr('10.0.0.1'))
+        self.assertEqual('10.0.0.1', self.get_client_addr('10.0.0.1', ''))
+
 
 def index(request):
     """
@@ -6,6 +6,8 @@ from throttle.tests import index
 urlpatterns = [
     re_path(r'^$', throttle()(index), name='test_default'),
     re_path(r'^method/$', throttle(method='GET')(index), name='test_method'),
+    re_path(r'^query/$', throttle()(index), name='test_query_string'),
+    re_path(r'^forwarded/$', throttle()(index), name='test_forwarded_for'),
     re_path(r'^duration/$', throttle(duration=0)(index), name='test_duration'),
     re_path(r'^response/$', throttle(response=HttpResponse('Response', status=401))(index), name='test_response'),
     re_path(r'^response/callable/$', throttle(response=lambda request: HttpResponse('Request Response', status=401))(index),